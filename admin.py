@@ -2,21 +2,45 @@ import streamlit as st
 import json
 import os
 import io
-from datetime import datetime
+import asyncio
+import copy
+import textwrap
+from datetime import datetime, timezone
 import firebase_admin
 from firebase_admin import credentials, firestore
-from github import Github
-from google import genai
 from PIL import Image
+from image_tools import (
+    THUMBNAIL_SIZES, create_ai_variant, standardize_image, pad_to_square, compute_dhash,
+    build_hash_index, add_to_hash_index, find_similar, extract_colors, compare_colors
+)
+from compat_rules import (
+    CATEGORIES, ALLOWED_COLORS, build_rule_model, add_to_rule_model, suggest_senior_review, suggest_master_additions, compare_additions
+)
+from tracing import start_trace, finish_trace, trace_run, span, count_reads, count_writes, format_trace
 
 # --- KONFIGURATION ---
 KEY_FILE = "firestore_key.json"
 
+# Kurateret snapshot, som regelmotoren også lærer af (ud over garderoben i Firestore)
+RULE_TRAINING_SNAPSHOT = "wardrobe.json"
+
+# Batch-tilstand: hvor mange stykker tøj analyseres samtidig (hvert stykke er 3 Gemini-kald i træk)
+BATCH_CONCURRENCY = 4
+BATCH_IMAGE_TYPES = ["jpg", "png", "jpeg", "webp"]
+
+# Hvor mange bits (ud af 64) må et nyt billedes dHash afvige, før det ikke længere regnes som en mulig dublet
+DUPLICATE_MAX_DISTANCE = 4
+
+# Backup: dokumenter hentes fra Firestore i sider af denne størrelse (download-knappen holder selv hele filen i hukommelsen)
+EXPORT_PAGE_SIZE = 300
+
 # --- SETUP AF HEMMELIGHEDER (Secrets) ---
 try:
     # 1. GitHub Setup
     GITHUB_TOKEN = st.secrets["github_token"]
     GITHUB_REPO_NAME = st.secrets["github_repo"]
+    # Valgfrit: sti til et lokalt bare-repo, som bruges i stedet for GitHub (test)
+    LOCAL_IMAGE_REPO = st.secrets.get("local_image_repo")
     
     # 2. Google Gemini Setup
     GOOGLE_API_KEY = st.secrets["google_api_key"]
@@ -28,33 +52,6 @@ except KeyError as e:
     st.error(f"⚠️ Din secrets.toml mangler nøglen: {e}")
     st.stop()
 
-# --- HJÆLPEFUNKTIONER ---
-def standardize_image(image, target_size=(800, 800), bg_color=(255, 255, 255)):
-    """Skalerer og padder billedet til et standard kvadrat og returnerer WebP bytes."""
-    # Konverter til RGB for at fjerne evt. gennemsigtighed
-    if image.mode in ("RGBA", "P"):
-        img = image.convert("RGB")
-    else:
-        img = image.copy()
-    
-    # Bevar proportioner og skaler ned
-    img.thumbnail(target_size, Image.Resampling.LANCZOS)
-    
-    # Opret det nye firkantede lærred med baggrundsfarven
-    new_img = Image.new("RGB", target_size, bg_color)
-    
-    # Udregn positionen, så billedet centreres
-    paste_pos = (
-        (target_size[0] - img.width) // 2,
-        (target_size[1] - img.height) // 2
-    )
-    new_img.paste(img, paste_pos)
-    
-    # Gem som WebP bytes
-    img_byte_arr = io.BytesIO()
-    new_img.save(img_byte_arr, format='WEBP', quality=85)
-    return img_byte_arr.getvalue()
-
 # --- FIREBASE SETUP ---
 if not firebase_admin._apps:
     try:
@@ -145,68 +142,10 @@ Baseret på din viden om 'Modern Heritage', lav lister over hvilke farver der pa
 - Tone-i-Tone: Husk også at inkludere 'tone-i-tone' matches, men sørg for at anbefale kontrast i intensitet (f.eks. Mørk Top til Lyse Bukser).
 - Brug KUN farvenavnene fra listen ovenfor."""
 
-st.set_page_config(page_title="Garderobe Admin (AI & Cloud)", page_icon="🤖", layout="centered")
-
-if 'form_key' not in st.session_state:
-    st.session_state.form_key = 0
-if 'ai_result' not in st.session_state:
-    st.session_state.ai_result = ""
-
-st.title("🤖 Garderobe Admin")
-st.caption("AI-indeksering med Gemini Pro • Billeder på GitHub • Data i Firestore")
-
-if 'last_added' in st.session_state:
-    st.toast(st.session_state.last_added, icon="✅")
-    del st.session_state.last_added
-
-# 1. UPLOAD
-st.subheader("1. Vælg Billeder")
-uploaded_files = st.file_uploader(
-    "Upload billeder (Du kan vælge op til 2 - kun det første gemmes)", 
-    type=["jpg", "png", "jpeg", "webp"], 
-    key=f"uploader_{st.session_state.form_key}",
-    accept_multiple_files=True
-)
-
-if uploaded_files:
-    # Begræns til 2 billeder
-    files_to_process = uploaded_files[:2]
-    
-    # Hent og vis previews
-    cols = st.columns(len(files_to_process))
-    pil_images = []
-    
-    for i, file in enumerate(files_to_process):
-        image = Image.open(file)
-        pil_images.append(image)
-        with cols[i]:
-            caption = "Hovedbillede (Gemmes)" if i == 0 else "Ekstra (Kun til analyse)"
-            st.image(image, caption=caption, use_container_width=True)
-    
-    # 2. AI ANALYSE KNAP
-    st.subheader("2. Analyser med AI")
-    
-    if st.button("✨ Analyser (Junior, Senior & Master)", type="secondary"):
-        with st.spinner("Analyserer billedet over 3 omgange..."):
-            client = genai.Client(api_key=GOOGLE_API_KEY)
-            
-            try:
-                # --- KØRSEL 1: Junior (Base Analyse) ---
-                response1 = client.models.generate_content(
-                    model="gemini-2.5-pro",
-                    contents=pil_images, 
-                    config={
-                        "temperature": 0,
-                        "response_mime_type": "application/json",
-                        "response_schema": base_schema,
-                        "system_instruction": AI_PROMPT
-                    }
-                )
-                data1 = json.loads(response1.text)
-                json_str_1 = json.dumps(data1, ensure_ascii=False, indent=2)
-
-                # --- KØRSEL 2: Senior (Korrektur & Supplement) ---
-                review_prompt = f"""
+# --- AI ANALYSE (Junior, Senior & Master) ---
+def build_review_prompt(json_str_1):
+    """Prompten til Senior Stylisten, der læser korrektur på Juniorens JSON."""
+    return f"""
                 ANALYSE INSTRUKTION:
 
                 FOKUS PÅ HOVEDGENSTANDEN:
@@ -233,74 +172,61 @@ if uploaded_files:
                 4. Nye farver skal tilføjes i bunden af listerne.
                 5. EGEN KATEGORI: Du må ikke tilføje farver til tøjets egen kategori (den skal forblive helt tom).
                 """
+
+def merge_senior_review(data1, data2):
+    """Fletning 1 & 2: Seniorens nye farver lægges i bunden af Juniorens lister."""
+    merged_data = data1.copy()
+    item_category = merged_data.get("category")
+    comp1 = merged_data.get("compatibility", {})
+    comp2 = data2.get("compatibility", {})
+
+    for category in CATEGORIES:
+        # Sikkerhedsnet: Spring tøjets egen kategori over og gør den tom
+        if category == item_category:
+            comp1[category] = []
+            continue
+            
+        list1 = comp1.get(category, [])
+        list2 = comp2.get(category, [])
+        
+        final_list = list(list1)
+        existing = set(list1)
+        
+        for item in list2:
+            if item not in existing:
+                final_list.append(item)
+                existing.add(item)
                 
-                response2 = client.models.generate_content(
-                    model="gemini-2.5-pro",
-                    contents=pil_images,
-                    config={
-                        "temperature": 0.2,
-                        "response_mime_type": "application/json",
-                        "response_schema": base_schema,
-                        "system_instruction": review_prompt
-                    }
-                )
-                data2 = json.loads(response2.text)
-
-                # Fletning 1 & 2
-                merged_data = data1.copy()
-                item_category = merged_data.get("category")
-                comp1 = merged_data.get("compatibility", {})
-                comp2 = data2.get("compatibility", {})
-
-                for category in ["Top", "Bund", "Sko", "Strømper", "Overtøj"]:
-                    # Sikkerhedsnet: Spring tøjets egen kategori over og gør den tom
-                    if category == item_category:
-                        comp1[category] = []
-                        continue
-                        
-                    list1 = comp1.get(category, [])
-                    list2 = comp2.get(category, [])
-                    
-                    final_list = list(list1)
-                    existing = set(list1)
-                    
-                    for item in list2:
-                        if item not in existing:
-                            final_list.append(item)
-                            existing.add(item)
-                            
-                    comp1[category] = final_list
-                
-                merged_data["compatibility"] = comp1
-                json_str_2 = json.dumps(merged_data, ensure_ascii=False, indent=2)
-
-                # --- FORBEREDELSE TIL KØRSEL 3 ---
-                # 1. Udregn hvilke farver der IKKE er valgt endnu
-                allowed_colors = ["Sort", "Hvid", "Creme", "Grå", "Navy", "Blå", "Beige", "Brun", "Grøn", "Oliven", "Rød", "Bordeaux", "Accent"]
-                remaining_colors = {}
-                for category in ["Top", "Bund", "Sko", "Strømper", "Overtøj"]:
-                    # Tøjets egen kategori skal slet ikke med i Kørsel 3
-                    if category == item_category:
-                        continue 
-                        
-                    existing_colors = merged_data.get("compatibility", {}).get(category, [])
-                    remaining_colors[category] = [c for c in allowed_colors if c not in existing_colors]
-                
-                remaining_json_str = json.dumps(remaining_colors, ensure_ascii=False, indent=2)
-                
-                # 2. Udtræk kun basis-info om tøjet (så prompten bliver kortere)
-                item_info = {
-                    "type": merged_data.get("type"),
-                    "display_name": merged_data.get("display_name"),
-                    "primary_color": merged_data.get("primary_color"),
-                    "shade": merged_data.get("shade"),
-                    "secondary_color": merged_data.get("secondary_color"),
-                    "pattern": merged_data.get("pattern")
-                }
-                item_info_str = json.dumps(item_info, ensure_ascii=False, indent=2)
-
-                # --- KØRSEL 3: Master Stylist (Smart-Casual & Minimalisme) ---
-                master_prompt = f"""
+        comp1[category] = final_list
+    
+    merged_data["compatibility"] = comp1
+    return merged_data
+
+def get_remaining_colors(merged_data):
+    """Hvilke farver er IKKE valgt endnu pr. kategori (tøjets egen kategori er udeladt)."""
+    remaining_colors = {}
+    for category in CATEGORIES:
+        if category == merged_data.get("category"):
+            continue 
+            
+        existing_colors = merged_data.get("compatibility", {}).get(category, [])
+        remaining_colors[category] = [c for c in ALLOWED_COLORS if c not in existing_colors]
+    return remaining_colors
+
+def build_master_prompt(merged_data, remaining_colors):
+    """Prompten til Master Stylisten. Kun basis-info om tøjet sendes med, så prompten bliver kortere."""
+    remaining_json_str = json.dumps(remaining_colors, ensure_ascii=False, indent=2)
+    item_info = {
+        "type": merged_data.get("type"),
+        "display_name": merged_data.get("display_name"),
+        "primary_color": merged_data.get("primary_color"),
+        "shade": merged_data.get("shade"),
+        "secondary_color": merged_data.get("secondary_color"),
+        "pattern": merged_data.get("pattern")
+    }
+    item_info_str = json.dumps(item_info, ensure_ascii=False, indent=2)
+
+    return f"""
                 ROLLE:
                 Du agerer nu som 'Master Stylist'. Din personlige stil er centreret omkring "Maskulin smart-casual" og "Tidløs minimalisme".
                 Du kigger på et stykke tøj med et stilrent, råt og skarpt blik.
@@ -320,40 +246,448 @@ if uploaded_files:
                 3. Hvis ingen af de resterende farver passer godt ind, SKAL du efterlade listen tom.
                 """
 
-                response3 = client.models.generate_content(
-                    model="gemini-2.5-pro",
-                    contents=pil_images,
-                    config={
-                        "temperature": 0.2,
-                        "response_mime_type": "application/json",
-                        "response_schema": additions_schema,
-                        "system_instruction": master_prompt
-                    }
-                )
-                data3 = json.loads(response3.text)
-
-                # --- FLETNING 3 (Tilføj resterende valg nederst) ---
-                comp_final = merged_data.get("compatibility", {})
-                additions = data3.get("compatibility_additions", {})
-
-                for category in ["Top", "Bund", "Sko", "Strømper", "Overtøj"]:
-                    if category == item_category:
-                        comp_final[category] = []
-                        continue
-                        
-                    existing_list = comp_final.get(category, [])
-                    new_suggestions = additions.get(category, [])
-                    
-                    added_count = 0
-                    for item in new_suggestions:
-                        # Tjekker om farven reelt var på rest-listen og tvinger max 1
-                        if item in remaining_colors.get(category, []) and added_count < 1:
-                            existing_list.append(item)
-                            added_count += 1
-                            
-                    comp_final[category] = existing_list
-
-                merged_data["compatibility"] = comp_final
+def apply_master_additions(merged_data, data3, remaining_colors):
+    """Fletning 3: Højst 1 ny farve pr. kategori, og kun fra rest-listen."""
+    item_category = merged_data.get("category")
+    comp_final = merged_data.get("compatibility", {})
+    additions = data3.get("compatibility_additions", {})
+
+    for category in CATEGORIES:
+        if category == item_category:
+            comp_final[category] = []
+            continue
+            
+        existing_list = comp_final.get(category, [])
+        new_suggestions = additions.get(category, [])
+        
+        added_count = 0
+        for item in new_suggestions:
+            # Tjekker om farven reelt var på rest-listen og tvinger max 1
+            if item in remaining_colors.get(category, []) and added_count < 1:
+                existing_list.append(item)
+                added_count += 1
+                
+        comp_final[category] = existing_list
+
+    merged_data["compatibility"] = comp_final
+    return merged_data
+
+def load_wardrobe_items():
+    """Hele garderoben fra Firestore. Hentes kun, når load_wardrobe_state bygges."""
+    items = []
+    try:
+        with span("firestore: hent garderobe"):
+            for doc in db.collection("wardrobe").stream():
+                item = doc.to_dict()
+                item['firestore_id'] = doc.id
+                items.append(item)
+        count_reads("wardrobe", max(len(items), 1))
+    except Exception as e:
+        print(f"Kunne ikke hente garderoben: {e}")
+    return items
+
+def hash_summary(item):
+    """Det, dublet-tjekket viser om et stykke tøj i garderoben."""
+    return {
+        "name": item.get("analysis", {}).get("display_name", item.get("filename")),
+        "thumb": item.get("image_variants", {}).get("160") or item.get("image_path")
+    }
+
+@st.cache_resource(ttl=600)
+def load_wardrobe_state():
+    """Garderoben hentet én gang + det, der bygges af den: dublet-indekset og regelmotoren.
+    Gemt tøj lægges til i add_saved_garments, så en gemning ikke koster en ny hentning af hele garderoben."""
+    items = load_wardrobe_items()
+    return {
+        "ids": {item['firestore_id'] for item in items},
+        "hash_index": build_hash_index([(item.get("dhash"), hash_summary(item)) for item in items]),
+        "rule_model": build_rule_model(load_rule_training_analyses(items)),
+    }
+
+def load_hash_index():
+    """BK-træ over dHash af alt tøj i garderoben, så nye uploads kan tjekkes for dubletter."""
+    return load_wardrobe_state()["hash_index"]
+
+@st.cache_data(ttl=600)
+def get_wardrobe_count():
+    """Antal stykker tøj via en aggregering (1 læsning pr. 1000 dokumenter i stedet for at hente dem alle)."""
+    with span("firestore: tæl garderobe"):
+        result = db.collection("wardrobe").count(alias="count").get()
+    count = result[0][0].value
+    count_reads("wardrobe", max(-(-count // 1000), 1))
+    return count
+
+@trace_run("export")
+def export_wardrobe():
+    """Hele garderoben som JSON-bytes (samme format som før), bygget side for side fra Firestore.
+    Kaldes først, når der trykkes på download-knappen."""
+    chunks = [b"["]
+    query = db.collection("wardrobe").order_by("__name__").limit(EXPORT_PAGE_SIZE)
+    first = True
+    while True:
+        with span("firestore: hent side"):
+            page = list(query.stream())
+        count_reads("wardrobe", max(len(page), 1))
+        for doc in page:
+            item = doc.to_dict()
+            item['firestore_id'] = doc.id
+            # RETTELSE: Vi bruger default=str til at håndtere Datetime objekter
+            chunk = textwrap.indent(json.dumps(item, indent=2, ensure_ascii=False, default=str), "  ")
+            chunks.append((("\n" if first else ",\n") + chunk).encode("utf-8"))
+            first = False
+        if len(page) < EXPORT_PAGE_SIZE:
+            break
+        query = query.start_after(page[-1])
+    chunks.append(b"]" if first else b"\n]")
+    return b"".join(chunks)
+
+def add_saved_garments(saved_items):
+    """Efter en gemning: det nye tøj lægges ind i dublet-indekset og regelmotoren, uden at hente garderoben igen.
+    Er cachen netop bygget forfra (udløbet), er tøjet allerede med og springes over."""
+    state = load_wardrobe_state()
+    for item in saved_items:
+        if item['firestore_id'] in state["ids"]:
+            continue
+        state["ids"].add(item['firestore_id'])
+        if item.get("dhash"):
+            add_to_hash_index(state["hash_index"], item["dhash"], hash_summary(item))
+        if item.get("analysis"):
+            add_to_rule_model(state["rule_model"], item["analysis"])
+    # Antallet er en billig aggregering (1 læsning)
+    get_wardrobe_count.clear()
+
+def show_duplicates(duplicates):
+    """Viser de mulige dubletter fra garderoben med thumbnail og afstand."""
+    cols = st.columns(min(len(duplicates), 4))
+    for col, (distance, summary) in zip(cols, duplicates):
+        with col:
+            if summary["thumb"]:
+                st.image(summary["thumb"], use_container_width=True)
+            st.caption(f"{summary['name']} ({distance} bit fra)")
+
+@st.cache_data(max_entries=100, show_spinner=False)
+@span("lokal billedanalyse")
+def analyze_image_locally(image_bytes):
+    """dHash og farveforslag for et uploadet billede (cachet, så det ikke regnes om ved hver rerun)."""
+    standardized = pad_to_square(Image.open(io.BytesIO(image_bytes)))
+    return {"dhash": compute_dhash(standardized), "colors": extract_colors(standardized)}
+
+def build_prefill(colors):
+    """Tom analyse med farverne fra den lokale farve-analyse udfyldt, så man kan starte uden AI'en."""
+    return {
+        "category": "",
+        "display_name": "",
+        "type": "",
+        "primary_color": colors["primary_color"],
+        "shade": colors["shade"],
+        "secondary_color": colors["secondary_color"],
+        "pattern": "",
+        "compatibility": {category: [] for category in CATEGORIES}
+    }
+
+def apply_local_colors(json_text, colors):
+    """Overskriver farvefelterne i JSON-teksten med den lokale farve-analyses forslag."""
+    data = json.loads(json_text)
+    for field in ("primary_color", "shade", "secondary_color"):
+        data[field] = colors[field]
+    return json.dumps(data, indent=2, ensure_ascii=False)
+
+def format_colors(colors):
+    palette = " · ".join(f"{e['color']} {e['share']:.0%} (ΔE {e['delta_e']})" for e in colors["palette"])
+    return f"🎨 Lokal farve-analyse: **{colors['primary_color']}** ({colors['shade']}), sekundær: {colors['secondary_color']} — {palette}"
+
+def format_color_mismatches(mismatches):
+    """Kort tekst til UI'en: én linje pr. farvefelt, hvor AI'en og farve-analysen er uenige."""
+    return "\n".join(f"- **{field}**: AI siger {ai}, billedet siger {local}" for field, (ai, local) in mismatches.items())
+
+def load_rule_training_analyses(wardrobe_items):
+    """Alle kuraterede analyser, regelmotoren lærer af (Firestore + wardrobe.json, uden dubletter)."""
+    analyses = []
+    seen_files = set()
+    for item in wardrobe_items:
+        if item.get("analysis"):
+            analyses.append(item["analysis"])
+            seen_files.add(item.get("filename"))
+    if os.path.exists(RULE_TRAINING_SNAPSHOT):
+        with open(RULE_TRAINING_SNAPSHOT, "r", encoding="utf-8") as f:
+            for item in json.load(f):
+                if item.get("analysis") and item.get("filename") not in seen_files:
+                    analyses.append(item["analysis"])
+    return analyses
+
+def load_rule_model():
+    """Regelmotoren lært af garderoben og wardrobe.json."""
+    return load_wardrobe_state()["rule_model"]
+
+@span("regelmotor")
+def apply_rule_engine(rule_model, data1):
+    """Senior og Master udført af den lokale regelmotor i stedet for to ekstra Gemini-kald."""
+    merged_data = merge_senior_review(copy.deepcopy(data1), suggest_senior_review(rule_model, data1))
+    remaining_colors = get_remaining_colors(merged_data)
+    return apply_master_additions(merged_data, suggest_master_additions(rule_model, merged_data, remaining_colors), remaining_colors)
+
+def get_genai_client():
+    """Gemini-klienten. google.genai importeres først ved første analyse, ikke ved opstart.
+    Ny klient pr. analyse: den asynkrone forbindelsespulje er bundet til event-loopet fra asyncio.run()."""
+    from google import genai
+    return genai.Client(api_key=GOOGLE_API_KEY)
+
+def make_ai_part(image):
+    """Gemini får en lille, færdig-kodet WebP i stedet for det fulde originalbillede."""
+    from google.genai import types
+    return types.Part.from_bytes(data=create_ai_variant(image), mime_type="image/webp")
+
+async def run_senior_and_master_async(client, ai_parts, data1):
+    """Senior og Master som Gemini-kald (oprindelig pipeline)."""
+    data1 = copy.deepcopy(data1)
+    json_str_1 = json.dumps(data1, ensure_ascii=False, indent=2)
+
+    # --- KØRSEL 2: Senior (Korrektur & Supplement) ---
+    with span("gemini: senior"):
+        response2 = await client.aio.models.generate_content(
+            model="gemini-2.5-pro",
+            contents=ai_parts,
+            config={
+                "temperature": 0.2,
+                "response_mime_type": "application/json",
+                "response_schema": base_schema,
+                "system_instruction": build_review_prompt(json_str_1)
+            }
+        )
+    merged_data = merge_senior_review(data1, json.loads(response2.text))
+
+    # --- KØRSEL 3: Master Stylist (Smart-Casual & Minimalisme) ---
+    remaining_colors = get_remaining_colors(merged_data)
+    with span("gemini: master"):
+        response3 = await client.aio.models.generate_content(
+            model="gemini-2.5-pro",
+            contents=ai_parts,
+            config={
+                "temperature": 0.2,
+                "response_mime_type": "application/json",
+                "response_schema": additions_schema,
+                "system_instruction": build_master_prompt(merged_data, remaining_colors)
+            }
+        )
+    return apply_master_additions(merged_data, json.loads(response3.text), remaining_colors)
+
+async def analyze_garment_async(client, ai_parts, rule_model=None, validate=False):
+    """Junior analyserer billedet. Senior og Master er den lokale regelmotor (1 AI-kald) eller Gemini (3 kald).
+    Med validate køres begge, AI'ens resultat bruges, og uenighederne returneres. Returnerer (analyse, uenigheder)."""
+    # --- KØRSEL 1: Junior (Base Analyse) ---
+    with span("gemini: junior"):
+        response1 = await client.aio.models.generate_content(
+            model="gemini-2.5-pro",
+            contents=ai_parts, 
+            config={
+                "temperature": 0,
+                "response_mime_type": "application/json",
+                "response_schema": base_schema,
+                "system_instruction": AI_PROMPT
+            }
+        )
+    data1 = json.loads(response1.text)
+
+    if rule_model is None:
+        return await run_senior_and_master_async(client, ai_parts, data1), None
+    rule_data = apply_rule_engine(rule_model, data1)
+    if not validate:
+        return rule_data, None
+    ai_data = await run_senior_and_master_async(client, ai_parts, data1)
+    return ai_data, compare_additions(data1, ai_data, rule_data)
+
+def format_disagreements(disagreements):
+    """Kort tekst til UI'en: én linje pr. kategori, hvor regelmotoren og AI'en er uenige."""
+    lines = []
+    for target, diff in disagreements.items():
+        parts = []
+        if diff["only_ai"]:
+            parts.append(f"kun AI: {', '.join(diff['only_ai'])}")
+        if diff["only_rules"]:
+            parts.append(f"kun regler: {', '.join(diff['only_rules'])}")
+        lines.append(f"- **{target}**: {' · '.join(parts)}")
+    return "\n".join(lines)
+
+def log_rule_disagreements(data, disagreements):
+    """Gemmer uenighederne i Firestore, så regelmotoren kan valideres over tid."""
+    try:
+        db.collection("rule_engine_reports").add({
+            "display_name": data.get("display_name"),
+            "category": data.get("category"),
+            "primary_color": data.get("primary_color"),
+            "shade": data.get("shade"),
+            "type": data.get("type"),
+            "disagreements": disagreements,
+            "created_at": firestore.SERVER_TIMESTAMP
+        })
+        count_writes("rule_engine_reports")
+    except Exception as e:
+        print(f"Kunne ikke gemme regelmotor-rapport: {e}")
+
+async def analyze_batch_async(client, jobs, on_done, rule_model=None, validate=False):
+    """Analyserer mange stykker tøj samtidig, højst BATCH_CONCURRENCY ad gangen. on_done kaldes efter hvert job."""
+    semaphore = asyncio.Semaphore(BATCH_CONCURRENCY)
+
+    async def run(job):
+        async with semaphore:
+            try:
+                job["analysis"], job["disagreements"] = await analyze_garment_async(client, [job["ai_part"]], rule_model, validate)
+            except Exception as e:
+                job["error"] = str(e)
+        on_done(job)
+
+    await asyncio.gather(*(run(job) for job in jobs))
+
+# --- GEM I SKYEN (GitHub + Firestore) ---
+@st.cache_resource
+def get_github_repo():
+    """Ét delt repo-objekt. PyGithub importeres først ved første gemning, ikke ved opstart."""
+    from github import Github
+    return Github(GITHUB_TOKEN).get_repo(GITHUB_REPO_NAME)
+
+def get_raw_url(path_in_repo):
+    return f"https://raw.githubusercontent.com/{GITHUB_REPO_NAME}/main/{path_in_repo}"
+
+def get_upload_target():
+    """GitHub-repo'et, eller et lokalt bare-repo hvis 'local_image_repo' står i secrets (til test)."""
+    if LOCAL_IMAGE_REPO:
+        return {"kind": "local", "path": LOCAL_IMAGE_REPO}
+    return {"kind": "github", "repo": get_github_repo()}
+
+def prepare_garment(image, data, name_suffix=""):
+    """Standardiserer billedet og bygger filerne til GitHub og dokumentet til Firestore. Returnerer (filer, item_entry).
+    name_suffix holder filnavne unikke i en batch."""
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S") + name_suffix
+    filename = f"img_{timestamp}.webp"
+    path_in_repo = f"img/{filename}"
+    ai_path_in_repo = f"img/ai/img_{timestamp}.webp"
+    
+    # Standardiser billedet før upload (800x800, hvid baggrund, WebP + lille AI-variant)
+    with span("billede: standardiser"):
+        variants = standardize_image(image)
+    files = {path_in_repo: variants["main"], ai_path_in_repo: variants["ai"]}
+    
+    thumbnail_urls = {}
+    for size, folder in THUMBNAIL_SIZES.items():
+        thumb_path_in_repo = f"img/{folder}/{filename}"
+        files[thumb_path_in_repo] = variants["thumbnails"][size]
+        # Firestore kræver tekst-nøgler i maps
+        thumbnail_urls[str(size)] = get_raw_url(thumb_path_in_repo)
+    
+    item_entry = {
+        "filename": filename,
+        "image_path": get_raw_url(path_in_repo), 
+        "ai_image_path": get_raw_url(ai_path_in_repo),
+        "image_variants": thumbnail_urls,
+        "dhash": variants["dhash"],
+        "analysis": data,
+        "created_at": firestore.SERVER_TIMESTAMP,
+        "updated_at": firestore.SERVER_TIMESTAMP
+    }
+    return files, item_entry
+
+def save_garments(prepared, commit_message):
+    """Alle billeder som ét commit, derefter alle dokumenter i Firestore-batches. prepared er [(filer, item_entry)].
+    Returnerer de gemte dokumenter med firestore_id (tidsstempler sat lokalt) til add_saved_garments."""
+    from github_upload import commit_files
+    files = {}
+    for garment_files, _ in prepared:
+        files.update(garment_files)
+    with span("github: commit"):
+        commit_files(get_upload_target(), files, commit_message)
+    
+    # Firestore tillader højst 500 operationer pr. batch (plus versions-tælleren)
+    saved_items = []
+    now = datetime.now(timezone.utc)
+    for start in range(0, len(prepared), 400):
+        batch = db.batch()
+        for _, item_entry in prepared[start:start + 400]:
+            ref = db.collection("wardrobe").document()
+            batch.set(ref, item_entry)
+            local = {key: (now if value is firestore.SERVER_TIMESTAMP else value) for key, value in item_entry.items()}
+            saved_items.append(dict(local, firestore_id=ref.id))
+        # Tæl garderobens generation op i samme batch, så app.py henter det nye tøj ved næste rerun
+        batch.set(db.collection("stats").document("sync_versions"), {"wardrobe": firestore.Increment(1)}, merge=True)
+        with span("firestore: gem"):
+            batch.commit()
+        count_writes("wardrobe", len(prepared[start:start + 400]))
+        count_writes("stats")
+    return saved_items
+
+st.set_page_config(page_title="Garderobe Admin (AI & Cloud)", page_icon="🤖", layout="centered")
+
+# Tidsmåling af dette rerun (tracing.py). Et rerun, der sluttede med st.rerun(), st.stop() eller en fejl,
+# afsluttes her - med sluttid fra seneste span
+finish_trace(st.session_state.get("trace"), interrupted=True)
+st.session_state.trace = start_trace("admin")
+
+if 'form_key' not in st.session_state:
+    st.session_state.form_key = 0
+if 'ai_result' not in st.session_state:
+    st.session_state.ai_result = ""
+
+st.title("🤖 Garderobe Admin")
+st.caption("AI-indeksering med Gemini Pro • Billeder på GitHub • Data i Firestore")
+
+use_rule_engine = st.toggle("⚡ Lokal regelmotor i stedet for Senior & Master (1 AI-kald pr. stykke tøj)", value=True)
+validate_rules = use_rule_engine and st.checkbox("🔍 Valider regelmotoren mod Senior & Master (3 AI-kald, AI'ens resultat bruges)")
+rule_model = load_rule_model() if use_rule_engine else None
+
+if 'last_added' in st.session_state:
+    st.toast(st.session_state.last_added, icon="✅")
+    del st.session_state.last_added
+
+# 1. UPLOAD
+st.subheader("1. Vælg Billeder")
+uploaded_files = st.file_uploader(
+    "Upload billeder (Du kan vælge op til 2 - kun det første gemmes)", 
+    type=["jpg", "png", "jpeg", "webp"], 
+    key=f"uploader_{st.session_state.form_key}",
+    accept_multiple_files=True
+)
+
+if uploaded_files:
+    # Begræns til 2 billeder
+    files_to_process = uploaded_files[:2]
+    
+    # Hent og vis previews
+    cols = st.columns(len(files_to_process))
+    pil_images = []
+    
+    for i, file in enumerate(files_to_process):
+        image = Image.open(io.BytesIO(file.getvalue()))
+        pil_images.append(image)
+        with cols[i]:
+            caption = "Hovedbillede (Gemmes)" if i == 0 else "Ekstra (Kun til analyse)"
+            st.image(image, caption=caption, use_container_width=True)
+    
+    # 2. AI ANALYSE KNAP
+    st.subheader("2. Analyser med AI")
+    
+    # Lokal analyse af hovedbilledet: dHash til dublet-tjek og farveforslag (ingen AI-kald)
+    local_analysis = analyze_image_locally(files_to_process[0].getvalue())
+    st.caption(format_colors(local_analysis["colors"]))
+
+    # Tjek for dubletter, før der bruges AI-kald
+    duplicates = find_similar(load_hash_index(), local_analysis["dhash"], DUPLICATE_MAX_DISTANCE)
+    analyze_anyway = True
+    if duplicates:
+        st.warning("⚠️ Dette ligner noget, der allerede er i garderoben:")
+        show_duplicates(duplicates)
+        analyze_anyway = st.checkbox("Det er et andet stykke tøj - analyser alligevel")
+    
+    analyze_label = "✨ Analyser (Junior + regelmotor)" if use_rule_engine and not validate_rules else "✨ Analyser (Junior, Senior & Master)"
+    if st.button(analyze_label, type="secondary", disabled=not analyze_anyway):
+        with st.spinner("Analyserer billedet..."):
+            client = get_genai_client()
+            
+            try:
+                ai_parts = [make_ai_part(image) for image in pil_images]
+                merged_data, disagreements = asyncio.run(analyze_garment_async(client, ai_parts, rule_model, validate_rules))
+                if disagreements:
+                    log_rule_disagreements(merged_data, disagreements)
+                st.session_state.rule_report = disagreements
+                st.session_state.color_report = compare_colors(merged_data, local_analysis["colors"])
                 final_json_text = json.dumps(merged_data, indent=2, ensure_ascii=False)
 
                 # Opdater UI
@@ -370,13 +704,27 @@ if uploaded_files:
                 except:
                     pass
 
+    if st.session_state.get("rule_report"):
+        st.warning("**Regelmotoren er uenig med Senior & Master:**\n\n" + format_disagreements(st.session_state.rule_report))
+
     # 3. JSON RESULTAT (Kan redigeres)
     st.caption("Verificer data før du gemmer:")
     
     # --- RETTELSE: Undgå 'widget created with default value' advarsel ---
     widget_key = f"json_{st.session_state.form_key}"
     if widget_key not in st.session_state:
-        st.session_state[widget_key] = st.session_state.ai_result
+        # Uden AI-resultat starter feltet med farverne fra den lokale farve-analyse
+        st.session_state[widget_key] = st.session_state.ai_result or json.dumps(build_prefill(local_analysis["colors"]), indent=2, ensure_ascii=False)
+
+    if st.session_state.get("color_report"):
+        st.warning("**AI'ens farver passer ikke med billedet:**\n\n" + format_color_mismatches(st.session_state.color_report))
+        if st.button("🎨 Brug farverne fra billedet"):
+            try:
+                st.session_state[widget_key] = apply_local_colors(st.session_state[widget_key], local_analysis["colors"])
+                st.session_state.color_report = None
+                st.rerun()
+            except json.JSONDecodeError as e:
+                st.error(f"Fejl i JSON formatet: {e}")
 
     json_input = st.text_area(
         "JSON Data", 
@@ -392,74 +740,200 @@ if uploaded_files:
             try:
                 # A. Valider JSON
                 data = json.loads(json_input)
+                if data.get("category") not in CATEGORIES:
+                    st.error(f"⚠️ Vælg en kategori: {', '.join(CATEGORIES)}")
+                else:
+                    with st.spinner("Uploader til skyen..."):
+                        # B-D. Upload billeder til GITHUB og gem data i FIRESTORE (kun hovedbilledet gemmes)
+                        add_saved_garments(save_garments([prepare_garment(pil_images[0], data)], f"Tilføjet {data.get('display_name', 'nyt tøj')}"))
                 
-                # Hent hovedbilledet (det første)
-                main_file = files_to_process[0]
-                
-                with st.spinner("Uploader til skyen..."):
-                    # B. Upload billede til GITHUB
-                    g = Github(GITHUB_TOKEN)
-                    repo = g.get_repo(GITHUB_REPO_NAME)
-                    
-                    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                    filename = f"img_{timestamp}.webp"
-                    path_in_repo = f"img/{filename}"
-                    
-                    commit_message = f"Tilføjet {data.get('display_name', 'nyt tøj')}"
-                    
-                    # Standardiser billedet før upload (800x800, hvid baggrund, WebP)
-                    processed_image_bytes = standardize_image(pil_images[0])
-                    
-                    # Upload til GitHub
-                    repo.create_file(path_in_repo, commit_message, processed_image_bytes)
-                    
-                    # C. Konstruer RAW URL
-                    raw_url = f"https://raw.githubusercontent.com/{GITHUB_REPO_NAME}/main/{path_in_repo}"
-                
-                # D. Gem data i FIRESTORE
-                doc_ref = db.collection("wardrobe").document()
-                
-                item_entry = {
-                    "filename": filename,
-                    "image_path": raw_url, 
-                    "analysis": data,
-                    "created_at": firestore.SERVER_TIMESTAMP
-                }
-                
-                doc_ref.set(item_entry)
-                
-                # E. Reset
-                st.session_state.last_added = f"Gemt! {data.get('display_name', 'Tøjet')}"
-                st.session_state.form_key += 1 
-                st.session_state.ai_result = "" 
-                st.rerun()
+                    # E. Reset
+                    st.session_state.last_added = f"Gemt! {data.get('display_name', 'Tøjet')}"
+                    st.session_state.form_key += 1 
+                    st.session_state.ai_result = "" 
+                    st.session_state.rule_report = None
+                    st.session_state.color_report = None
+                    st.rerun()
                 
             except json.JSONDecodeError as e:
                 st.error(f"Fejl i JSON formatet: {e}")
             except Exception as e:
                 st.error(f"System fejl: {str(e)}")
 
+# --- BATCH: MANGE STYKKER TØJ ---
+st.divider()
+st.subheader("📦 Batch: Tilføj mange stykker tøj")
+st.caption("Ét billede pr. stykke tøj. Alle analyseres samtidig og lægges i en kø, hvor du godkender dem før de gemmes.")
+
+if 'batch_key' not in st.session_state:
+    st.session_state.batch_key = 0
+if 'review_queue' not in st.session_state:
+    st.session_state.review_queue = []
+if 'review_counter' not in st.session_state:
+    st.session_state.review_counter = 0
+
+batch_files = st.file_uploader(
+    "Upload billeder",
+    type=BATCH_IMAGE_TYPES,
+    key=f"batch_uploader_{st.session_state.batch_key}",
+    accept_multiple_files=True
+)
+batch_folder = st.text_input("...eller stien til en mappe med billeder", key=f"batch_folder_{st.session_state.batch_key}")
+
+batch_sources = [(file.name, file.getvalue()) for file in batch_files or []]
+if batch_folder.strip():
+    if os.path.isdir(batch_folder.strip()):
+        for name in sorted(os.listdir(batch_folder.strip())):
+            if name.lower().rsplit(".", 1)[-1] in BATCH_IMAGE_TYPES:
+                with open(os.path.join(batch_folder.strip(), name), "rb") as f:
+                    batch_sources.append((name, f.read()))
+    else:
+        st.warning("Mappen findes ikke.")
+
+include_duplicates = st.checkbox("Medtag billeder der ligner noget i garderoben (eller i samme batch)")
+
+if st.session_state.get("batch_skipped"):
+    st.info("Sprunget over som mulige dubletter:\n\n" + "\n".join(f"- {line}" for line in st.session_state.batch_skipped))
+
+if st.button(f"✨ Analyser {len(batch_sources)} stykker tøj", disabled=not batch_sources):
+    jobs = []
+    skipped = []
+    hash_index = load_hash_index()
+    batch_index = build_hash_index([])
+    for name, source in batch_sources:
+        try:
+            image = Image.open(io.BytesIO(source))
+            local_analysis = analyze_image_locally(source)
+            dhash = local_analysis["dhash"]
+            # Dublet-tjek mod garderoben og mod de billeder, der allerede er med i denne batch
+            duplicates = find_similar(hash_index, dhash, DUPLICATE_MAX_DISTANCE) + find_similar(batch_index, dhash, DUPLICATE_MAX_DISTANCE)
+            if duplicates and not include_duplicates:
+                distance, summary = min(duplicates, key=lambda m: m[0])
+                skipped.append(f"{name} ligner {summary['name']} ({distance} bit fra)")
+                continue
+            add_to_hash_index(batch_index, dhash, {"name": name, "thumb": None})
+            jobs.append({
+                "name": name, "source": source, "ai_part": make_ai_part(image), "colors": local_analysis["colors"],
+                "analysis": None, "disagreements": None, "error": None
+            })
+        except Exception as e:
+            st.error(f"Kunne ikke åbne {name}: {e}")
+    st.session_state.batch_skipped = skipped
+
+    progress = st.progress(0.0, text=f"Analyserer 0/{len(jobs)}...")
+    finished = []
+
+    def report_progress(job):
+        finished.append(job)
+        progress.progress(len(finished) / len(jobs), text=f"Analyseret {len(finished)}/{len(jobs)}: {job['name']}")
+
+    asyncio.run(analyze_batch_async(get_genai_client(), jobs, report_progress, rule_model, validate_rules))
+
+    # Læg resultaterne i review-køen (også fejlede, så de kan prøves igen eller droppes)
+    for job in jobs:
+        st.session_state.review_counter += 1
+        review_id = st.session_state.review_counter
+        st.session_state[f"review_json_{review_id}"] = json.dumps(job["analysis"], indent=2, ensure_ascii=False) if job["analysis"] else ""
+        if job["disagreements"]:
+            log_rule_disagreements(job["analysis"], job["disagreements"])
+        st.session_state.review_queue.append({
+            "id": review_id, "name": job["name"], "source": job["source"],
+            "error": job["error"], "disagreements": job["disagreements"], "colors": job["colors"],
+            "color_mismatches": compare_colors(job["analysis"], job["colors"]) if job["analysis"] else None
+        })
+    st.session_state.batch_key += 1
+    st.rerun()
+
+def save_review_items(review_items):
+    """Gemmer de godkendte stykker tøj fra køen som ét commit og fjerner dem fra den. Returnerer antal gemte."""
+    prepared = []
+    ready = []
+    for review in review_items:
+        try:
+            data = json.loads(st.session_state[f"review_json_{review['id']}"])
+            prepared.append(prepare_garment(Image.open(io.BytesIO(review["source"])), data, name_suffix=f"_{review['id']}"))
+            ready.append(review)
+        except json.JSONDecodeError as e:
+            st.error(f"{review['name']}: Fejl i JSON formatet: {e}")
+        except Exception as e:
+            st.error(f"{review['name']}: System fejl: {str(e)}")
+    if not prepared:
+        return 0
+    
+    if len(prepared) == 1:
+        commit_message = f"Tilføjet {prepared[0][1]['analysis'].get('display_name', 'nyt tøj')}"
+    else:
+        commit_message = f"Tilføjet {len(prepared)} stykker tøj"
+    try:
+        add_saved_garments(save_garments(prepared, commit_message))
+    except Exception as e:
+        st.error(f"System fejl: {str(e)}")
+        return 0
+    
+    for review in ready:
+        st.session_state.review_queue.remove(review)
+        del st.session_state[f"review_json_{review['id']}"]
+    return len(ready)
+
+if st.session_state.review_queue:
+    st.subheader(f"🗂️ Review-kø ({len(st.session_state.review_queue)})")
+    
+    ready = [r for r in st.session_state.review_queue if st.session_state.get(f"review_json_{r['id']}", "").strip()]
+    if st.button(f"🚀 Gem alle {len(ready)} færdige i Skyen", type="primary", disabled=not ready):
+        with st.spinner("Uploader til skyen..."):
+            saved = save_review_items(ready)
+        st.session_state.last_added = f"Gemt! {saved} stykker tøj"
+        st.rerun()
+
+    for review in list(st.session_state.review_queue):
+        with st.container(border=True):
+            col_img, col_data = st.columns([1, 3])
+            with col_img:
+                st.image(review["source"], caption=review["name"], use_container_width=True)
+            with col_data:
+                if review["error"]:
+                    st.error(f"AI Fejl: {review['error']}")
+                if review["disagreements"]:
+                    st.warning("**Regelmotoren er uenig med Senior & Master:**\n\n" + format_disagreements(review["disagreements"]))
+                if review["color_mismatches"]:
+                    st.warning("**AI'ens farver passer ikke med billedet:**\n\n" + format_color_mismatches(review["color_mismatches"]))
+                    if st.button("🎨 Brug farverne fra billedet", key=f"review_colors_{review['id']}"):
+                        try:
+                            st.session_state[f"review_json_{review['id']}"] = apply_local_colors(st.session_state[f"review_json_{review['id']}"], review["colors"])
+                            review["color_mismatches"] = None
+                        except json.JSONDecodeError as e:
+                            st.error(f"Fejl i JSON formatet: {e}")
+                st.text_area("JSON Data", height=200, key=f"review_json_{review['id']}")
+                col_save, col_drop = st.columns(2)
+                if col_save.button("🚀 Gem", key=f"review_save_{review['id']}"):
+                    with st.spinner("Uploader til skyen..."):
+                        if save_review_items([review]):
+                            st.session_state.last_added = f"Gemt! {review['name']}"
+                            st.rerun()
+                if col_drop.button("🗑️ Drop", key=f"review_drop_{review['id']}"):
+                    st.session_state.review_queue.remove(review)
+                    del st.session_state[f"review_json_{review['id']}"]
+                    st.rerun()
+
 # --- DATABASE STATUS & DOWNLOAD ---
 st.divider()
 try:
-    docs = db.collection("wardrobe").stream()
-    all_items = []
-    for doc in docs:
-        item = doc.to_dict()
-        item['firestore_id'] = doc.id 
-        all_items.append(item)
-    
-    count = len(all_items)
+    count = get_wardrobe_count()
     st.info(f"Antal stykker tøj i Cloud Database: **{count}**")
     
     if count > 0:
-        # RETTELSE: Vi bruger default=str til at håndtere Datetime objekter
-        json_string = json.dumps(all_items, indent=2, ensure_ascii=False, default=str)
+        # Backuppen bygges først ved klik (i en separat tråd), ikke ved hver rerun
         st.download_button(
             label="📥 Download hele databasen (JSON)",
-            data=json_string,
+            data=export_wardrobe,
             file_name="wardrobe_backup.json",
             mime="application/json"
         )
-except:
-    pass
\ No newline at end of file
+except Exception as e:
+    print(f"Kunne ikke hente database-status: {e}")
+
+# --- DEBUG: TIDSFORBRUG ---
+finish_trace(st.session_state.trace)
+if st.sidebar.toggle("🐞 Vis tidsforbrug", key="show_trace"):
+    with st.sidebar.expander("Tidsforbrug", expanded=True):
+        st.markdown(format_trace(st.session_state.trace))
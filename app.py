@@ -1,17 +1,28 @@
 import streamlit as st
 import os
 import json
+import time
+import hashlib
+import tempfile
+import sqlite3
 import requests
 import re
-from datetime import datetime
-import firebase_admin
-from firebase_admin import credentials, firestore
-from google import genai
-from PIL import Image
-from io import BytesIO
+import threading
+import contextvars
+from collections import deque
+from contextlib import closing
+from datetime import datetime, timedelta, timezone
+from concurrent.futures import ThreadPoolExecutor
+from engine import (
+    CATEGORIES, get_outfit_id, add_approved_outfit, build_outfit_feedback,
+    add_ai_override, build_ai_overrides, record_match, build_match_index, build_preference_model, learn_preference_matches,
+    rank_by_preference, preference_confidence, calculate_outfit_style_score, get_items_by_category,
+    build_compatibility_index, build_compatibility_bitsets, rank_category, suggest_complete_outfits
+)
+from tracing import start_trace, finish_trace, trace_run, span, count_reads, count_writes, recent_traces, format_trace
 
 # --- KONFIGURATION ---
-CATEGORIES = ["Top", "Bund", "Strømper", "Sko", "Overtøj"]
+# Kategorier, farver og alle score-konstanter ligger i engine.py
 CATEGORY_LABELS = {
     "Overtøj": "Overtøj",
     "Top": "Trøje",   
@@ -20,90 +31,463 @@ CATEGORY_LABELS = {
     "Sko": "Sko"
 }
 
-# Hvor meget skal temperatur-afvigelse straffes?
-# Formel: abs(dagens_temp - tøjets_gns) * FACTOR
-TEMP_PENALTY_FACTOR = 0.5 
-
-# Bonus for at være del af et tidligere godkendt outfit (trækkes fra scoren)
-SUCCESS_BONUS = 2
-
-# Straf for at genskabe et tidligere AFVIST outfit (lægges til scoren)
-REJECTION_PENALTY = 10
+# Visningsbredder (px) - bruges til at vælge den mindste thumbnail fra admin.py der passer
+OUTFIT_IMAGE_WIDTH = 175
+GRID_IMAGE_WIDTH = 320
+SUGGESTION_IMAGE_WIDTH = 100
+
+# Stylisten (Gemini). Model og temperatur indgår i nøglen til dom-cachen
+STYLIST_MODEL = "gemini-2.5-pro"
+STYLIST_TEMPERATURE = 0.3
+# Hvor længe genbruges en AI-dom over præcis samme tøj og prompt
+VERDICT_CACHE_TTL_DAYS = 90
+
+# Lokal disk-cache til billeder fra GitHub (de ændrer sig ikke, når admin.py har uploadet dem)
+IMAGE_CACHE_DIR = ".image_cache"
+IMAGE_CACHE_MAX_BYTES = 200 * 1024 * 1024
+# Hvor ofte spørger vi GitHub (med ETag) om et cachet billede stadig er det samme
+IMAGE_CACHE_REVALIDATE_SECONDS = 7 * 24 * 3600
+HTTP_TIMEOUT = 15
+# Hvor mange billeder hentes samtidig, før de sendes til Gemini
+IMAGE_FETCH_WORKERS = 6
+
+# Lokal SQLite-kopi af Firestore, så appen starter med det samme og kan køre uden net (kun læsning)
+REPLICA_PATH = ".replica.sqlite3"
+# Bruges som garderobe ved allerførste opstart, indtil Firestore har svaret
+REPLICA_SEED_FILE = "wardrobe.json"
+
+# Præference-model over tidligere kampe (selve modellen ligger i engine.py)
+# Hvor sikker skal modellen være, før vi springer AI'en over eller skærer ned til 2 kandidater
+PREFERENCE_CONFIDENCE = 0.9
 
 # --- FIREBASE INIT ---
-if not firebase_admin._apps:
-    if os.path.exists("firestore_key.json"):
-        cred = credentials.Certificate("firestore_key.json")
-        firebase_admin.initialize_app(cred)
-    elif "firebase" in st.secrets:
-        key_dict = dict(st.secrets["firebase"])
-        cred = credentials.Certificate(key_dict)
-        firebase_admin.initialize_app(cred)
-    else:
-        st.error("Mangler Firebase nøgle! (firestore_key.json eller Secrets)")
-        st.stop()
+# firebase_admin og Gemini-SDK'et importeres først ved første brug: første side vises fra den lokale kopi,
+# og Firestore forbindes i synkroniserings-tråden. Her tjekkes kun, at nøglen findes.
+if os.path.exists("firestore_key.json"):
+    FIREBASE_CREDENTIALS = "firestore_key.json"
+elif "firebase" in st.secrets:
+    FIREBASE_CREDENTIALS = dict(st.secrets["firebase"])
+else:
+    st.error("Mangler Firebase nøgle! (firestore_key.json eller Secrets)")
+    st.stop()
 
-db = firestore.client()
+def get_db():
+    """Firestore-klienten. Kaldes også fra baggrundstråde, så ingen st.cache_resource her;
+    firebase_admin holder selv på app og klient, så det er den samme klient hver gang."""
+    import firebase_admin
+    from firebase_admin import credentials, firestore
+    if not firebase_admin._apps:
+        try:
+            firebase_admin.initialize_app(credentials.Certificate(FIREBASE_CREDENTIALS))
+        except ValueError:
+            # En anden tråd nåede at initialisere appen først (ellers er nøglen ugyldig)
+            if not firebase_admin._apps:
+                raise
+    return firestore.client()
+
+# --- FIRESTORE SYNKRONISERING ---
+# Samlingerne holdes i en delt kopi i hukommelsen, som også gemmes i en lokal SQLite-fil. Ved opstart
+# læses kopien derfra (millisekunder), og Firestore afstemmes i en baggrundstråd.
+# Hver skrivning sætter updated_at på dokumentet og tæller samlingens generation op i stats/sync_versions
+# i samme batch. Baggrundstråden læser kun versions-dokumentet, og kun hvis en generation er ændret,
+# hentes de dokumenter der er nyere end sidst. Kan Firestore ikke nås, kører appen videre i læsetilstand.
+# Dokumenter slettes ikke i Firestore, men erstattes af en "gravsten" ({DELETED_FIELD: True, updated_at}), så
+# delta-forespørgslen også ser sletningen, og andre processer fjerner dokumentet fra deres kopi.
+
+SYNCED_COLLECTIONS = ["wardrobe", "approved_outfits", "rejected_outfits", "ai_score_overrides", "ai_match_cache", "ai_verdict_cache", "stats"]
+SYNC_VERSIONS_DOC = ("stats", "sync_versions")
+DELETED_FIELD = "deleted"
+
+def _encode_replica_value(value):
+    """JSON-hjælper: tidsstempler gemmes som ISO-tekst, så de kan læses tilbage som datetime."""
+    if isinstance(value, datetime):
+        return {"__datetime__": value.isoformat()}
+    return str(value)
+
+def _decode_replica_value(obj):
+    if len(obj) == 1 and "__datetime__" in obj:
+        return datetime.fromisoformat(obj["__datetime__"])
+    return obj
+
+def open_replica():
+    conn = sqlite3.connect(REPLICA_PATH, timeout=10)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE IF NOT EXISTS docs (collection TEXT, doc_id TEXT, data TEXT, PRIMARY KEY (collection, doc_id))")
+    conn.execute("CREATE TABLE IF NOT EXISTS sync_meta (collection TEXT PRIMARY KEY, generation INTEGER, synced_at TEXT)")
+    return conn
+
+def save_to_replica(collection, docs, synced=None, replace=False):
+    """Skriver dokumenter (og evt. synkroniserings-status) til den lokale kopi i én transaktion."""
+    try:
+        with closing(open_replica()) as conn, conn:
+            if replace:
+                conn.execute("DELETE FROM docs WHERE collection = ?", (collection,))
+            conn.executemany(
+                "INSERT OR REPLACE INTO docs VALUES (?, ?, ?)",
+                [(collection, doc_id, json.dumps(data, default=_encode_replica_value)) for doc_id, data in docs.items()]
+            )
+            if synced is not None:
+                synced_at = synced["synced_at"].isoformat() if synced["synced_at"] else None
+                conn.execute("INSERT OR REPLACE INTO sync_meta VALUES (?, ?, ?)", (collection, synced["generation"], synced_at))
+    except Exception as e:
+        print(f"Kunne ikke skrive til lokal kopi ({collection}): {e}")
 
-# --- AI HELPER FUNCTIONS ---
+def load_replica(collections):
+    """Læser den lokale kopi ind. Er der ingen garderobe endnu, bruges wardrobe.json som startpunkt."""
+    try:
+        with closing(open_replica()) as conn:
+            for collection, doc_id, data in conn.execute("SELECT collection, doc_id, data FROM docs"):
+                if collection in collections:
+                    collections[collection]["docs"][doc_id] = json.loads(data, object_hook=_decode_replica_value)
+            for collection, generation, synced_at in conn.execute("SELECT collection, generation, synced_at FROM sync_meta"):
+                if collection in collections:
+                    collections[collection]["generation"] = generation
+                    collections[collection]["synced_at"] = datetime.fromisoformat(synced_at) if synced_at else None
+    except Exception as e:
+        print(f"Kunne ikke læse lokal kopi: {e}")
+
+    wardrobe_docs = collections["wardrobe"]["docs"]
+    if not wardrobe_docs and os.path.exists(REPLICA_SEED_FILE):
+        # Gemmes ikke i SQLite: første synkronisering erstatter hele samlingen med Firestores udgave
+        try:
+            with open(REPLICA_SEED_FILE, "r", encoding="utf-8") as f:
+                for item in json.load(f):
+                    item = dict(item)
+                    doc_id = str(item.pop("id", len(wardrobe_docs)))
+                    if item.get("image_path"):
+                        item["image_path"] = item["image_path"].replace("\\", "/")
+                    wardrobe_docs[doc_id] = item
+        except Exception as e:
+            print(f"Kunne ikke læse {REPLICA_SEED_FILE}: {e}")
+
+@st.cache_resource
+def get_synced_state():
+    """Delt på tværs af sessioner: {samling: {"docs", "generation", "synced_at", "revision"}} + baggrundstråd."""
+    collections = {
+        name: {"docs": {}, "generation": None, "synced_at": None, "revision": 0}
+        for name in SYNCED_COLLECTIONS
+    }
+    load_replica(collections)
+    return {
+        "lock": threading.RLock(),
+        "collections": collections,
+        "pending": deque(),
+        "thread": None,
+        "offline": False,
+    }
 
-def load_image_from_url(url):
-    """Henter et billede fra en URL (GitHub) og gør det klar til AI."""
+def get_synced_docs(collection):
+    """Den lokale kopi af en samling ({doc_id: data})."""
+    return get_synced_state()["collections"][collection]["docs"]
+
+def is_offline():
+    """Kunne Firestore ikke nås ved sidste afstemning? Så er appen i læsetilstand."""
+    return get_synced_state()["offline"]
+
+def clear_derived_caches(collection):
+    """Smider de afledte indeks væk, når en hel samling er blevet udskiftet."""
+    if collection in ("approved_outfits", "rejected_outfits"):
+        load_outfit_feedback_cache.clear()
+    elif collection == "ai_score_overrides":
+        load_ai_overrides.clear()
+    elif collection == "ai_match_cache":
+        load_match_index.clear()
+        load_preference_model.clear()
+
+def delete_from_replica(collection, doc_ids):
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        return Image.open(BytesIO(response.content))
+        with closing(open_replica()) as conn, conn:
+            conn.executemany("DELETE FROM docs WHERE collection = ? AND doc_id = ?", [(collection, doc_id) for doc_id in doc_ids])
     except Exception as e:
-        print(f"Kunne ikke hente billede: {e}")
-        return None
+        print(f"Kunne ikke slette fra lokal kopi ({collection}): {e}")
+
+def apply_synced_changes(collection, changed, merge=False):
+    """Lægger ændrede dokumenter ind i den lokale kopi og opdaterer de afledte indeks trinvist.
+    Dokumenter fra Firestore erstatter den lokale udgave helt; merge=True bruges til egne delvise skrivninger.
+    Gravsten fjerner dokumentet, og så bygges samlingens afledte indeks forfra."""
+    state = get_synced_state()
+    with state["lock"]:
+        synced = state["collections"][collection]
+        deleted = [doc_id for doc_id, data in changed.items() if data.get(DELETED_FIELD)]
+        changed = {doc_id: data for doc_id, data in changed.items() if not data.get(DELETED_FIELD)}
+        for doc_id, data in changed.items():
+            if merge:
+                synced["docs"].setdefault(doc_id, {}).update(data)
+            else:
+                synced["docs"][doc_id] = data
+        for doc_id in deleted:
+            synced["docs"].pop(doc_id, None)
+        synced["revision"] += 1
+        save_to_replica(collection, {doc_id: synced["docs"][doc_id] for doc_id in changed})
+        if deleted:
+            delete_from_replica(collection, deleted)
+            # Indeksene kan kun vokse trinvist, så de bygges forfra ved næste brug (også med ændringerne herover)
+            clear_derived_caches(collection)
+            return
+
+        # Alle opdateringer herunder tåler at samme dokument kommer igen (fx vores egen skrivning via delta-sync)
+        if collection == "approved_outfits":
+            approved, _, approved_index = load_outfit_feedback_cache()
+            for doc_id in changed:
+                approved[doc_id] = synced["docs"][doc_id].get('comment', '')
+                add_approved_outfit(approved_index, doc_id)
+        elif collection == "rejected_outfits":
+            _, rejected, _ = load_outfit_feedback_cache()
+            for doc_id in changed:
+                rejected[doc_id] = synced["docs"][doc_id].get('comment', '')
+        elif collection == "ai_score_overrides":
+            overrides = load_ai_overrides()
+            for doc_id in changed:
+                add_ai_override(overrides, synced["docs"][doc_id])
+        elif collection == "ai_match_cache":
+            match_index = load_match_index()
+            feedback = {doc_id: synced["docs"][doc_id].get("raw_feedback") for doc_id in changed}
+            for doc_id in changed:
+                record_match(match_index, doc_id, feedback[doc_id])
+            learn_preference_matches(load_preference_model(), feedback)
+
+def write_synced_doc(collection, doc_id, data, merge=False):
+    """Skriver dokumentet og tæller generationen op i én batch, og opdaterer den lokale kopi med det samme."""
+    from firebase_admin import firestore
+    db = get_db()
+    version_ref = db.collection(SYNC_VERSIONS_DOC[0]).document(SYNC_VERSIONS_DOC[1])
+    batch = db.batch()
+    batch.set(db.collection(collection).document(doc_id), dict(data, updated_at=firestore.SERVER_TIMESTAMP), merge=merge)
+    batch.set(version_ref, {collection: firestore.Increment(1)}, merge=True)
+    with span("firestore: skriv"):
+        batch.commit()
+    count_writes(collection)
+    count_writes(SYNC_VERSIONS_DOC[0])
+
+    now = datetime.now(timezone.utc)
+    local = {key: (now if value is firestore.SERVER_TIMESTAMP else value) for key, value in data.items()}
+    apply_synced_changes(collection, {doc_id: local}, merge=merge)
+
+def delete_synced_docs(collection, doc_ids):
+    """Erstatter dokumenterne med gravsten (og tæller generationen op), så sletningen også synkroniseres til andre processer."""
+    from firebase_admin import firestore
+    db = get_db()
+    version_ref = db.collection(SYNC_VERSIONS_DOC[0]).document(SYNC_VERSIONS_DOC[1])
+    # Firestore tillader højst 500 operationer pr. batch (én går til versions-dokumentet)
+    for start in range(0, len(doc_ids), 499):
+        chunk = doc_ids[start:start + 499]
+        batch = db.batch()
+        for doc_id in chunk:
+            batch.set(db.collection(collection).document(doc_id), {DELETED_FIELD: True, "updated_at": firestore.SERVER_TIMESTAMP})
+        batch.set(version_ref, {collection: firestore.Increment(1)}, merge=True)
+        with span("firestore: slet"):
+            batch.commit()
+        count_writes(collection, len(chunk))
+        count_writes(SYNC_VERSIONS_DOC[0])
+    apply_synced_changes(collection, {doc_id: {DELETED_FIELD: True} for doc_id in doc_ids})
+
+@trace_run("sync")
+def fetch_synced_changes(state):
+    """Kører i baggrundstråden: henter ændringer fra Firestore og lægger dem i kø (ingen st.* kald her)."""
+    try:
+        db = get_db()
+        from google.cloud.firestore_v1.base_query import FieldFilter
+        version_doc = db.collection(SYNC_VERSIONS_DOC[0]).document(SYNC_VERSIONS_DOC[1]).get()
+        count_reads(SYNC_VERSIONS_DOC[0])
+        versions = version_doc.to_dict() or {} if version_doc.exists else {}
+    except Exception as e:
+        print(f"Kunne ikke læse synkroniserings-versioner: {e}")
+        state["offline"] = True
+        return
+    state["offline"] = False
+
+    for name in SYNCED_COLLECTIONS:
+        synced = state["collections"][name]
+        generation = versions.get(name, 0)
+        if synced["generation"] == generation:
+            continue
 
-def get_ai_feedback(outfit_items, candidates=None, base_already_approved=False):
-    """Sender billederne til Gemini for en 'Smagsdommer' vurdering (med eller uden kandidater)."""
+        full = synced["generation"] is None or synced["synced_at"] is None
+        try:
+            query = db.collection(name)
+            if not full:
+                # >= så skrivninger med samme tidsstempel ikke tabes; de gentagne dokumenter er harmløse
+                query = query.where(filter=FieldFilter("updated_at", ">=", synced["synced_at"]))
+            changed = {}
+            synced_at = None if full else synced["synced_at"]
+            with span(f"firestore: hent {name}"):
+                for doc in query.stream():
+                    data = doc.to_dict()
+                    changed[doc.id] = data
+                    updated_at = data.get("updated_at")
+                    if updated_at and (synced_at is None or updated_at > synced_at):
+                        synced_at = updated_at
+            count_reads(name, max(len(changed), 1))
+        except Exception as e:
+            print(f"Fejl ved synkronisering af {name}: {e}")
+            state["offline"] = True
+            return
+        state["pending"].append((name, changed, generation, synced_at, full))
+
+@span("firestore: synkronisering")
+def sync_collections():
+    """Kaldes ved hvert rerun: anvender det baggrundstråden har hentet og starter næste afstemning."""
+    state = get_synced_state()
+    with state["lock"]:
+        thread = state["thread"]
+        idle = thread is None or not thread.is_alive()
+        if idle and not state["collections"]["wardrobe"]["docs"]:
+            # Allerførste opstart uden lokal kopi: der er intet at vise, så vi venter på Firestore
+            fetch_synced_changes(state)
+
+        while state["pending"]:
+            name, changed, generation, synced_at, full = state["pending"].popleft()
+            synced = state["collections"][name]
+            if full:
+                changed = {doc_id: data for doc_id, data in changed.items() if not data.get(DELETED_FIELD)}
+                synced["docs"] = changed
+                synced["revision"] += 1
+                clear_derived_caches(name)
+            elif changed:
+                # Lokale skrivninger fra baggrundstråden (generation None) er delvise og flettes ind
+                apply_synced_changes(name, changed, merge=generation is None)
+            if generation is None:
+                # Lokal skrivning fra en baggrundstråd – generationen hentes ved næste afstemning
+                continue
+            synced["generation"] = generation
+            synced["synced_at"] = synced_at
+            save_to_replica(name, changed if full else {}, synced=synced, replace=full)
+
+        if idle:
+            state["thread"] = threading.Thread(target=fetch_synced_changes, args=(state,), daemon=True)
+            state["thread"].start()
+
+# --- AI HELPER FUNCTIONS ---
+
+@st.cache_resource
+def get_genai_client(api_key):
+    """Én delt Gemini-klient. google.genai importeres først her (første bedømmelse), ikke ved opstart."""
+    from google import genai
+    return genai.Client(api_key=api_key)
+
+@st.cache_resource
+def get_http_session():
+    """Én delt requests.Session, så forbindelser til GitHub og Open-Meteo genbruges (keep-alive)."""
+    session = requests.Session()
+    adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=16, max_retries=2)
+    session.mount("https://", adapter)
+    return session
+
+def _write_file_atomic(path, data):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+    with os.fdopen(fd, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+def evict_image_cache():
+    """Sletter de mindst brugte billeder, når cachen fylder mere end IMAGE_CACHE_MAX_BYTES."""
+    blob_dir = os.path.join(IMAGE_CACHE_DIR, "blobs")
+    if not os.path.isdir(blob_dir):
+        return
+    entries = []
+    total = 0
+    for entry in os.scandir(blob_dir):
+        stat = entry.stat()
+        entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total += stat.st_size
+    if total <= IMAGE_CACHE_MAX_BYTES:
+        return
+    # Ryd ned til 90%, så vi ikke skal rydde op ved hvert eneste nye billede
+    for _, size, path in sorted(entries):
+        if total <= IMAGE_CACHE_MAX_BYTES * 0.9:
+            break
+        try:
+            os.remove(path)
+            total -= size
+        except OSError:
+            pass
+
+def fetch_cached_bytes(url, session=None):
+    """Henter en URL gennem disk-cachen: indholdsadresserede filer, ETag-revalidering og LRU-oprydning."""
+    session = session or get_http_session()
+    url_key = hashlib.sha256(url.encode("utf-8")).hexdigest()
+    meta_path = os.path.join(IMAGE_CACHE_DIR, "meta", f"{url_key}.json")
     
-    api_key = None
-    if "google_api_key" in st.secrets:
-        api_key = st.secrets["google_api_key"]
+    meta = None
+    blob_path = None
+    try:
+        with open(meta_path, "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        blob_path = os.path.join(IMAGE_CACHE_DIR, "blobs", meta["sha256"])
+        if not os.path.exists(blob_path):
+            meta = None
+    except (OSError, ValueError, KeyError):
+        meta = None
     
-    if not api_key:
-        return "⚠️ Mangler Google API Nøgle i Secrets."
-
-    contents = []
+    headers = {}
+    if meta:
+        if time.time() - meta.get("checked_at", 0) < IMAGE_CACHE_REVALIDATE_SECONDS:
+            os.utime(blob_path)  # Markér som brugt (LRU)
+            with open(blob_path, "rb") as f:
+                return f.read()
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
     
-    # 1. Tilføj Base Outfit
-    has_base = len(outfit_items) > 0
-    if has_base:
-        if candidates:
-            contents.append("=== BASE OUTFIT (FUNDAMENTET) ===")
-        for item in outfit_items:
-            img_url = item.get('image_path')
-            category = item.get('analysis', {}).get('category', 'Ukendt')
-            display_name = item.get('analysis', {}).get('display_name', '')
-            
-            if img_url and img_url.startswith('http'):
-                img = load_image_from_url(img_url)
-                if img:
-                    contents.append(f"Valgt {category}: {display_name}. (Ignorer modellen og eventuelt andet tøj på dette specifikke billede).")
-                    contents.append(img)
+    response = session.get(url, headers=headers, timeout=HTTP_TIMEOUT)
+    if response.status_code == 304 and meta:
+        meta["checked_at"] = time.time()
+        _write_file_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+        os.utime(blob_path)
+        with open(blob_path, "rb") as f:
+            return f.read()
+    response.raise_for_status()
     
-    # 2. Tilføj Kandidater (hvis nogen)
-    if candidates:
-        contents.append("=== KANDIDATER (VÆLG ÉN AF DISSE) ===")
-        for item in candidates:
-            img_url = item.get('image_path')
-            category = item.get('analysis', {}).get('category', 'Ukendt')
-            display_name = item.get('analysis', {}).get('display_name', '')
-            item_id = item.get('id')
-            
-            if img_url and img_url.startswith('http'):
-                img = load_image_from_url(img_url)
-                if img:
-                    contents.append(f"Kandidat ID: {item_id} | Kategori: {category} | Navn: {display_name}")
-                    contents.append(img)
-
-    if not contents:
-        return "⚠️ Kunne ikke finde billeder at sende til AI."
-
-    # 3. Dynamisk Prompt
+    content = response.content
+    digest = hashlib.sha256(content).hexdigest()
+    blob_path = os.path.join(IMAGE_CACHE_DIR, "blobs", digest)
+    if not os.path.exists(blob_path):
+        _write_file_atomic(blob_path, content)
+    meta = {"sha256": digest, "etag": response.headers.get("ETag"), "checked_at": time.time()}
+    _write_file_atomic(meta_path, json.dumps(meta).encode("utf-8"))
+    evict_image_cache()
+    return content
+
+def guess_image_mime_type(data):
+    """Finder billedformatet ud fra de første bytes (vi sender bytes direkte, uden at dekode billedet)."""
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    raise ValueError("Ukendt billedformat")
+
+@span("http: billede")
+def load_image_from_url(url, session=None):
+    """Henter et billede fra en URL (GitHub) som en færdig Gemini-del. Fejl sendes videre til kalderen."""
+    from google.genai import types
+    data = fetch_cached_bytes(url, session)
+    return types.Part.from_bytes(data=data, mime_type=guess_image_mime_type(data))
+
+def load_images_concurrently(urls):
+    """Henter alle billeder parallelt. Returnerer [(billede, fejltekst)] i samme rækkefølge som urls."""
+    if not urls:
+        return []
+    # Sessionen hentes her i hovedtråden, da st.cache_resource ikke må kaldes fra tråd-poolen
+    session = get_http_session()
+    results = []
+    with ThreadPoolExecutor(max_workers=min(IMAGE_FETCH_WORKERS, len(urls))) as pool:
+        # Hver opgave kører i en kopi af konteksten, så billed-hentningerne tælles med i rerunnets trace
+        futures = [pool.submit(contextvars.copy_context().run, load_image_from_url, url, session) for url in urls]
+        for future in futures:
+            try:
+                results.append((future.result(timeout=HTTP_TIMEOUT * 2), None))
+            except Exception as e:
+                results.append((None, str(e) or type(e).__name__))
+    return results
+
+def get_ai_image_url(item):
+    """Den lille analyse-variant fra admin.py hvis den findes, ellers hovedbilledet."""
+    return item.get('ai_image_path') or item.get('image_path')
+
+def build_stylist_instruction(has_base, candidates, base_already_approved=False):
+    """Bygger system-prompten til stylisten ud fra hvilken slags bedømmelse det er."""
     system_domain = """Du er en ærlig og direkte modeekspert. Dit domæne spænder over et spektrum fra 'Modern Heritage' (klassisk herremode, tekstur, jordfarver) til 'Maskulin smart-casual' (tidløs minimalisme, rene linjer).
 Et outfit behøver IKKE at ramme begge stilarter på én gang. Din opgave er at vurdere, om tøjet fungerer som en harmonisk helhed."""
 
@@ -153,20 +537,151 @@ Output format (Vær kort!):
 1. Start med DOMMEN: Enten '✅ Godkendt' eller '⚠️ Justering anbefales'.
 2. Giv KOMMENTAREN: Max 1-2 sætninger om hvorfor det virker, eller hvad der clasher.
 3. LØSNINGEN (Kun ved fejl): Foreslå én ting der skal ændres for at redde outfittet."""
+    return system_instruction
+
+def get_verdict_cache_id(outfit_items, candidates, system_instruction):
+    """Indholds-adresseret nøgle: model, prompt og præcis hvilke stykker tøj der bedømmes."""
+    key = {
+        "model": STYLIST_MODEL,
+        "temperature": STYLIST_TEMPERATURE,
+        "instruction": hashlib.sha256(system_instruction.encode("utf-8")).hexdigest(),
+        "outfit": sorted(item['id'] for item in outfit_items),
+        "candidates": sorted(item['id'] for item in candidates or []),
+    }
+    return hashlib.sha256(json.dumps(key, sort_keys=True).encode("utf-8")).hexdigest()
 
+def get_cached_verdict(outfit_items, candidates=None, base_already_approved=False):
+    """Slår en tidligere dom op i den synkroniserede kopi (ingen Firestore-læsning). None hvis ukendt eller udløbet."""
+    system_instruction = build_stylist_instruction(len(outfit_items) > 0, candidates, base_already_approved)
+    return lookup_verdict(get_verdict_cache_id(outfit_items, candidates, system_instruction))
+
+def lookup_verdict(verdict_id):
+    """Dommen med dette ID fra den synkroniserede kopi. None hvis ukendt eller udløbet."""
+    doc = get_synced_docs("ai_verdict_cache").get(verdict_id)
+    if not doc:
+        return None
+    expires_at = doc.get("expires_at")
+    if expires_at and expires_at <= datetime.now(timezone.utc):
+        return None
+    return doc.get("feedback")
+
+def save_verdict(verdict_id, feedback, outfit_items, candidates, system_instruction):
+    """Gemmer stylistens dom med udløbstid og rydder samtidig udløbne domme op."""
+    from firebase_admin import firestore
     try:
-        client = genai.Client(api_key=api_key)
-        response = client.models.generate_content(
-            model="gemini-2.5-pro",
-            contents=contents,
-            config={
-                "system_instruction": system_instruction,
-                "temperature": 0.3,
-            }
-        )
-        return response.text
+        write_synced_doc("ai_verdict_cache", verdict_id, {
+            "feedback": feedback,
+            "model": STYLIST_MODEL,
+            "instruction_hash": hashlib.sha256(system_instruction.encode("utf-8")).hexdigest(),
+            "outfit_ids": sorted(item['id'] for item in outfit_items),
+            "candidate_ids": sorted(item['id'] for item in candidates or []),
+            # Ikke som TTL-politik i Firestore: serverens sletninger ses ikke af synkroniseringen (se delete_synced_docs)
+            "expires_at": datetime.now(timezone.utc) + timedelta(days=VERDICT_CACHE_TTL_DAYS),
+            "timestamp": firestore.SERVER_TIMESTAMP
+        })
+        evict_verdict_cache()
+    except Exception as e:
+        print(f"Fejl ved gemning af AI-dom: {e}")
+
+def evict_verdict_cache():
+    """Sletter udløbne domme (som gravsten) i Firestore, i den lokale kopi og i SQLite-kopien."""
+    docs = get_synced_docs("ai_verdict_cache")
+    now = datetime.now(timezone.utc)
+    expired = [doc_id for doc_id, data in docs.items() if data.get("expires_at") and data["expires_at"] <= now]
+    if expired:
+        delete_synced_docs("ai_verdict_cache", expired)
+
+def get_ai_feedback(outfit_items, candidates=None, base_already_approved=False):
+    """Sender billederne til Gemini for en 'Smagsdommer' vurdering (med eller uden kandidater)."""
+    
+    api_key = None
+    if "google_api_key" in st.secrets:
+        api_key = st.secrets["google_api_key"]
+    
+    if not api_key:
+        return "⚠️ Mangler Google API Nøgle i Secrets."
+
+    # Samme tøj, samme prompt og samme model giver samme dom - så genbruger vi den
+    has_base = len(outfit_items) > 0
+    system_instruction = build_stylist_instruction(has_base, candidates, base_already_approved)
+    verdict_id = get_verdict_cache_id(outfit_items, candidates, system_instruction)
+    cached = lookup_verdict(verdict_id)
+    if cached:
+        st.toast("Genbruger tidligere AI-vurdering af præcis dette tøj!", icon="⚡")
+        return cached
+
+    contents = []
+    failed_images = []
+    
+    # Hent alle billeder (base + kandidater) på én gang, før prompten bygges i fast rækkefølge
+    all_items = list(outfit_items) + list(candidates or [])
+    image_urls = []
+    for item in all_items:
+        img_url = get_ai_image_url(item)
+        if img_url and img_url.startswith('http'):
+            image_urls.append(img_url)
+        else:
+            failed_images.append(f"{item.get('analysis', {}).get('display_name', item.get('id'))}: mangler billede-URL")
+    fetched = dict(zip(image_urls, load_images_concurrently(image_urls)))
+    
+    def image_for(item):
+        img, error = fetched.get(get_ai_image_url(item), (None, None))
+        if error:
+            failed_images.append(f"{item.get('analysis', {}).get('display_name', item.get('id'))}: {error}")
+        return img
+    
+    # 1. Tilføj Base Outfit
+    if has_base:
+        if candidates:
+            contents.append("=== BASE OUTFIT (FUNDAMENTET) ===")
+        for item in outfit_items:
+            category = item.get('analysis', {}).get('category', 'Ukendt')
+            display_name = item.get('analysis', {}).get('display_name', '')
+            
+            img = image_for(item)
+            if img:
+                contents.append(f"Valgt {category}: {display_name}. (Ignorer modellen og eventuelt andet tøj på dette specifikke billede).")
+                contents.append(img)
+    
+    # 2. Tilføj Kandidater (hvis nogen)
+    if candidates:
+        contents.append("=== KANDIDATER (VÆLG ÉN AF DISSE) ===")
+        for item in candidates:
+            category = item.get('analysis', {}).get('category', 'Ukendt')
+            display_name = item.get('analysis', {}).get('display_name', '')
+            item_id = item.get('id')
+            
+            img = image_for(item)
+            if img:
+                contents.append(f"Kandidat ID: {item_id} | Kategori: {category} | Navn: {display_name}")
+                contents.append(img)
+    
+    # Vises øverst på siden efter næste rerun, så brugeren ved hvad stylisten IKKE har set
+    if failed_images:
+        st.session_state.image_fetch_errors = failed_images
+
+    if not contents:
+        return "⚠️ Kunne ikke finde billeder at sende til AI."
+
+    try:
+        client = get_genai_client(api_key)
+        with span("gemini: stylist"):
+            response = client.models.generate_content(
+                model=STYLIST_MODEL,
+                contents=contents,
+                config={
+                    "system_instruction": system_instruction,
+                    "temperature": STYLIST_TEMPERATURE,
+                }
+            )
+        feedback = response.text
     except Exception as e:
         return f"AI Fejl: {str(e)}"
+    
+    # En dom over et ufuldstændigt sæt billeder gemmes ikke
+    if feedback and not failed_images:
+        save_verdict(verdict_id, feedback, outfit_items, candidates, system_instruction)
+    return feedback
 
 # --- VEJR FUNKTIONER ---
 
@@ -174,7 +689,7 @@ Output format (Vær kort!):
 def get_coordinates(city_name):
     try:
         url = f"https://geocoding-api.open-meteo.com/v1/search?name={city_name}&count=1&language=da&format=json"
-        response = requests.get(url).json()
+        response = get_http_session().get(url, timeout=HTTP_TIMEOUT).json()
         if "results" in response:
             return response["results"][0]["latitude"], response["results"][0]["longitude"]
     except Exception as e:
@@ -184,10 +699,11 @@ def get_coordinates(city_name):
 @st.cache_data(ttl=3600)
 def fetch_weather_api_data(lat, lon):
     url = f"https://api.open-meteo.com/v1/forecast?latitude={lat}&longitude={lon}&daily=temperature_2m_max,precipitation_sum,wind_speed_10m_max&hourly=apparent_temperature&forecast_days=2&timezone=auto"
-    response = requests.get(url)
+    response = get_http_session().get(url, timeout=HTTP_TIMEOUT)
     response.raise_for_status() 
     return response.json()
 
+@span("vejr: prognose")
 def get_weather_forecast(lat, lon):
     try:
         data = fetch_weather_api_data(lat, lon)
@@ -222,62 +738,92 @@ def get_weather_forecast(lat, lon):
 
 # --- HISTORIK & STATISTIK FUNKTIONER ---
 
-def update_item_stats(item_id, current_avg_temp):
-    try:
-        doc_ref = db.collection("wardrobe").document(item_id)
-        doc = doc_ref.get()
-        if doc.exists:
-            data = doc.to_dict()
-            old_count = data.get('usage_count', 0)
-            old_avg = data.get('avg_temp', 0)
-            
-            if old_count == 0 or old_avg is None:
-                new_avg = current_avg_temp
-            else:
-                new_avg = ((old_avg * old_count) + current_avg_temp) / (old_count + 1)
-            
-            doc_ref.update({
-                'usage_count': old_count + 1,
-                'avg_temp': new_avg,
-                'last_worn': firestore.SERVER_TIMESTAMP
-            })
-    except Exception as e:
-        print(f"Kunne ikke opdatere stats for {item_id}: {e}")
+def running_average(old_avg, old_count, value):
+    """Løbende gennemsnit, hvor den nye værdi tæller som én observation mere."""
+    if not old_count or old_avg is None:
+        return value
+    return ((old_avg * old_count) + value) / (old_count + 1)
 
 def get_global_style_stats():
-    try:
-        doc = db.collection("stats").document("style_stats").get()
-        if doc.exists:
-            return doc.to_dict().get('average_score', 0.0)
-    except:
-        pass
+    doc = get_synced_docs("stats").get("style_stats")
+    if doc:
+        return doc.get('average_score', 0.0)
     return None
 
-def update_global_style_stats(new_score):
-    try:
-        doc_ref = db.collection("stats").document("style_stats")
-        doc = doc_ref.get()
-        
-        if doc.exists:
-            data = doc.to_dict()
-            old_avg = data.get('average_score', 0.0)
-            count = data.get('count', 0)
-            
-            new_avg = ((old_avg * count) + new_score) / (count + 1)
-            new_count = count + 1
-        else:
-            new_avg = new_score
-            new_count = 1
-            
-        doc_ref.set({
-            'average_score': new_avg,
-            'count': new_count,
-            'last_updated': firestore.SERVER_TIMESTAMP
+def commit_worn_outfit(transaction, item_ids, doc_data, current_avg_temp, style_score):
+    """Historik, tøj-statistik og global stil-score i én transaktion (genforsøges ved samtidige skrivninger).
+    Køres via firestore.transactional i run_outfit_save. Returnerer de lokale ændringer {samling: {doc_id: felter}}."""
+    from firebase_admin import firestore
+    db = get_db()
+    item_refs = [db.collection("wardrobe").document(item_id) for item_id in item_ids] if current_avg_temp is not None else []
+    stats_ref = db.collection("stats").document("style_stats")
+    # Alle læsninger i ét kald, før der skrives
+    snapshots = {snap.reference.path: snap for snap in transaction.get_all(item_refs + [stats_ref])}
+    now = datetime.now(timezone.utc)
+    changes = {"wardrobe": {}, "stats": {}}
+
+    for ref in item_refs:
+        snap = snapshots.get(ref.path)
+        if not snap or not snap.exists:
+            continue
+        data = snap.to_dict()
+        old_count = data.get('usage_count', 0)
+        new_avg = running_average(data.get('avg_temp'), old_count, current_avg_temp)
+        transaction.update(ref, {
+            'usage_count': firestore.Increment(1),
+            'avg_temp': new_avg,
+            'last_worn': firestore.SERVER_TIMESTAMP,
+            'updated_at': firestore.SERVER_TIMESTAMP
         })
+        changes["wardrobe"][ref.id] = {'usage_count': old_count + 1, 'avg_temp': new_avg, 'last_worn': now, 'updated_at': now}
+
+    stats_snap = snapshots.get(stats_ref.path)
+    stats = stats_snap.to_dict() or {} if stats_snap and stats_snap.exists else {}
+    count = stats.get('count', 0)
+    new_score_avg = running_average(stats.get('average_score', 0.0), count, style_score)
+    transaction.set(stats_ref, {
+        'average_score': new_score_avg,
+        'count': firestore.Increment(1),
+        'last_updated': firestore.SERVER_TIMESTAMP,
+        'updated_at': firestore.SERVER_TIMESTAMP
+    }, merge=True)
+    changes["stats"]["style_stats"] = {'average_score': new_score_avg, 'count': count + 1, 'last_updated': now, 'updated_at': now}
+
+    transaction.set(db.collection("history").document(), doc_data)
+
+    versions = {"stats": firestore.Increment(1)}
+    if changes["wardrobe"]:
+        versions["wardrobe"] = firestore.Increment(1)
+    transaction.set(db.collection(SYNC_VERSIONS_DOC[0]).document(SYNC_VERSIONS_DOC[1]), versions, merge=True)
+    return changes
+
+@trace_run("outfit_save")
+def run_outfit_save(state, status, item_ids, doc_data, current_avg_temp, style_score):
+    """Kører i baggrundstråden. Den lokale kopi opdateres via køen ved næste rerun (ingen st.* kald her)."""
+    try:
+        from firebase_admin import firestore
+        changes = firestore.transactional(commit_worn_outfit)(get_db().transaction(), item_ids, doc_data, current_avg_temp, style_score)
+        # Tælles først efter commit: Firestore kører transaktionen igen ved samtidige skrivninger
+        count_reads("wardrobe", len(item_ids) if current_avg_temp is not None else 0)
+        count_reads("stats")
+        count_writes("wardrobe", len(changes["wardrobe"]))
+        count_writes("stats", 2)
+        count_writes("history")
+        for collection, changed in changes.items():
+            if changed:
+                state["pending"].append((collection, changed, None, None, False))
     except Exception as e:
-        print(f"Fejl ved opdatering af historisk score: {e}")
+        print(f"Fejl ved gemning af outfit: {e}")
+        status["error"] = str(e)
+    status["done"] = True
+
+@st.cache_resource
+def get_save_executor():
+    """Én fælles tråd til gemninger, så de udføres i rækkefølge uden at blokere UI'en."""
+    return ThreadPoolExecutor(max_workers=1)
 
 def save_outfit_to_history(outfit_items, weather_data, location, style_score):
+    """Starter gemningen i baggrunden og returnerer straks et status-dict ({"done", "error"})."""
     outfit_summary = []
     for item in outfit_items:
         data = item['analysis']
@@ -295,24 +841,22 @@ def save_outfit_to_history(outfit_items, weather_data, location, style_score):
         "style_score": style_score,
         "outfit": outfit_summary
     }
-    db.collection("history").add(doc_data)
     
+    status = {"done": False, "error": None}
+    item_ids = [item['id'] for item in outfit_items]
     current_avg_temp = weather_data.get('avg_feels_like_10h')
-    if current_avg_temp is not None:
-        for item in outfit_items:
-            update_item_stats(item['id'], current_avg_temp)
+    # Den delte tilstand og tråden hentes her i hovedtråden, da st.cache_resource ikke må kaldes fra tråden
+    get_save_executor().submit(run_outfit_save, get_synced_state(), status, item_ids, doc_data, current_avg_temp, style_score)
+    return status
 
 # --- OUTFIT MEMORY, KAMP CACHE & AI OVERRIDES ---
 
-def get_outfit_id(outfit_items):
-    """Laver et unikt ID for en kombination af tøj."""
-    ids = sorted([item['id'] for item in outfit_items])
-    return "_".join(ids)
-
 def save_approved_outfit(outfit_items, comment):
+    from firebase_admin import firestore
     try:
         oid = get_outfit_id(outfit_items)
-        db.collection("approved_outfits").document(oid).set({
+        # Den cachede hukommelse opdateres direkte i stedet for at hente hele samlingen igen
+        write_synced_doc("approved_outfits", oid, {
             "comment": comment,
             "timestamp": firestore.SERVER_TIMESTAMP
         })
@@ -320,42 +864,29 @@ def save_approved_outfit(outfit_items, comment):
         print(f"Fejl ved gemning af godkendt outfit: {e}")
 
 def save_rejected_outfit(outfit_items, comment):
+    from firebase_admin import firestore
     try:
         oid = get_outfit_id(outfit_items)
-        db.collection("rejected_outfits").document(oid).set({
+        write_synced_doc("rejected_outfits", oid, {
             "comment": comment,
             "timestamp": firestore.SERVER_TIMESTAMP
         })
     except Exception as e:
         print(f"Fejl ved gemning af afvist outfit: {e}")
 
-@st.cache_data(ttl=600)
+@st.cache_resource
 def load_outfit_feedback_cache():
-    approved = {}
-    rejected = {}
-    approved_sets = []
-    try:
-        docs_app = db.collection("approved_outfits").stream()
-        for doc in docs_app:
-            approved[doc.id] = doc.to_dict().get('comment', '')
-            if doc.id:
-                ids = set(doc.id.split('_'))
-                approved_sets.append(ids)
-            
-        docs_rej = db.collection("rejected_outfits").stream()
-        for doc in docs_rej:
-            rejected[doc.id] = doc.to_dict().get('comment', '')
-    except:
-        pass
-    return approved, rejected, approved_sets
+    """Godkendte/afviste outfits bygget fra den synkroniserede kopi. Delt objekt, som synkroniseringen opdaterer direkte."""
+    return build_outfit_feedback(get_synced_docs("approved_outfits"), get_synced_docs("rejected_outfits"))
 
 def save_ai_override(base_outfit_items, category, winner_id, new_score):
     """Gemmer den overskrevne score og beholder alle vindere."""
+    from firebase_admin import firestore
     try:
         base_id = get_outfit_id(base_outfit_items) if base_outfit_items else "empty"
         # BEMÆRK: ID'et indeholder nu winner_id, så vi ikke overskriver gamle vindere!
         doc_id = f"{base_id}_{category}_{winner_id}"
-        db.collection("ai_score_overrides").document(doc_id).set({
+        write_synced_doc("ai_score_overrides", doc_id, {
             "base_outfit": base_id,
             "category": category,
             "winner_id": winner_id,
@@ -365,30 +896,10 @@ def save_ai_override(base_outfit_items, category, winner_id, new_score):
     except Exception as e:
         print(f"Fejl ved gemning af AI override: {e}")
 
-@st.cache_data(ttl=600)
+@st.cache_resource
 def load_ai_overrides():
-    """Henter alle vindere og grupperer dem efter base_outfit og kategori."""
-    overrides = {}
-    try:
-        docs = db.collection("ai_score_overrides").stream()
-        for doc in docs:
-            data = doc.to_dict()
-            base_id = data.get("base_outfit")
-            cat = data.get("category")
-            w_id = data.get("winner_id")
-            n_score = data.get("new_score")
-            
-            if not base_id or not cat or not w_id:
-                continue
-                
-            key = f"{base_id}_{cat}"
-            if key not in overrides:
-                overrides[key] = {}
-            # Tilføj vinderen til listen for denne specifikke tøjkombination
-            overrides[key][w_id] = n_score
-    except:
-        pass
-    return overrides
+    """Alle vindere grupperet efter base_outfit og kategori (holdes opdateret af synkroniseringen)."""
+    return build_ai_overrides(get_synced_docs("ai_score_overrides").values())
 
 def get_match_cache_id(base_outfit_items, category, cand_dicts):
     """Laver et unikt ID for en specifik kamp mellem kandidater."""
@@ -397,207 +908,69 @@ def get_match_cache_id(base_outfit_items, category, cand_dicts):
     return f"{base_id}_{category}_{cand_ids}"
 
 def get_cached_match(match_id):
-    """Henter resultatet af en tidligere udkæmpet kamp mellem specifikke kandidater."""
-    try:
-        doc = db.collection("ai_match_cache").document(match_id).get()
-        if doc.exists:
-            return doc.to_dict().get("raw_feedback")
-    except:
-        pass
-    return None
+    """Resultatet af en tidligere kamp mellem præcis disse kandidater (fra den synkroniserede kopi, ingen Firestore-læsning).
+    Dækker også kampe uden vinder og kampe gemt før ai_verdict_cache fandtes."""
+    return get_synced_docs("ai_match_cache").get(match_id, {}).get("raw_feedback")
 
 def save_match_cache(match_id, raw_feedback):
     """Gemmer AI's dom af kampen, så vi slipper for at bruge et API-kald igen."""
+    from firebase_admin import firestore
     try:
-        db.collection("ai_match_cache").document(match_id).set({
+        # Vinder/taber-indekset og præference-modellen opdateres af synkroniseringen uden at hente hele historikken igen
+        write_synced_doc("ai_match_cache", match_id, {
             "raw_feedback": raw_feedback,
             "timestamp": firestore.SERVER_TIMESTAMP
         })
     except Exception as e:
         print(f"Fejl ved gemning af match cache: {e}")
 
-@st.cache_data(ttl=600)
 def load_match_cache():
-    """Henter hele kamphistorikken ind i hukommelsen for hurtig eliminering."""
-    matches = {}
-    try:
-        docs = db.collection("ai_match_cache").stream()
-        for doc in docs:
-            matches[doc.id] = doc.to_dict().get("raw_feedback")
-    except:
-        pass
-    return matches
-
-# --- SMART SCORE LOGIK ---
-
-def calculate_match_score(target_color, allowed_list):
-    if target_color in allowed_list:
-        return allowed_list.index(target_color), False
-    
-    synonyms = {
-        "Hvid": "Creme", "Creme": "Hvid",
-        "Navy": "Blå", "Blå": "Navy",
-        "Grøn": "Oliven", "Oliven": "Grøn",
-        "Rød": "Bordeaux", "Bordeaux": "Rød"
-    }
-    
-    synonym_color = synonyms.get(target_color)
-    if synonym_color and synonym_color in allowed_list:
-        base_score = allowed_list.index(synonym_color)
-        return base_score + 4, True
-        
-    return None, False
+    """Hele kamphistorikken fra den synkroniserede kopi ({match_id: raw_feedback})."""
+    return {doc_id: data.get("raw_feedback") for doc_id, data in get_synced_docs("ai_match_cache").items()}
 
-def calculate_shade_bonus(outfit_items):
-    shade_values = {"Lys": 1, "Mellem": 2, "Mørk": 3}
-    shades = {}
-    
-    for item in outfit_items:
-        cat = item['analysis'].get('category')
-        shade_str = item['analysis'].get('shade', 'Mellem')
-        shades[cat] = shade_values.get(shade_str, 2)
-        
-    bonus = 0
-    if 'Top' in shades and 'Bund' in shades:
-        bonus += abs(shades['Top'] - shades['Bund'])
-    if 'Top' in shades and 'Overtøj' in shades:
-        bonus += abs(shades['Top'] - shades['Overtøj'])
-        
-    return bonus
-
-def calculate_outfit_style_score(outfit_items):
-    if len(outfit_items) < 2:
-        return 0.0
-    
-    _, _, approved_sets = load_outfit_feedback_cache()
-    outfit_ids = set([item['id'] for item in outfit_items])
-    is_outfit_approved = False
-    for a_set in approved_sets:
-        if outfit_ids.issubset(a_set):
-            is_outfit_approved = True
-            break
-    
-    total_score = 0
-    pair_count = 0
-    items_list = list(outfit_items)
-    
-    for i in range(len(items_list)):
-        for j in range(i + 1, len(items_list)):
-            item1 = items_list[i]
-            item2 = items_list[j]
-            
-            data1 = item1['analysis']
-            data2 = item2['analysis']
-            
-            allowed1 = data1['compatibility'].get(data2['category'], [])
-            allowed2 = data2['compatibility'].get(data1['category'], [])
-            
-            score1, _ = calculate_match_score(data2['primary_color'], allowed1)
-            score2, _ = calculate_match_score(data1['primary_color'], allowed2)
-            
-            if score1 is not None and score2 is not None:
-                total_score += (score1 + score2)
-            else:
-                if is_outfit_approved:
-                    total_score += 3
-                else:
-                    total_score += 10
-            
-            pair_count += 1
-                
-    if pair_count == 0:
-        return 0.0
-        
-    base_avg = total_score / pair_count
-    shade_bonus = calculate_shade_bonus(outfit_items)
-    
-    return round(base_avg - shade_bonus, 1)
+@st.cache_resource
+def load_match_index():
+    """Kamphistorikken parset én gang til {(base_outfit_id, kategori): {"beaten_by": {vinder: tabere}, "feedback": {vinder: svar}}}."""
+    return build_match_index(load_match_cache())
 
-def calculate_smart_score(item, color_score, weather_data):
-    weather_penalty = 0
-    item_avg = item.get('avg_temp')
-    current_avg = weather_data.get('avg_feels_like_10h')
-    
-    if item_avg is not None and current_avg is not None:
-        diff = abs(current_avg - item_avg)
-        weather_penalty = diff * TEMP_PENALTY_FACTOR
-    
-    total_score = color_score + weather_penalty
-    return total_score, weather_penalty
+@st.cache_resource
+def load_preference_model():
+    """Bradley-Terry modellen trænet på hele kamphistorikken (holdes opdateret af synkroniseringen)."""
+    return build_preference_model(load_match_cache())
 
 # --- HOVED LOGIK ---
 
-@st.cache_data(ttl=600)
+@span("garderobe: indlæs")
 def load_wardrobe():
+    """Garderoben fra den synkroniserede kopi (ingen Firestore-læsninger)."""
     items = []
-    try:
-        docs = db.collection("wardrobe").stream()
-        for doc in docs:
-            item = doc.to_dict()
-            item['id'] = doc.id
-            items.append(item)
-    except Exception as e:
-        st.error(f"Fejl ved hentning af data: {e}")
+    for doc_id, data in get_synced_docs("wardrobe").items():
+        item = dict(data)
+        item['id'] = doc_id
+        items.append(item)
     return items
 
-def get_items_by_category(items, category):
-    return [i for i in items if i['analysis']['category'] == category]
-
-def check_compatibility_basic(candidate, current_outfit):
-    if not current_outfit:
-        return True, 0, False
+def get_image_url(item, display_width):
+    """Vælger den mindste billedvariant der er mindst display_width bred (ellers det fulde billede)."""
+    variants = item.get('image_variants') or {}
+    fitting = sorted((int(width), url) for width, url in variants.items() if int(width) >= display_width)
+    return fitting[0][1] if fitting else item['image_path']
 
-    total_color_score = 0
-    is_valid = True
-    is_synonym_match = False
-
-    for selected_item in current_outfit:
-        cand_data = candidate['analysis']
-        sel_data = selected_item['analysis']
-        
-        cand_cat = cand_data['category']
-        sel_cat = selected_item['analysis']['category']
-        
-        cand_color = cand_data['primary_color']
-        sel_color = sel_data['primary_color']
-
-        allowed_by_selected = sel_data['compatibility'].get(cand_cat, [])
-        allowed_by_candidate = cand_data['compatibility'].get(sel_cat, [])
-
-        score1, syn1 = calculate_match_score(cand_color, allowed_by_selected)
-        score2, syn2 = calculate_match_score(sel_color, allowed_by_candidate)
-
-        if score1 is not None and score2 is not None:
-            total_color_score += (score1 + score2)
-            if syn1 or syn2:
-                is_synonym_match = True
-        else:
-            is_valid = False
-    
-    return is_valid, total_color_score, is_synonym_match
-
-def check_dead_end(candidate, current_outfit, wardrobe):
-    temp_outfit = current_outfit + [candidate]
-    filled_cats = {item['analysis']['category'] for item in temp_outfit}
-    missing_cats = [c for c in CATEGORIES if c not in filled_cats]
-    
-    for missing_cat in missing_cats:
-        potential_items = get_items_by_category(wardrobe, missing_cat)
-        if not potential_items:
-            continue
-        found_match = False
-        for potential_item in potential_items:
-            is_valid, _, _ = check_compatibility_basic(potential_item, temp_outfit)
-            if is_valid:
-                found_match = True
-                break 
-        if not found_match:
-            return True
-    return False
+@st.cache_resource(max_entries=2)
+@span("rangering: byg indeks")
+def load_compatibility_index(wardrobe_revision, _wardrobe):
+    """Kompatibilitets-indekset fra engine.py. Bygges kun igen, når garderoben har ændret sig. Nøglen er den synkroniserede
+    kopis revision, som også tælles op, når et eksisterende stykke tøj får ny analyse (samme ID)."""
+    return build_compatibility_bitsets(build_compatibility_index(_wardrobe))
 
 # --- UI SETUP ---
 st.set_page_config(page_title="Garderoben", page_icon="👔", layout="wide")
 
+# Tidsmåling af dette rerun (tracing.py). Et rerun, der sluttede med st.rerun(), st.stop() eller en fejl,
+# nåede ikke bunden af scriptet, så det afsluttes her i stedet - med sluttid fra seneste span
+finish_trace(st.session_state.get("trace"), interrupted=True)
+st.session_state.trace = start_trace("app")
+
 st.markdown("""
 <style>
     .stButton>button { width: 100%; border-radius: 12px; height: auto; min-height: 3em; }
@@ -663,6 +1036,11 @@ with st.sidebar:
         </small>
         """, unsafe_allow_html=True)
 
+    suggest_mode = st.toggle("✨ Foreslå hele outfits", value=st.session_state.get('suggest_mode', False))
+    st.session_state.suggest_mode = suggest_mode
+    if suggest_mode:
+        suggestion_count = st.slider("Antal forslag", min_value=1, max_value=10, value=5)
+
 st.title("Dagens Outfit")
 
 # Håndter og vis AI-beskeder fra forrige "Spørg Stylist" / "Bedøm Outfit" handling
@@ -678,14 +1056,44 @@ if "ai_msg" in st.session_state:
         st.info(f"**Stylisten siger:**\n\n{msg['text']}")
     del st.session_state.ai_msg
 
+if "image_fetch_errors" in st.session_state:
+    failed_list = "\n".join(f"- {error}" for error in st.session_state.image_fetch_errors)
+    st.warning(f"**Nogle billeder kunne ikke hentes og blev ikke vist til stylisten:**\n\n{failed_list}")
+    del st.session_state.image_fetch_errors
+
+if st.session_state.get("pending_save", {}).get("done"):
+    if st.session_state.pending_save["error"]:
+        st.error(f"Outfittet blev ikke gemt: {st.session_state.pending_save['error']}")
+    del st.session_state.pending_save
+
+sync_collections()
+offline = is_offline()
+if offline:
+    st.warning("⚠️ Firestore kan ikke nås – viser den lokale kopi. Bedømmelser og gemning er slået fra, indtil forbindelsen er tilbage.")
+
+# Revisionen læses før garderoben: ændres den imens, bygges indekset bare igen ved næste rerun
+wardrobe_revision = get_synced_state()["collections"]["wardrobe"]["revision"]
 wardrobe = load_wardrobe()
 if not wardrobe:
     st.info("Databasen er tom. Tilføj tøj via admin.py.")
     st.stop()
 
+compat_index = load_compatibility_index(wardrobe_revision, wardrobe)
+
 if 'outfit' not in st.session_state:
     st.session_state.outfit = {} 
 
+# Tøj i outfittet, som ikke længere er i garderoben (fx fra startkopien wardrobe.json, som synkroniseringen har
+# erstattet, eller slettet/flyttet i admin.py), fjernes. Resten erstattes med den aktuelle version af dokumentet
+wardrobe_by_id = {item['id']: item for item in wardrobe}
+current_outfit = {
+    cat: wardrobe_by_id[item['id']] for cat, item in st.session_state.outfit.items()
+    if item['id'] in wardrobe_by_id and wardrobe_by_id[item['id']]['analysis'].get('category') == cat
+}
+if len(current_outfit) < len(st.session_state.outfit):
+    st.toast("Noget af det valgte tøj findes ikke længere i garderoben og er fjernet fra outfittet.", icon="🔄")
+st.session_state.outfit = current_outfit
+
 if st.sidebar.button("🗑️ Nulstil Outfit"):
     st.session_state.outfit = {}
     st.rerun()
@@ -699,7 +1107,7 @@ if selected_cats:
         item = st.session_state.outfit[cat]
         data = item['analysis']
         with cols[i]:
-            st.image(item['image_path'], width=175)
+            st.image(get_image_url(item, OUTFIT_IMAGE_WIDTH), width=OUTFIT_IMAGE_WIDTH)
             shade_info = f"({data.get('shade', 'Mellem')} {data.get('primary_color', '')})"
             st.caption(f"✅ {data['display_name']} {shade_info}")
             if st.button("Fjern", key=f"del_{cat}"):
@@ -710,6 +1118,31 @@ else:
 
 st.divider()
 
+# --- FORSLAG TIL HELE OUTFITS ---
+if suggest_mode:
+    st.subheader("✨ Forslag til hele outfits")
+    _, sugg_rejected, sugg_approved_index = load_outfit_feedback_cache()
+    with span("rangering: hele outfits"):
+        suggestions = suggest_complete_outfits(compat_index, wardrobe, weather_data, sugg_approved_index["sets"], sugg_rejected, load_ai_overrides(), k=suggestion_count)
+    
+    if not suggestions:
+        st.warning("Kunne ikke finde et komplet outfit hvor alle farver passer sammen.")
+    
+    for n, suggestion in enumerate(suggestions):
+        status = " ✅" if suggestion['is_approved'] else (" ❌" if suggestion['is_rejected'] else "")
+        st.markdown(f"**#{n + 1} · Score {suggestion['score']:.1f}**{status} &nbsp;(Stil {suggestion['style_score']:.1f} + Vejr {suggestion['weather_penalty']:.1f})")
+        sugg_cols = st.columns(len(suggestion['items']) + 1)
+        for col, item in zip(sugg_cols, suggestion['items']):
+            with col:
+                st.image(get_image_url(item, SUGGESTION_IMAGE_WIDTH), width=SUGGESTION_IMAGE_WIDTH)
+                st.caption(item['analysis'].get('display_name', ''))
+        with sugg_cols[-1]:
+            if st.button("Brug outfit", key=f"use_suggestion_{n}"):
+                st.session_state.outfit = {item['analysis']['category']: item for item in suggestion['items']}
+                st.rerun()
+    
+    st.divider()
+
 # --- VÆLGER-SEKTION ---
 missing_cats = [c for c in CATEGORIES if c not in st.session_state.outfit]
 
@@ -724,7 +1157,7 @@ if st.session_state.outfit:
     is_approved_before = current_outfit_id in approved_cache
     is_rejected_before = current_outfit_id in rejected_cache
     
-    style_score = calculate_outfit_style_score(st.session_state.outfit.values())
+    style_score = calculate_outfit_style_score(st.session_state.outfit.values(), load_outfit_feedback_cache()[2])
     
     hist_score = get_global_style_stats()
     hist_text = f"Historisk Stil Score: {hist_score:.1f}" if hist_score is not None else "Historisk Stil Score: --"
@@ -753,7 +1186,7 @@ if st.session_state.outfit:
     btn_col1, btn_col2 = st.columns(2)
     
     with btn_col1:
-        if st.button("🔮 Bedøm Outfit", type="secondary", use_container_width=True):
+        if st.button("🔮 Bedøm Outfit", type="secondary", use_container_width=True, disabled=offline):
             
             # Find ud af, om brugeren har sat flueben ved nogen kandidater
             cand_dicts = []
@@ -765,45 +1198,31 @@ if st.session_state.outfit:
                     cand_cat = cat
                     
             base_outfit_items = list(st.session_state.outfit.values())
+            selected_cand_dicts = list(cand_dicts)
             
             if len(cand_dicts) > 0:
                 # --- KANDIDAT-TILSTAND ---
                 match_id = get_match_cache_id(base_outfit_items, cand_cat, cand_dicts)
-                raw_feedback = get_cached_match(match_id)
+                raw_feedback = get_cached_verdict(base_outfit_items, cand_dicts, is_approved_before) or get_cached_match(match_id)
                 
                 if raw_feedback:
                     st.toast("Genbruger tidligere AI-vurdering for præcis denne kamp!", icon="⚡")
                 else:
                     # --- NY ELIMINERINGS-LOGIK ---
-                    matches = load_match_cache()
                     base_id = get_outfit_id(base_outfit_items) if base_outfit_items else "empty"
-                    prefix = f"{base_id}_{cand_cat}_"
+                    match_entry = load_match_index().get((base_id, cand_cat), {})
                     
                     eliminated_ids = set()
-                    current_ids = [c['id'] for c in cand_dicts]
+                    current_ids = {c['id'] for c in cand_dicts}
                     last_winning_feedback = None
                     
-                    for m_id, feedback in matches.items():
-                        if m_id.startswith(prefix):
-                            cand_part = m_id[len(prefix):]
-                            past_cand_ids = cand_part.split('_')
-                            
-                            winner_id = None
-                            match = re.search(r'✅\s*VINDER:\s*([A-Za-z0-9_-]+)', feedback, re.IGNORECASE)
-                            if match:
-                                winner_id = match.group(1).strip()
-                            else:
-                                for cid in past_cand_ids:
-                                    if f"VINDER: {cid}" in feedback:
-                                        winner_id = cid
-                                        break
-                            
-                            # Hvis en tidligere vinder er valgt nu, slår den sine tidligere tabere ud
-                            if winner_id and winner_id in current_ids:
-                                for cid in past_cand_ids:
-                                    if cid != winner_id and cid in current_ids:
-                                        eliminated_ids.add(cid)
-                                        last_winning_feedback = feedback
+                    # Hvis en tidligere vinder er valgt nu, slår den sine tidligere tabere ud
+                    for winner_id, beaten_ids in match_entry.get("beaten_by", {}).items():
+                        if winner_id in current_ids:
+                            beaten_now = (beaten_ids & current_ids) - {winner_id}
+                            if beaten_now:
+                                eliminated_ids |= beaten_now
+                                last_winning_feedback = match_entry["feedback"][winner_id]
                     
                     if eliminated_ids:
                         cand_dicts = [c for c in cand_dicts if c['id'] not in eliminated_ids]
@@ -811,14 +1230,36 @@ if st.session_state.outfit:
                         
                         # Tjek cache IGEN med de overlevende kandidater
                         match_id = get_match_cache_id(base_outfit_items, cand_cat, cand_dicts)
-                        raw_feedback = get_cached_match(match_id)
+                        raw_feedback = get_cached_verdict(base_outfit_items, cand_dicts, is_approved_before) or get_cached_match(match_id)
                         
                         if raw_feedback:
                             st.toast("Fandt et gemt resultat for de overlevende kandidater!", icon="⚡")
                         elif len(cand_dicts) == 1 and last_winning_feedback:
-                            raw_feedback = last_winning_feedback
+                            raw_feedback = match_entry["feedback"].get(cand_dicts[0]['id'], last_winning_feedback)
                             st.toast("Kun 1 kandidat overlevede elimineringen!", icon="🏆")
 
+                    # --- PRÆFERENCE-MODEL (spring AI over eller skær ned til top 2) ---
+                    if not raw_feedback and len(cand_dicts) > 1:
+                        ranked = rank_by_preference(load_preference_model(), base_id, cand_cat, [c['id'] for c in cand_dicts])
+                        leader_id = ranked[0][0]
+                        leader_confidence = preference_confidence(ranked)
+                        leader_outfit_id = get_outfit_id(base_outfit_items + [c for c in cand_dicts if c['id'] == leader_id])
+                        
+                        if leader_confidence >= PREFERENCE_CONFIDENCE and leader_outfit_id in approved_cache:
+                            # Modellen er sikker, og det samlede outfit er allerede bedømt - intet AI-kald nødvendigt
+                            raw_feedback = (
+                                f"✅ VINDER: {leader_id}\n"
+                                f"BEGRUNDELSE_VALG: Forudsagt ud fra tidligere kampe ({leader_confidence:.0%} sikkerhed).\n"
+                                f"OUTFIT_BEDØMMELSE: {approved_cache[leader_outfit_id]}"
+                            )
+                            st.toast(f"Præference-modellen er {leader_confidence:.0%} sikker - sprang AI over!", icon="📈")
+                        elif len(cand_dicts) > 2 and preference_confidence(ranked, leader_pos=1) >= PREFERENCE_CONFIDENCE:
+                            top_ids = {cid for cid, _ in ranked[:2]}
+                            cand_dicts = [c for c in cand_dicts if c['id'] in top_ids]
+                            match_id = get_match_cache_id(base_outfit_items, cand_cat, cand_dicts)
+                            raw_feedback = get_cached_verdict(base_outfit_items, cand_dicts, is_approved_before) or get_cached_match(match_id)
+                            st.toast("Præference-modellen skar kampen ned til de 2 stærkeste kandidater.", icon="✂️")
+
                     # --- AI KALD (hvis stadig nødvendigt) ---
                     if not raw_feedback:
                         with st.spinner(f"Stylisten vurderer dit fundament og de {len(cand_dicts)} kandidater..."):
@@ -826,7 +1267,6 @@ if st.session_state.outfit:
                             # Gem resultatet, hvis det ikke var en fejl
                             if "AI Fejl:" not in raw_feedback and "⚠️" not in raw_feedback:
                                 save_match_cache(match_id, raw_feedback)
-                                load_match_cache.clear() # Ryd cachen så næste tryk har nyeste data
 
                 if "❌ FUNDAMENT AFVIST" in raw_feedback.upper():
                     display_feedback = raw_feedback
@@ -835,7 +1275,6 @@ if st.session_state.outfit:
                         display_feedback = display_feedback.replace(cand['id'], c_name)
                     # Gemmer KUN base_outfit_items
                     save_rejected_outfit(base_outfit_items, display_feedback)
-                    load_outfit_feedback_cache.clear()
                     st.session_state.ai_msg = {"type": "error", "text": display_feedback}
                     
                 elif "❌ INGEN VINDER" in raw_feedback.upper():
@@ -844,7 +1283,6 @@ if st.session_state.outfit:
                         c_name = cand['analysis'].get('display_name', 'Ukendt')
                         display_feedback = display_feedback.replace(cand['id'], c_name)
                     save_approved_outfit(base_outfit_items, "Godkendt base, men ingen kandidater passede.")
-                    load_outfit_feedback_cache.clear()
                     st.session_state.ai_msg = {"type": "warning", "text": display_feedback}
                     
                 elif "✅ VINDER:" in raw_feedback.upper() or "✅" in raw_feedback:
@@ -906,7 +1344,7 @@ if st.session_state.outfit:
                         
                         for cand in cand_dicts:
                             # Udregn den rene score først
-                            pure_score = calculate_outfit_style_score(base_outfit_items + [cand])
+                            pure_score = calculate_outfit_style_score(base_outfit_items + [cand], load_outfit_feedback_cache()[2])
                             
                             # Tjek om kandidaten allerede har en override-score for dette base-outfit
                             cand_current_score = cat_overrides.get(cand['id'], pure_score)
@@ -926,7 +1364,6 @@ if st.session_state.outfit:
                             
                         # ALTID gem vinderen i databasen, så den registreres officielt og udløser 👑 ikonet
                         save_ai_override(base_outfit_items, cand_cat, winner_id, new_score)
-                        load_ai_overrides.clear()
                         
                         # 4. Tilføj vinderen til UI
                         st.session_state.outfit[cand_cat] = winner_item
@@ -934,7 +1371,6 @@ if st.session_state.outfit:
                         # 5. GEM KUN DEN RENE BEDØMMELSE I DATABASEN (Samlet Outfit)
                         combined_outfit = base_outfit_items + [winner_item]
                         save_approved_outfit(combined_outfit, outfit_bedommelse)
-                        load_outfit_feedback_cache.clear()
                         
                         # 6. Lav pæn besked til brugeren med begge dele
                         display_msg = f"**Hvorfor den vandt:** {begrundelse_valg}\n\n**Samlet bedømmelse:** {outfit_bedommelse}"
@@ -944,7 +1380,7 @@ if st.session_state.outfit:
                         st.session_state.ai_msg = {"type": "warning", "text": f"Kunne ikke finde vinder-ID'et i svaret:\n\n{raw_feedback}"}
                 
                 # Fjern flueben, så de ikke hænger fast til næste gang
-                for cand in cand_dicts:
+                for cand in selected_cand_dicts:
                     st.session_state[f"cand_{cand_cat}_{cand['id']}"] = False
                 
                 st.rerun()
@@ -960,17 +1396,13 @@ if st.session_state.outfit:
                         save_rejected_outfit(base_outfit_items, feedback)
                         st.session_state.ai_msg = {"type": "info", "text": feedback}
                     
-                    load_outfit_feedback_cache.clear()
                     st.rerun()
 
     with btn_col2:
-        if st.button("✅ Gem & Bær", type="primary", use_container_width=True):
+        if st.button("✅ Gem & Bær", type="primary", use_container_width=True, disabled=offline):
             if weather_data:
-                with st.spinner("Gemmer og opdaterer tøj-statistik..."):
-                    save_outfit_to_history(list(st.session_state.outfit.values()), weather_data, city, style_score)
-                    update_global_style_stats(style_score)
-                    load_wardrobe.clear()
-                    
+                # Gemmes i baggrunden; resultatet vises ved et senere rerun
+                st.session_state.pending_save = save_outfit_to_history(list(st.session_state.outfit.values()), weather_data, city, style_score)
                 st.toast(f"Gemt! Din score på {style_score} er nu en del af historikken.", icon="📈")
                 st.rerun()
             else:
@@ -980,112 +1412,18 @@ if missing_cats:
     st.subheader("Vælg næste del:")
     tabs = st.tabs([CATEGORY_LABELS[c] for c in missing_cats])
     
-    approved_cache, rejected_cache, approved_sets = load_outfit_feedback_cache()
+    approved_cache, rejected_cache, approved_index = load_outfit_feedback_cache()
     ai_overrides = load_ai_overrides()
     
     for i, cat in enumerate(missing_cats):
         with tabs[i]:
             all_items = get_items_by_category(wardrobe, cat)
-            valid_items_with_score = []
             current_selection_list = list(st.session_state.outfit.values())
-            
-            current_ids = [item['id'] for item in current_selection_list]
-            base_outfit_id = get_outfit_id(current_selection_list) if current_selection_list else "empty"
-            
-            # Find alle overrides og udnævn den forsvarende mester
-            override_key = f"{base_outfit_id}_{cat}"
-            cat_overrides = ai_overrides.get(override_key, {})
-            
-            champion_id = None
-            loser_ids = set()
-            
-            if cat_overrides:
-                # Mesteren er den med det absolut laveste pointtal (værdi) for denne base/kategori
-                champion_id = min(cat_overrides, key=cat_overrides.get)
-                
-                # NYT: Find alle tabere til denne mester fra historikken
-                matches = load_match_cache()
-                prefix = f"{base_outfit_id}_{cat}_"
-                for m_id, feedback in matches.items():
-                    if m_id.startswith(prefix):
-                        cand_part = m_id[len(prefix):]
-                        past_cand_ids = cand_part.split('_')
-                        
-                        winner_id = None
-                        match_winner = re.search(r'✅\s*VINDER:\s*([A-Za-z0-9_-]+)', feedback, re.IGNORECASE)
-                        if match_winner:
-                            winner_id = match_winner.group(1).strip()
-                        else:
-                            for cid in past_cand_ids:
-                                if f"VINDER: {cid}" in feedback:
-                                    winner_id = cid
-                                    break
-                        
-                        # Hvis vores mester vandt denne specifikke kamp, så er de andre tabere
-                        if winner_id == champion_id:
-                            for cid in past_cand_ids:
-                                if cid != champion_id:
-                                    loser_ids.add(cid)
-
-            # 1. Beregninger
-            for item in all_items:
-                is_valid, color_score, is_synonym = check_compatibility_basic(item, current_selection_list)
-                _, weather_penalty = calculate_smart_score(item, color_score, weather_data)
-                
-                temp_outfit = current_selection_list + [item]
-                
-                # Den oprindelige viste score (baseret rent på stil)
-                projected_style_score = calculate_outfit_style_score(temp_outfit)
-                
-                candidate_set = set(current_ids + [item['id']])
-                
-                is_part_of_success = False
-                for a_set in approved_sets:
-                    if candidate_set.issubset(a_set):
-                        is_part_of_success = True
-                        break
-                
-                cand_id_list = sorted(list(candidate_set))
-                cand_id_str = "_".join(cand_id_list)
-                is_rejected_exact = cand_id_str in rejected_cache
-
-                is_dead_end = False
-                if st.session_state.outfit:
-                    is_dead_end = check_dead_end(item, current_selection_list, wardrobe)
-                
-                # Hvis genstanden er en af de gemte vindere for dette outfit, overskriv dens score!
-                if item['id'] in cat_overrides:
-                    projected_style_score = float(cat_overrides[item['id']])
-                
-                # Tjek om vi er the reigning champion
-                is_champion = False
-                if champion_id and item['id'] == champion_id:
-                    is_champion = True
-                    
-                # NYT: Tjek om den er en taber til mesteren
-                is_loser = item['id'] in loser_ids
-                
-                # Sortering er nu defineret som: Synlig Pointscore + Vejrpoint
-                smart_score = projected_style_score + weather_penalty
-                
-                # Tilføj andre bonus/straf til den endelige sorteringsscore
-                is_strict_incompatible = False
-                if not is_valid:
-                    if is_part_of_success:
-                        smart_score += 3 
-                    else:
-                        smart_score += 1000
-                        is_strict_incompatible = True
-                        
-                if is_part_of_success:
-                    smart_score -= SUCCESS_BONUS
-                
-                if is_rejected_exact:
-                    smart_score += REJECTION_PENALTY
-                    
-                valid_items_with_score.append((smart_score, item, color_score, weather_penalty, is_synonym, is_part_of_success, is_rejected_exact, is_dead_end, projected_style_score, is_strict_incompatible, is_champion, is_loser))
-            
-            valid_items_with_score.sort(key=lambda x: x[0])
+            with span(f"rangering: {cat}"):
+                valid_items_with_score = rank_category(
+                    compat_index, all_items, current_selection_list, cat, weather_data,
+                    approved_index, rejected_cache, ai_overrides, load_match_index()
+                )
             
             if not valid_items_with_score:
                 st.error(f"Ingen {CATEGORY_LABELS[cat].lower()} tilgængelig!")
@@ -1095,7 +1433,7 @@ if missing_cats:
                         img_cols = st.columns(3)
                     
                     with img_cols[idx % 3]:
-                        st.image(item['image_path'], use_container_width=True)
+                        st.image(get_image_url(item, GRID_IMAGE_WIDTH), use_container_width=True)
                         data = item['analysis']
                         name = data['display_name']
                         shade_str = f"({data.get('shade', 'Mellem')} {data.get('primary_color', '')})"
@@ -1168,4 +1506,15 @@ if missing_cats:
                         st.write("Disse farver passer:")
                         st.markdown(" ".join([f"`{color} ({score})`" for color, score in color_scores]))
                     else:
-                        st.warning("Ingen farve passer!")
\ No newline at end of file
+                        st.warning("Ingen farve passer!")
+
+# --- DEBUG: TIDSFORBRUG ---
+finish_trace(st.session_state.trace)
+if st.sidebar.toggle("🐞 Vis tidsforbrug", key="show_trace"):
+    with st.sidebar.expander("Tidsforbrug", expanded=True):
+        st.markdown(format_trace(st.session_state.trace))
+        background = [trace for trace in recent_traces() if trace["name"] != "app"][:5]
+        if background:
+            st.caption("Seneste baggrundsjob:")
+            for trace in background:
+                st.markdown(format_trace(trace))
\ No newline at end of file
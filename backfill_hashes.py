@@ -0,0 +1,109 @@
+# Engangs-backfill: beregner dHash for alt tøj i Firestore, der mangler den, og viser mulige dubletter.
+# Billederne findes i img/ ud fra filnavnet; med --download hentes de der mangler lokalt fra image_path.
+#
+#   python backfill_hashes.py --dry-run
+#   python backfill_hashes.py --download
+import argparse
+import io
+import os
+import requests
+import firebase_admin
+from firebase_admin import credentials, firestore
+from PIL import Image
+from image_tools import pad_to_square, compute_dhash, build_hash_index, find_similar
+
+# --- KONFIGURATION ---
+KEY_FILE = "firestore_key.json"
+IMAGE_DIR = "img"
+IMAGE_TYPES = (".jpg", ".jpeg", ".png", ".webp")
+DUPLICATE_MAX_DISTANCE = 4
+HTTP_TIMEOUT = 15
+# Firestore tillader højst 500 operationer pr. batch
+BATCH_SIZE = 400
+
+def hash_local_images(image_dir):
+    """{filnavn: dhash} for alle billeder i mappen (kun øverste niveau - undermapperne er varianter)."""
+    hashes = {}
+    for name in sorted(os.listdir(image_dir)):
+        if not name.lower().endswith(IMAGE_TYPES):
+            continue
+        try:
+            with Image.open(os.path.join(image_dir, name)) as image:
+                hashes[name] = compute_dhash(pad_to_square(image))
+        except Exception as e:
+            print(f"Kunne ikke læse {name}: {e}")
+    return hashes
+
+def hash_remote_image(url):
+    response = requests.get(url, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    with Image.open(io.BytesIO(response.content)) as image:
+        return compute_dhash(pad_to_square(image))
+
+def main():
+    parser = argparse.ArgumentParser(description="Beregn dHash for garderoben i Firestore og find mulige dubletter.")
+    parser.add_argument("--image-dir", default=IMAGE_DIR)
+    parser.add_argument("--download", action="store_true", help="hent billeder der ikke findes lokalt fra image_path")
+    parser.add_argument("--dry-run", action="store_true", help="skriv ikke til Firestore")
+    parser.add_argument("--max-distance", type=int, default=DUPLICATE_MAX_DISTANCE)
+    args = parser.parse_args()
+
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(KEY_FILE))
+    db = firestore.client()
+
+    local_hashes = hash_local_images(args.image_dir)
+    print(f"{len(local_hashes)} billeder i {args.image_dir}/")
+
+    updates = {}
+    entries = []
+    missing = []
+    for doc in db.collection("wardrobe").stream():
+        item = doc.to_dict()
+        name = item.get("analysis", {}).get("display_name", item.get("filename"))
+        dhash = item.get("dhash")
+        if not dhash:
+            dhash = local_hashes.get(item.get("filename"))
+            if not dhash and args.download and item.get("image_path", "").startswith("http"):
+                try:
+                    dhash = hash_remote_image(item["image_path"])
+                except Exception as e:
+                    print(f"Kunne ikke hente {item['image_path']}: {e}")
+            if dhash:
+                updates[doc.id] = dhash
+            else:
+                missing.append(name)
+        if dhash:
+            entries.append((dhash, f"{name} [{doc.id}]"))
+
+    # Mulige dubletter: hvert par vises én gang
+    index = build_hash_index(entries)
+    seen = set()
+    for dhash, label in entries:
+        for distance, other in find_similar(index, dhash, args.max_distance):
+            pair = tuple(sorted((label, other)))
+            if other != label and pair not in seen:
+                seen.add(pair)
+                print(f"Mulig dublet ({distance} bit): {pair[0]}  <->  {pair[1]}")
+
+    print(f"{len(updates)} dokumenter får en dHash, {len(missing)} mangler stadig et billede")
+    for name in missing:
+        print(f"  - {name}")
+    if args.dry_run or not updates:
+        return
+
+    doc_ids = list(updates)
+    for start in range(0, len(doc_ids), BATCH_SIZE):
+        batch = db.batch()
+        for doc_id in doc_ids[start:start + BATCH_SIZE]:
+            batch.update(db.collection("wardrobe").document(doc_id), {
+                "dhash": updates[doc_id],
+                "updated_at": firestore.SERVER_TIMESTAMP
+            })
+        # Tæl garderobens generation op, så app.py henter de opdaterede dokumenter
+        batch.set(db.collection("stats").document("sync_versions"), {"wardrobe": firestore.Increment(1)}, merge=True)
+        batch.commit()
+    print("Færdig.")
+
+if __name__ == "__main__":
+    main()
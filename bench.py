@@ -0,0 +1,299 @@
+# Benchmark af rangeringen i engine.py på syntetiske garderober (100 til 5.000 stykker tøj, med --large op til 50.000).
+# Garderoben følger base_schema fra admin.py, og historikken (godkendte/afviste outfits, kampe og AI-overrides)
+# bygges med de samme funktioner, som app.py bruger på den synkroniserede kopi - altså ingen Firestore.
+#
+#   python bench.py
+#   python bench.py --sizes 100 1000 --repeat 5 --output bench_results.json
+#   python bench.py --large                             (også 20.000 og 50.000 - kræver flere GB hukommelse)
+#   python bench.py --baseline bench_results.json      (exit code 1 ved regressioner)
+# Kontrollerer også, at præference-modellen bliver ens ved genopbygning og ved trinvis læring (exit code 1 ellers).
+import argparse
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import numpy as np
+from engine import (
+    CATEGORIES, ALLOWED_COLORS, get_outfit_id, build_outfit_feedback, build_ai_overrides, build_match_index,
+    build_preference_model, learn_preference_matches,
+    calculate_outfit_style_score, get_items_by_category, check_compatibility_basic, check_dead_end,
+    build_compatibility_index, build_compatibility_bitsets, rank_category, suggest_complete_outfits
+)
+
+# --- KONFIGURATION ---
+DEFAULT_SIZES = [100, 1000, 5000]
+# Kun med --large: indekset og historikken fylder flere GB ved 50.000
+LARGE_SIZES = [20000, 50000]
+DEFAULT_REPEAT = 3
+SEED = 42
+# Hvor mange tilfældige outfits der måles pr. antal valgte stykker tøj
+OUTFIT_SAMPLES = 5
+# Den skalare sti (check_compatibility_basic m.fl.) måles kun op til denne størrelse - den er O(n) i Python pr. fane
+SCALAR_MAX_SIZE = 5000
+# Den oprindelige check_dead_end er O(n²) pr. fane, så den måles kun op til denne størrelse
+LEGACY_DEAD_END_MAX_SIZE = 1000
+# Forslag til hele outfits (branch-and-bound) måles kun op til denne størrelse
+SUGGEST_MAX_SIZE = 1000
+# En måling er en regression, hvis den er så meget langsommere end baseline
+REGRESSION_FACTOR = 1.25
+
+# Fordeling af kategorier i en typisk garderobe
+CATEGORY_WEIGHTS = {"Top": 0.3, "Bund": 0.2, "Strømper": 0.15, "Sko": 0.15, "Overtøj": 0.2}
+TYPES = {
+    "Top": ["T-shirt", "Polo", "Skjorte", "Strik", "Sweatshirt", "Vest"],
+    "Bund": ["Jeans", "Chinos", "Habitbukser", "Sweatpants", "Shorts"],
+    "Strømper": ["Dress", "Sport", "Uld"],
+    "Sko": ["Sneakers", "Støvler", "Pæne Sko", "Loafers"],
+    "Overtøj": ["Jakke", "Frakke", "Blazer", "Cardigan", "Overshirt"],
+}
+SHADES = ["Lys", "Mellem", "Mørk"]
+PATTERNS = ["Solid", "Struktur", "Mønster"]
+
+# Syntetisk historik pr. stykke tøj i garderoben
+APPROVED_PER_ITEM = 0.5
+REJECTED_PER_ITEM = 0.2
+MATCHES_PER_ITEM = 0.3
+# Andel af kampene uden vinder ("INGEN VINDER")
+NO_WINNER_SHARE = 0.1
+# Kampe pr. delta-synkronisering, når præference-modellen læres trinvist i kontrollen
+PREFERENCE_SYNC_BATCH = 10
+
+# --- SYNTETISKE DATA ---
+
+def make_item(rng, number, category=None):
+    """Ét stykke tøj med samme felter som base_schema i admin.py (tilfældig kategori, hvis ingen er givet)."""
+    category = category or rng.choices(list(CATEGORY_WEIGHTS), weights=list(CATEGORY_WEIGHTS.values()))[0]
+    primary_color = rng.choice(ALLOWED_COLORS)
+    compatibility = {}
+    for target in CATEGORIES:
+        compatibility[target] = [] if target == category else rng.sample(ALLOWED_COLORS, rng.randint(3, 9))
+    return {
+        # Ingen "_" i ID'et: outfit- og kamp-ID'er splittes på "_"
+        "id": f"item{number:06d}",
+        "avg_temp": rng.choice([None, round(rng.uniform(-5, 25), 1)]),
+        "analysis": {
+            "category": category,
+            "display_name": f"{primary_color} {rng.choice(TYPES[category])}",
+            "type": rng.choice(TYPES[category]),
+            "primary_color": primary_color,
+            "shade": rng.choice(SHADES),
+            "secondary_color": rng.choice(["Ingen", "Ingen", "Ingen"] + ALLOWED_COLORS),
+            "pattern": rng.choice(PATTERNS),
+            "compatibility": compatibility
+        }
+    }
+
+def make_outfit(rng, by_category, n_items):
+    """n_items stykker tøj fra hver sin kategori (færre, hvis garderoben har færre ikke-tomme kategorier)."""
+    available = [c for c in CATEGORIES if by_category[c]]
+    categories = rng.sample(available, min(n_items, len(available)))
+    return [rng.choice(by_category[c]) for c in categories]
+
+def make_history(rng, wardrobe, by_category):
+    """Godkendte/afviste outfits, kampe og AI-overrides i samme form som dokumenterne i Firestore."""
+    n = len(wardrobe)
+    approved_docs = {}
+    rejected_docs = {}
+    for _ in range(int(n * APPROVED_PER_ITEM)):
+        approved_docs[get_outfit_id(make_outfit(rng, by_category, rng.randint(2, 5)))] = {"comment": "✅ Godkendt"}
+    for _ in range(int(n * REJECTED_PER_ITEM)):
+        rejected_docs[get_outfit_id(make_outfit(rng, by_category, rng.randint(2, 5)))] = {"comment": "❌ Afvist"}
+
+    matches = {}
+    override_docs = []
+    for _ in range(int(n * MATCHES_PER_ITEM)):
+        base = make_outfit(rng, by_category, rng.randint(0, 3))
+        base_id = get_outfit_id(base) if base else "empty"
+        missing = [c for c in CATEGORIES if by_category[c] and c not in {i['analysis']['category'] for i in base}]
+        if not missing:
+            continue
+        category = rng.choice(missing)
+        candidates = rng.sample(by_category[category], min(len(by_category[category]), rng.randint(2, 4)))
+        winner = rng.choice(candidates)
+        match_id = f"{base_id}_{category}_{'_'.join(sorted(c['id'] for c in candidates))}"
+        if rng.random() < NO_WINNER_SHARE:
+            matches[match_id] = "❌ INGEN VINDER\nBEGRUNDELSE_VALG: Syntetisk."
+            continue
+        matches[match_id] = f"✅ VINDER: {winner['id']}\nBEGRUNDELSE_VALG: Syntetisk.\nOUTFIT_BEDØMMELSE: Syntetisk."
+        override_docs.append({"base_outfit": base_id, "category": category, "winner_id": winner['id'], "new_score": round(rng.uniform(-3, 8), 1)})
+    return approved_docs, rejected_docs, matches, override_docs
+
+def replay_preference_model(rng, matches):
+    """Præference-modellen lært trinvist som i app.py's synkronisering: kampene i tilfældig rækkefølge, nogle sendt to gange."""
+    model = build_preference_model({})
+    match_ids = list(matches)
+    rng.shuffle(match_ids)
+    for start in range(0, len(match_ids), PREFERENCE_SYNC_BATCH):
+        batch = match_ids[start:start + PREFERENCE_SYNC_BATCH]
+        # Delta-synkroniseringen (>= updated_at) kan sende samme dokument igen
+        batch += match_ids[max(0, start - 1):start]
+        learn_preference_matches(model, {match_id: matches[match_id] for match_id in batch})
+    return model
+
+# --- DEN OPRINDELIGE SKALARE STI ---
+
+def _legacy_check_dead_end(candidate, current_outfit, wardrobe):
+    """Kopi af check_dead_end fra før bitsættene (kun ét skridt frem, lineær søgning), så den kan måles mod den nye."""
+    temp_outfit = current_outfit + [candidate]
+    filled_cats = {item['analysis']['category'] for item in temp_outfit}
+    missing_cats = [c for c in CATEGORIES if c not in filled_cats]
+
+    for missing_cat in missing_cats:
+        potential_items = get_items_by_category(wardrobe, missing_cat)
+        if not potential_items:
+            continue
+        found_match = False
+        for potential_item in potential_items:
+            is_valid, _, _ = check_compatibility_basic(potential_item, temp_outfit)
+            if is_valid:
+                found_match = True
+                break
+        if not found_match:
+            return True
+    return False
+
+# --- MÅLING ---
+
+def timed(func, repeat):
+    """Median af repeat kørsler i sekunder (og resultatet af sidste kørsel)."""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times), result
+
+def summarize(times):
+    times = sorted(times)
+    return {
+        "median_ms": round(statistics.median(times) * 1000, 3),
+        "max_ms": round(times[-1] * 1000, 3)
+    }
+
+def bench_size(size, repeat, seed):
+    """Alle målinger for én garderobe-størrelse. Returnerer en liste af resultat-dicts."""
+    rng = random.Random(seed + size)
+    # De første stykker tøj dækker alle kategorier, så ingen kategori er tom (fra 5 stykker tøj)
+    wardrobe = [make_item(rng, number, CATEGORIES[number] if number < len(CATEGORIES) else None) for number in range(size)]
+    by_category = {c: get_items_by_category(wardrobe, c) for c in CATEGORIES}
+    results = []
+
+    def record(name, selected, seconds, **extra):
+        entry = {"benchmark": name, "size": size, "selected": selected}
+        entry.update(seconds if isinstance(seconds, dict) else {"median_ms": round(seconds * 1000, 3)})
+        entry.update(extra)
+        results.append(entry)
+        print(json.dumps(entry, ensure_ascii=False), flush=True)
+
+    seconds, index = timed(lambda: build_compatibility_bitsets(build_compatibility_index(wardrobe)), 1)
+    record("build_index", None, seconds)
+
+    approved_docs, rejected_docs, matches, override_docs = make_history(rng, wardrobe, by_category)
+    seconds, history = timed(lambda: (
+        build_outfit_feedback(approved_docs, rejected_docs), build_ai_overrides(override_docs), build_match_index(matches)
+    ), 1)
+    (_, rejected, approved_index), ai_overrides, match_index = history
+    record("build_history", None, seconds, approved=len(approved_docs), rejected=len(rejected_docs), matches=len(matches))
+
+    seconds, model = timed(lambda: build_preference_model(matches), 1)
+    consistent = model == replay_preference_model(rng, matches)
+    record("build_preference_model", None, seconds, consistent=consistent)
+    if not consistent:
+        print(f"FEJL size={size}: præference-modellen er forskellig ved genopbygning og trinvis læring", file=sys.stderr)
+        sys.exit(1)
+
+    weather_data = {"avg_feels_like_10h": 12.0}
+    for selected in range(0, 5):
+        outfits = [make_outfit(rng, by_category, selected) for _ in range(OUTFIT_SAMPLES)]
+
+        # Hele fane-rangeringen som app.py kører den: alle manglende kategorier for det valgte outfit
+        def rank_all_tabs(outfit):
+            filled = {item['analysis']['category'] for item in outfit}
+            return [
+                rank_category(index, by_category[c], outfit, c, weather_data, approved_index, rejected, ai_overrides, match_index)
+                for c in CATEGORIES if c not in filled
+            ]
+        tab_times = [timed(lambda: rank_all_tabs(outfit), repeat)[0] for outfit in outfits]
+        record("rank_tabs", selected, summarize(tab_times))
+
+        if selected == 0 or size > SCALAR_MAX_SIZE:
+            continue
+
+        # Den skalare sti for én fane (de oprindelige funktioner, som score_candidates vektoriserer).
+        # check_dead_end er bitsæt-udgaven fra engine.py; legacy_check_dead_end er den oprindelige, den afløste
+        def first_missing(outfit):
+            filled = {item['analysis']['category'] for item in outfit}
+            return next((by_category[c] for c in CATEGORIES if c not in filled), [])
+
+        scalar = {"check_compatibility_basic": [], "calculate_outfit_style_score": [], "legacy_check_dead_end": [], "check_dead_end": []}
+        for outfit in outfits:
+            candidates = first_missing(outfit)
+            scalar["check_compatibility_basic"].append(timed(lambda: [check_compatibility_basic(c, outfit) for c in candidates], repeat)[0])
+            scalar["calculate_outfit_style_score"].append(timed(lambda: [calculate_outfit_style_score(outfit + [c], approved_index) for c in candidates], repeat)[0])
+            if size <= LEGACY_DEAD_END_MAX_SIZE:
+                scalar["legacy_check_dead_end"].append(timed(lambda: [_legacy_check_dead_end(c, outfit, wardrobe) for c in candidates], repeat)[0])
+            scalar["check_dead_end"].append(timed(lambda: [check_dead_end(c, outfit, index) for c in candidates], repeat)[0])
+        for name, times in scalar.items():
+            if times:
+                record(name, selected, summarize(times))
+
+    if size <= SUGGEST_MAX_SIZE:
+        seconds, _ = timed(lambda: suggest_complete_outfits(index, wardrobe, weather_data, approved_index["sets"], rejected, ai_overrides, k=5), repeat)
+        record("suggest_complete_outfits", None, seconds)
+    return results
+
+# --- SAMMENLIGNING ---
+
+def result_key(entry):
+    return (entry["benchmark"], entry["size"], entry["selected"])
+
+def find_regressions(results, baseline):
+    """Målinger der er mere end REGRESSION_FACTOR gange langsommere end samme måling i baseline."""
+    previous = {result_key(entry): entry for entry in baseline["results"]}
+    regressions = []
+    for entry in results:
+        old = previous.get(result_key(entry))
+        if old and old["median_ms"] > 0 and entry["median_ms"] > old["median_ms"] * REGRESSION_FACTOR:
+            regressions.append((entry, old))
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark af rangeringen på syntetiske garderober.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--large", action="store_true", help=f"mål også {', '.join(map(str, LARGE_SIZES))} (kræver flere GB hukommelse)")
+    parser.add_argument("--repeat", type=int, default=DEFAULT_REPEAT)
+    parser.add_argument("--seed", type=int, default=SEED)
+    parser.add_argument("--output", help="gem alle resultater som JSON")
+    parser.add_argument("--baseline", help="sammenlign med en tidligere --output fil")
+    args = parser.parse_args()
+
+    results = []
+    sizes = args.sizes + [size for size in LARGE_SIZES if args.large and size not in args.sizes]
+    for size in sizes:
+        results.extend(bench_size(size, args.repeat, args.seed))
+
+    report = {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "machine": platform.machine(),
+        "seed": args.seed,
+        "repeat": args.repeat,
+        "results": results
+    }
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            regressions = find_regressions(results, json.load(f))
+        for entry, old in regressions:
+            print(f"REGRESSION {entry['benchmark']} size={entry['size']} selected={entry['selected']}: "
+                  f"{old['median_ms']} ms -> {entry['median_ms']} ms", file=sys.stderr)
+        if regressions:
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
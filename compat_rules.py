@@ -0,0 +1,107 @@
+# Lokal regelmotor til farve-kompatibilitet.
+# Erstatter Senior- og Master-trinnet i admin.py: i stedet for at sende billederne til Gemini to gange mere,
+# udledes tilføjelserne fra Juniorens identifikation (kategori, primærfarve, nuance, type) og de
+# kompatibilitetslister, der allerede er kurateret i garderoben.
+
+# --- KONFIGURATION ---
+CATEGORIES = ["Top", "Bund", "Sko", "Strømper", "Overtøj"]
+ALLOWED_COLORS = ["Sort", "Hvid", "Creme", "Grå", "Navy", "Blå", "Beige", "Brun", "Grøn", "Oliven", "Rød", "Bordeaux", "Accent"]
+
+# Hvor stor en andel af lignende kurateret tøj skal have farven, før den tilføjes
+SENIOR_MIN_SUPPORT = 0.6   # Senior: alle farver over grænsen tilføjes i bunden af listen
+MASTER_MIN_SUPPORT = 0.3   # Master: højst 1 ekstra farve pr. kategori fra rest-listen
+# Hvor mange "virtuelle" eksempler det mere generelle niveau tæller som (udglatning ved få data)
+PRIOR_WEIGHT = 2.0
+
+# --- MODEL ---
+
+def get_feature_keys(analysis):
+    """Niveauerne vi lærer på, fra det mest generelle til det mest specifikke."""
+    category = analysis.get("category")
+    color = analysis.get("primary_color")
+    return {
+        "category": ("category", category),
+        "color": ("color", category, color),
+        "shade": ("shade", category, color, analysis.get("shade")),
+        "type": ("type", category, analysis.get("type")),
+    }
+
+def build_rule_model(analyses):
+    """Tæller hvor ofte hver farve står på kompatibilitetslisten for hver målkategori på hvert niveau."""
+    model = {"totals": {}, "counts": {}}
+    for analysis in analyses:
+        add_to_rule_model(model, analysis)
+    return model
+
+def add_to_rule_model(model, analysis):
+    """Lægger én kurateret analyse til tællingerne (så modellen kan opdateres uden at hente hele garderoben igen)."""
+    category = analysis.get("category")
+    if category not in CATEGORIES:
+        return
+    compatibility = analysis.get("compatibility") or {}
+    for key in get_feature_keys(analysis).values():
+        model["totals"][key] = model["totals"].get(key, 0) + 1
+        for target in CATEGORIES:
+            if target == category:
+                continue
+            for color in set(compatibility.get(target, [])):
+                if color in ALLOWED_COLORS:
+                    count_key = (key, target, color)
+                    model["counts"][count_key] = model["counts"].get(count_key, 0) + 1
+
+def _smoothed(model, key, target, color, prior):
+    n = model["totals"].get(key, 0)
+    count = model["counts"].get((key, target, color), 0)
+    return (count + PRIOR_WEIGHT * prior) / (n + PRIOR_WEIGHT)
+
+def get_color_support(model, analysis, target, color):
+    """Andel af lignende kurateret tøj, der har farven på listen for target (udglattet mod mere generelle niveauer)."""
+    keys = get_feature_keys(analysis)
+    p_category = _smoothed(model, keys["category"], target, color, 0.5)
+    p_color = _smoothed(model, keys["color"], target, color, p_category)
+    p_shade = _smoothed(model, keys["shade"], target, color, p_color)
+    if not model["totals"].get(keys["type"]):
+        return p_shade
+    p_type = _smoothed(model, keys["type"], target, color, p_category)
+    return (p_shade + p_type) / 2
+
+# --- SENIOR & MASTER ---
+
+def suggest_senior_review(model, junior_data):
+    """Samme form som Seniorens svar: Juniorens lister med sikre farver tilføjet i bunden."""
+    category = junior_data.get("category")
+    compatibility = {}
+    for target in CATEGORIES:
+        if target == category:
+            compatibility[target] = []
+            continue
+        existing = list(junior_data.get("compatibility", {}).get(target, []))
+        candidates = [c for c in ALLOWED_COLORS if c not in existing]
+        scored = sorted(((get_color_support(model, junior_data, target, c), c) for c in candidates), reverse=True)
+        compatibility[target] = existing + [c for support, c in scored if support >= SENIOR_MIN_SUPPORT]
+    return {"compatibility": compatibility}
+
+def suggest_master_additions(model, merged_data, remaining_colors):
+    """Samme form som Masterens svar: højst 1 farve pr. kategori, og kun fra rest-listen."""
+    additions = {}
+    for target, colors in remaining_colors.items():
+        scored = sorted(((get_color_support(model, merged_data, target, c), c) for c in colors), reverse=True)
+        additions[target] = [scored[0][1]] if scored and scored[0][0] >= MASTER_MIN_SUPPORT else []
+    return {"compatibility_additions": additions}
+
+# --- VALIDERING ---
+
+def compare_additions(junior_data, ai_data, rule_data):
+    """Hvor er regelmotoren og AI'en uenige om, hvilke farver der skulle tilføjes til Juniorens lister?
+    Returnerer {målkategori: {"only_ai": [...], "only_rules": [...]}} (tom hvis enige)."""
+    disagreements = {}
+    junior_compat = junior_data.get("compatibility", {})
+    for target in CATEGORIES:
+        base = set(junior_compat.get(target, []))
+        ai_added = [c for c in ai_data.get("compatibility", {}).get(target, []) if c not in base]
+        rule_added = [c for c in rule_data.get("compatibility", {}).get(target, []) if c not in base]
+        only_ai = [c for c in ai_added if c not in rule_added]
+        only_rules = [c for c in rule_added if c not in ai_added]
+        if only_ai or only_rules:
+            disagreements[target] = {"only_ai": only_ai, "only_rules": only_rules}
+    return disagreements
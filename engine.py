@@ -0,0 +1,827 @@
+# Outfit-motoren: farvescore, kompatibilitets-indeks, rangering af en fane og forslag til hele outfits.
+# Rene funktioner over garderoben og historikken (ingen Streamlit eller Firestore), så app.py kan vise
+# resultatet, bench.py kan måle det på syntetiske garderober, og rank.py kan køre det fra kommandolinjen.
+import re
+import heapq
+import math
+import numpy as np
+
+# --- KONFIGURATION ---
+CATEGORIES = ["Top", "Bund", "Strømper", "Sko", "Overtøj"]
+
+# Hvor meget skal temperatur-afvigelse straffes?
+# Formel: abs(dagens_temp - tøjets_gns) * FACTOR
+TEMP_PENALTY_FACTOR = 0.5 
+
+# Bonus for at være del af et tidligere godkendt outfit (trækkes fra scoren)
+SUCCESS_BONUS = 2
+
+# Straf for at genskabe et tidligere AFVIST outfit (lægges til scoren)
+REJECTION_PENALTY = 10
+
+# De farver AI'en må vælge imellem (samme rækkefølge som i admin.py)
+ALLOWED_COLORS = ["Sort", "Hvid", "Creme", "Grå", "Navy", "Blå", "Beige", "Brun", "Grøn", "Oliven", "Rød", "Bordeaux", "Accent"]
+
+# Farver der tæller som "næsten" et match (koster SYNONYM_PENALTY ekstra point)
+COLOR_SYNONYMS = {
+    "Hvid": "Creme", "Creme": "Hvid",
+    "Navy": "Blå", "Blå": "Navy",
+    "Grøn": "Oliven", "Oliven": "Grøn",
+    "Rød": "Bordeaux", "Bordeaux": "Rød"
+}
+SYNONYM_PENALTY = 4
+
+SHADE_VALUES = {"Lys": 1, "Mellem": 2, "Mørk": 3}
+
+# Præference-model over tidligere kampe (Bradley-Terry / Elo)
+# Hvor meget flytter én kamp ratingen, og hvor mange gange trænes historikken igennem (ved opstart og ved hver ny kamp)
+PREFERENCE_LEARNING_RATE = 0.5
+PREFERENCE_FIT_PASSES = 3
+
+# --- OUTFIT MEMORY & AI OVERRIDES ---
+
+def get_outfit_id(outfit_items):
+    """Laver et unikt ID for en kombination af tøj."""
+    ids = sorted([item['id'] for item in outfit_items])
+    return "_".join(ids)
+
+def add_approved_outfit(approved_index, outfit_id):
+    """Tilføjer et godkendt outfit til det omvendte indeks (item-ID -> bitmask over godkendte outfits)."""
+    if not outfit_id or outfit_id in approved_index["positions"]:
+        return
+    ids = set(outfit_id.split('_'))
+    bit = 1 << len(approved_index["sets"])
+    approved_index["positions"][outfit_id] = len(approved_index["sets"])
+    approved_index["sets"].append(ids)
+    for item_id in ids:
+        approved_index["postings"][item_id] = approved_index["postings"].get(item_id, 0) | bit
+
+def is_part_of_approved(approved_index, item_ids):
+    """Er denne kombination indeholdt i mindst ét godkendt outfit? (AND af posting-bitmasks)"""
+    postings = approved_index["postings"]
+    item_ids = list(item_ids)
+    if not item_ids:
+        return bool(approved_index["sets"])
+    # Start med det sjældneste stykke tøj, så vi hurtigt rammer 0
+    item_ids.sort(key=lambda i: postings.get(i, 0).bit_count())
+    mask = -1
+    for item_id in item_ids:
+        mask &= postings.get(item_id, 0)
+        if not mask:
+            return False
+    return True
+
+def build_outfit_feedback(approved_docs, rejected_docs):
+    """Godkendte/afviste outfits ({outfit_id: data}) til (approved, rejected, approved_index)."""
+    approved = {}
+    rejected = {}
+    approved_index = {"sets": [], "positions": {}, "postings": {}}
+    for doc_id, data in approved_docs.items():
+        approved[doc_id] = data.get('comment', '')
+        add_approved_outfit(approved_index, doc_id)
+    for doc_id, data in rejected_docs.items():
+        rejected[doc_id] = data.get('comment', '')
+    return approved, rejected, approved_index
+
+def add_ai_override(overrides, data):
+    """Tilføjer én vinder til {f"{base_outfit}_{kategori}": {vinder: score}}."""
+    base_id = data.get("base_outfit")
+    cat = data.get("category")
+    w_id = data.get("winner_id")
+    n_score = data.get("new_score")
+    
+    if not base_id or not cat or not w_id:
+        return
+        
+    key = f"{base_id}_{cat}"
+    if key not in overrides:
+        overrides[key] = {}
+    # Tilføj vinderen til listen for denne specifikke tøjkombination
+    overrides[key][w_id] = n_score
+
+def build_ai_overrides(override_docs):
+    """Alle vindere grupperet efter base_outfit og kategori."""
+    overrides = {}
+    for data in override_docs:
+        add_ai_override(overrides, data)
+    return overrides
+
+# --- KAMP-HISTORIK ---
+
+WINNER_PATTERN = re.compile(r'✅\s*VINDER:\s*([A-Za-z0-9_-]+)', re.IGNORECASE)
+
+def parse_match_id(match_id):
+    """Splitter et kamp-ID op i (base_outfit_id, kategori, kandidat-IDs)."""
+    parts = match_id.split('_')
+    for pos, part in enumerate(parts):
+        if pos > 0 and part in CATEGORIES:
+            return "_".join(parts[:pos]), part, parts[pos + 1:]
+    return None
+
+def extract_match_winner(feedback, cand_ids):
+    """Finder vinderens ID i AI'ens svar på en kamp (None hvis der ikke var en vinder)."""
+    if not feedback:
+        return None
+    match = WINNER_PATTERN.search(feedback)
+    if match:
+        return match.group(1).strip()
+    for cid in cand_ids:
+        if f"VINDER: {cid}" in feedback:
+            return cid
+    return None
+
+def parse_match_result(match_id, feedback):
+    """Returnerer (base_outfit_id, kategori, vinder, tabere) for en kamp, eller None hvis ingen vandt."""
+    parsed = parse_match_id(match_id)
+    if not parsed:
+        return None
+    base_id, category, cand_ids = parsed
+    winner_id = extract_match_winner(feedback, cand_ids)
+    if not winner_id:
+        return None
+    return base_id, category, winner_id, [cid for cid in cand_ids if cid != winner_id]
+
+def record_match(match_index, match_id, feedback):
+    """Tilføjer én kamp til indekset: vinderen har slået alle de andre kandidater i kampen."""
+    result = parse_match_result(match_id, feedback)
+    if not result:
+        return
+    base_id, category, winner_id, loser_ids = result
+    entry = match_index.setdefault((base_id, category), {"beaten_by": {}, "feedback": {}})
+    entry["beaten_by"].setdefault(winner_id, set()).update(loser_ids)
+    entry["feedback"][winner_id] = feedback
+
+def build_match_index(matches):
+    """Kamphistorikken ({match_id: raw_feedback}) parset til {(base_outfit_id, kategori): {"beaten_by": {vinder: tabere}, "feedback": {vinder: svar}}}."""
+    match_index = {}
+    for match_id, feedback in matches.items():
+        record_match(match_index, match_id, feedback)
+    return match_index
+
+# --- PRÆFERENCE-MODEL (Bradley-Terry) ---
+# Hver kamp "A slog B givet base X" flytter ratings både for netop den base/kategori og globalt.
+# Sandsynligheden for at A slår B er sigmoid(styrke_A - styrke_B).
+# Modellen trænes altid på alle kampe i samme rækkefølge (sorteret efter match_id), så en genopbygning og en model,
+# der har lært kampene én ad gangen, er ens - ellers ville AI-kald blive sprunget over afhængigt af cachens tilstand.
+
+def update_preference_model(local, global_ratings, winner_id, loser_ids):
+    """Ét Elo-skridt på Bradley-Terry sandsynligheden for én kamp (både for basen/kategorien og globalt)."""
+    for ratings in (local, global_ratings):
+        for loser_id in loser_ids:
+            winner_rating = ratings.get(winner_id, 0.0)
+            loser_rating = ratings.get(loser_id, 0.0)
+            expected = 1 / (1 + math.exp(loser_rating - winner_rating))
+            step = PREFERENCE_LEARNING_RATE * (1 - expected)
+            ratings[winner_id] = winner_rating + step
+            ratings[loser_id] = loser_rating - step
+
+def fit_preference_model(model):
+    """Træner ratings og kamptal forfra på model["matches"]. Antal kampe tælles én gang, ratings i et par gennemløb."""
+    results = [model["matches"][m_id] for m_id in sorted(model["matches"]) if model["matches"][m_id]]
+    local, games, global_ratings = {}, {}, {}
+    for base_id, category, winner_id, loser_ids in results:
+        key_games = games.setdefault((base_id, category), {})
+        key_games[winner_id] = key_games.get(winner_id, 0) + len(loser_ids)
+        for loser_id in loser_ids:
+            key_games[loser_id] = key_games.get(loser_id, 0) + 1
+    for _ in range(PREFERENCE_FIT_PASSES):
+        for base_id, category, winner_id, loser_ids in results:
+            update_preference_model(local.setdefault((base_id, category), {}), global_ratings, winner_id, loser_ids)
+    # Udskiftes samlet, så en samtidig læsning ikke ser en halvt trænet model
+    model["local"], model["games"], model["global"] = local, games, global_ratings
+
+def build_preference_model(matches):
+    """Træner modellen på hele kamphistorikken ({match_id: raw_feedback})."""
+    model = {"local": {}, "games": {}, "global": {}, "matches": {}}
+    learn_preference_matches(model, matches)
+    return model
+
+def learn_preference_matches(model, matches):
+    """Lærer af nye eller ændrede kampe og træner modellen forfra. Kampe, modellen allerede kender uændret, gør ingenting."""
+    changed = False
+    for match_id, feedback in matches.items():
+        result = parse_match_result(match_id, feedback)
+        if match_id not in model["matches"] or model["matches"][match_id] != result:
+            model["matches"][match_id] = result
+            changed = True
+    if changed:
+        fit_preference_model(model)
+
+def rank_by_preference(model, base_id, category, cand_ids):
+    """Sorterer kandidaterne efter forventet styrke. Lokal rating vægtes efter antal kampe, ellers falder vi tilbage på den globale."""
+    key = (base_id, category)
+    local = model["local"].get(key, {})
+    games = model["games"].get(key, {})
+    ranked = []
+    for cid in cand_ids:
+        n = games.get(cid, 0)
+        weight = n / (n + 2)
+        strength = weight * local.get(cid, 0.0) + (1 - weight) * 0.5 * model["global"].get(cid, 0.0)
+        ranked.append((cid, strength))
+    ranked.sort(key=lambda x: x[1], reverse=True)
+    return ranked
+
+def preference_confidence(ranked, leader_pos=0):
+    """Sandsynligheden for at kandidaten på leader_pos slår alle kandidater under sig."""
+    if len(ranked) <= leader_pos + 1:
+        return 1.0
+    leader_strength = ranked[leader_pos][1]
+    confidence = 1.0
+    for _, strength in ranked[leader_pos + 1:]:
+        confidence *= 1 / (1 + math.exp(strength - leader_strength))
+    return confidence
+
+# --- SMART SCORE LOGIK ---
+
+def calculate_match_score(target_color, allowed_list):
+    if target_color in allowed_list:
+        return allowed_list.index(target_color), False
+    
+    synonym_color = COLOR_SYNONYMS.get(target_color)
+    if synonym_color and synonym_color in allowed_list:
+        base_score = allowed_list.index(synonym_color)
+        return base_score + SYNONYM_PENALTY, True
+        
+    return None, False
+
+def calculate_shade_bonus(outfit_items):
+    shades = {}
+    
+    for item in outfit_items:
+        cat = item['analysis'].get('category')
+        shade_str = item['analysis'].get('shade', 'Mellem')
+        shades[cat] = SHADE_VALUES.get(shade_str, 2)
+        
+    bonus = 0
+    if 'Top' in shades and 'Bund' in shades:
+        bonus += abs(shades['Top'] - shades['Bund'])
+    if 'Top' in shades and 'Overtøj' in shades:
+        bonus += abs(shades['Top'] - shades['Overtøj'])
+        
+    return bonus
+
+def calculate_outfit_style_score(outfit_items, approved_index):
+    if len(outfit_items) < 2:
+        return 0.0
+    
+    outfit_ids = set([item['id'] for item in outfit_items])
+    is_outfit_approved = is_part_of_approved(approved_index, outfit_ids)
+    
+    total_score = 0
+    pair_count = 0
+    items_list = list(outfit_items)
+    
+    for i in range(len(items_list)):
+        for j in range(i + 1, len(items_list)):
+            item1 = items_list[i]
+            item2 = items_list[j]
+            
+            data1 = item1['analysis']
+            data2 = item2['analysis']
+            
+            allowed1 = data1['compatibility'].get(data2['category'], [])
+            allowed2 = data2['compatibility'].get(data1['category'], [])
+            
+            score1, _ = calculate_match_score(data2['primary_color'], allowed1)
+            score2, _ = calculate_match_score(data1['primary_color'], allowed2)
+            
+            if score1 is not None and score2 is not None:
+                total_score += (score1 + score2)
+            else:
+                if is_outfit_approved:
+                    total_score += 3
+                else:
+                    total_score += 10
+            
+            pair_count += 1
+                
+    if pair_count == 0:
+        return 0.0
+        
+    base_avg = total_score / pair_count
+    shade_bonus = calculate_shade_bonus(outfit_items)
+    
+    return round(base_avg - shade_bonus, 1)
+
+def calculate_smart_score(item, color_score, weather_data):
+    weather_penalty = 0
+    item_avg = item.get('avg_temp')
+    current_avg = weather_data.get('avg_feels_like_10h')
+    
+    if item_avg is not None and current_avg is not None:
+        diff = abs(current_avg - item_avg)
+        weather_penalty = diff * TEMP_PENALTY_FACTOR
+    
+    total_score = color_score + weather_penalty
+    return total_score, weather_penalty
+
+# --- KOMPATIBILITET ---
+
+def get_items_by_category(items, category):
+    return [i for i in items if i['analysis']['category'] == category]
+
+def check_compatibility_basic(candidate, current_outfit):
+    if not current_outfit:
+        return True, 0, False
+
+    total_color_score = 0
+    is_valid = True
+    is_synonym_match = False
+
+    for selected_item in current_outfit:
+        cand_data = candidate['analysis']
+        sel_data = selected_item['analysis']
+        
+        cand_cat = cand_data['category']
+        sel_cat = selected_item['analysis']['category']
+        
+        cand_color = cand_data['primary_color']
+        sel_color = sel_data['primary_color']
+
+        allowed_by_selected = sel_data['compatibility'].get(cand_cat, [])
+        allowed_by_candidate = cand_data['compatibility'].get(sel_cat, [])
+
+        score1, syn1 = calculate_match_score(cand_color, allowed_by_selected)
+        score2, syn2 = calculate_match_score(sel_color, allowed_by_candidate)
+
+        if score1 is not None and score2 is not None:
+            total_color_score += (score1 + score2)
+            if syn1 or syn2:
+                is_synonym_match = True
+        else:
+            is_valid = False
+    
+    return is_valid, total_color_score, is_synonym_match
+
+def check_dead_end(candidate, current_outfit, index):
+    """Tjekker om kandidaten gør det umuligt at færdiggøre outfittet (kigger alle resterende kategorier igennem)."""
+    # Tøj, som ikke er i indekset (fjernet fra garderoben siden det blev valgt), springes over
+    temp_rows = [index['rows'][item['id']] for item in current_outfit + [candidate] if item['id'] in index['rows']]
+    filled_cats = {int(index['item_category'][row]) for row in temp_rows}
+    missing_cats = [index['categories'].index(c) for c in CATEGORIES]
+    missing_cats = [c for c in missing_cats if c not in filled_cats and index['category_bits'][c]]
+    
+    # Start med alle genstande i hver manglende kategori og skær væk med hvert valgt stykke tøj
+    domains = {}
+    for cat_code in missing_cats:
+        domain = index['category_bits'][cat_code]
+        for row in temp_rows:
+            domain &= index['compat_bits'][row][cat_code]
+        if not domain:
+            return True
+        domains[cat_code] = domain
+    
+    return not has_completion(index, domains)
+
+# --- KOMPATIBILITETS-INDEKS (NumPy) ---
+# Alle farve-opslag fra calculate_match_score regnes ud én gang pr. garderobe,
+# så rangering af en fane bliver til række-opslag og summer i stedet for list.index.
+
+def build_compatibility_index(wardrobe):
+    """Bygger en tabel over hvilken score hver genstand giver hver farve i hver kategori (-1 = inkompatibel)."""
+    categories = list(CATEGORIES)
+    colors = list(ALLOWED_COLORS)
+    cat_codes = {c: i for i, c in enumerate(categories)}
+    color_codes = {c: i for i, c in enumerate(colors)}
+
+    def code_for(value, codes, names):
+        # Ukendte værdier (f.eks. en farve AI'en har fundet på) får bare en ny kolonne
+        if value not in codes:
+            codes[value] = len(names)
+            names.append(value)
+        return codes[value]
+
+    n = len(wardrobe)
+    item_cat = np.zeros(n, dtype=np.int16)
+    item_color = np.zeros(n, dtype=np.int16)
+    item_shade = np.zeros(n, dtype=np.int16)
+    positions = []
+
+    for row, item in enumerate(wardrobe):
+        data = item['analysis']
+        item_cat[row] = code_for(data.get('category'), cat_codes, categories)
+        item_color[row] = code_for(data.get('primary_color'), color_codes, colors)
+        item_shade[row] = SHADE_VALUES.get(data.get('shade', 'Mellem'), 2)
+        for cat, allowed_list in data.get('compatibility', {}).items():
+            cat_code = code_for(cat, cat_codes, categories)
+            for pos, color in enumerate(allowed_list):
+                positions.append((row, cat_code, code_for(color, color_codes, colors), pos))
+
+    direct = np.full((n, len(categories), len(colors)), -1, dtype=np.int16)
+    # Baglæns, så den første forekomst vinder (ligesom list.index)
+    for row, cat_code, color_code, pos in reversed(positions):
+        direct[row, cat_code, color_code] = pos
+
+    match = direct.copy()
+    synonym = np.zeros(direct.shape, dtype=bool)
+    for color, synonym_color in COLOR_SYNONYMS.items():
+        t, s = color_codes[color], color_codes[synonym_color]
+        use_synonym = (direct[:, :, t] < 0) & (direct[:, :, s] >= 0)
+        match[:, :, t] = np.where(use_synonym, direct[:, :, s] + SYNONYM_PENALTY, direct[:, :, t])
+        synonym[:, :, t] = use_synonym
+
+    return {
+        "ids": [item['id'] for item in wardrobe],
+        "rows": {item['id']: row for row, item in enumerate(wardrobe)},
+        "categories": categories,
+        "colors": colors,
+        "item_category": item_cat,
+        "item_color": item_color,
+        "item_shade": item_shade,
+        "match": match,
+        "synonym": synonym,
+    }
+
+def build_compatibility_bitsets(index):
+    """Tilføjer bitsets til indekset: for hver genstand og kategori, hvilke genstande i kategorien den passer med."""
+    cat = index['item_category']
+    n_cats = len(index['categories'])
+    category_rows = [np.flatnonzero(cat == code) for code in range(n_cats)]
+    compat_bits = [[0] * n_cats for _ in range(len(cat))]
+    
+    for code_a, rows_a in enumerate(category_rows):
+        for code_b, rows_b in enumerate(category_rows):
+            if code_a == code_b or len(rows_a) == 0 or len(rows_b) == 0:
+                continue
+            _, valid, _ = get_pair_scores(index, rows_a, rows_b)
+            # Bit nr. i svarer til den i'te genstand i kategori b
+            packed = np.packbits(valid, axis=1, bitorder='little')
+            for row, bits in zip(rows_a, packed):
+                compat_bits[row][code_b] = int.from_bytes(bits.tobytes(), 'little')
+    
+    index['category_rows'] = category_rows
+    index['category_bits'] = [(1 << len(rows)) - 1 for rows in category_rows]
+    index['compat_bits'] = compat_bits
+    return index
+
+def has_completion(index, domains):
+    """Søger efter én kombination med et stykke tøj fra hver kategori i domains, hvor alt passer sammen.
+    domains er {kategori-kode: bitset af mulige genstande}; tomme kategorier skal være sorteret fra."""
+    if not domains:
+        return True
+    
+    # Tag den kategori med færrest muligheder først
+    cat_code = min(domains, key=lambda c: bin(domains[c]).count("1"))
+    rest = {c: d for c, d in domains.items() if c != cat_code}
+    rows = index['category_rows'][cat_code]
+    
+    remaining = domains[cat_code]
+    while remaining:
+        lowest = remaining & -remaining
+        remaining ^= lowest
+        row = rows[lowest.bit_length() - 1]
+        bits = index['compat_bits'][row]
+        
+        narrowed = {}
+        for other, domain in rest.items():
+            domain &= bits[other]
+            if not domain:
+                break
+            narrowed[other] = domain
+        else:
+            if has_completion(index, narrowed):
+                return True
+    return False
+
+def get_pair_scores(index, rows_a, rows_b):
+    """Parvise farvescores mellem to sæt genstande, begge retninger lagt sammen.
+    Returnerer (score, gyldig, synonym) som matricer af formen (len(rows_a), len(rows_b))."""
+    rows_a = np.asarray(rows_a, dtype=np.intp)
+    rows_b = np.asarray(rows_b, dtype=np.intp)
+    cat = index['item_category']
+    color = index['item_color']
+
+    # Hvad a tillader af b's farve (i b's kategori) - og omvendt
+    a_key = (rows_a[:, None], cat[rows_b][None, :], color[rows_b][None, :])
+    b_key = (rows_b[:, None], cat[rows_a][None, :], color[rows_a][None, :])
+    a_to_b = index['match'][a_key]
+    b_to_a = index['match'][b_key].T
+
+    valid = (a_to_b >= 0) & (b_to_a >= 0)
+    score = np.where(valid, a_to_b.astype(np.int32) + b_to_a, 0)
+    is_synonym = (index['synonym'][a_key] | index['synonym'][b_key].T) & valid
+    return score, valid, is_synonym
+
+def score_candidates(index, selected_rows, cand_rows, approved_mask):
+    """Vektoriseret udgave af check_compatibility_basic og calculate_outfit_style_score for en hel fane.
+    approved_mask angiver pr. kandidat, om outfit + kandidat er en del af et godkendt outfit."""
+    m = len(cand_rows)
+    k = len(selected_rows)
+    if k == 0:
+        return np.zeros(m, dtype=np.int32), np.ones(m, dtype=bool), np.zeros(m, dtype=bool), np.zeros(m)
+
+    score, valid, is_synonym = get_pair_scores(index, selected_rows, cand_rows)
+    color_scores = score.sum(axis=0)
+    is_valid = valid.all(axis=0)
+    synonym_flags = is_synonym.any(axis=0)
+
+    # Par inden for det allerede valgte outfit er ens for alle kandidater
+    base_score, base_valid, _ = get_pair_scores(index, selected_rows, selected_rows)
+    upper = np.triu_indices(k, 1)
+    base_sum = base_score[upper].sum()
+    base_invalid = (~base_valid[upper]).sum()
+
+    invalid_pairs = base_invalid + (~valid).sum(axis=0)
+    invalid_cost = np.where(approved_mask, 3, 10)
+    pair_count = (k + 1) * k / 2
+    base_avg = (base_sum + color_scores + invalid_pairs * invalid_cost) / pair_count
+
+    # Skygge-bonus (samme regel som calculate_shade_bonus, kandidaten lægges ind sidst)
+    cat = index['item_category']
+    shade = index['item_shade']
+    cand_rows = np.asarray(cand_rows, dtype=np.intp)
+    shades = {}
+    for name in ("Top", "Bund", "Overtøj"):
+        code = index['categories'].index(name)
+        value = np.full(m, np.nan)
+        for row in selected_rows:
+            if cat[row] == code:
+                value[:] = shade[row]
+        shades[name] = np.where(cat[cand_rows] == code, shade[cand_rows], value)
+    shade_bonus = np.nan_to_num(np.abs(shades["Top"] - shades["Bund"])) + np.nan_to_num(np.abs(shades["Top"] - shades["Overtøj"]))
+
+    return color_scores, is_valid, synonym_flags, base_avg - shade_bonus
+
+# --- RANGERING AF EN FANE ---
+
+def rank_category(index, items, current_outfit, category, weather_data, approved_index, rejected_cache, ai_overrides, match_index):
+    """Rangerer alle genstande i én kategori (fanen) givet det valgte outfit. Laveste smart score først.
+    Hver række er (smart_score, item, color_score, weather_penalty, is_synonym, is_part_of_success, is_rejected_exact,
+    is_dead_end, projected_style_score, is_strict_incompatible, is_champion, is_loser)."""
+    valid_items_with_score = []
+    # Tøj, som ikke er i indekset (fjernet fra garderoben siden det blev valgt), springes over
+    current_outfit = [item for item in current_outfit if item['id'] in index['rows']]
+    current_ids = [item['id'] for item in current_outfit]
+    base_outfit_id = get_outfit_id(current_outfit) if current_outfit else "empty"
+    
+    # Find alle overrides og udnævn den forsvarende mester
+    override_key = f"{base_outfit_id}_{category}"
+    cat_overrides = ai_overrides.get(override_key, {})
+    
+    champion_id = None
+    loser_ids = set()
+    
+    if cat_overrides:
+        # Mesteren er den med det absolut laveste pointtal (værdi) for denne base/kategori
+        champion_id = min(cat_overrides, key=cat_overrides.get)
+        
+        # NYT: Find alle tabere til denne mester fra historikken
+        match_entry = match_index.get((base_outfit_id, category), {})
+        loser_ids = set(match_entry.get("beaten_by", {}).get(champion_id, set())) - {champion_id}
+
+    # 1. Beregninger
+    candidate_sets = [set(current_ids + [item['id']]) for item in items]
+    
+    part_of_success_flags = [is_part_of_approved(approved_index, candidate_set) for candidate_set in candidate_sets]
+    
+    # Farve- og stilscore for hele fanen på én gang
+    selected_rows = [index['rows'][item_id] for item_id in current_ids]
+    cand_rows = [index['rows'][item['id']] for item in items]
+    color_scores, valid_flags, synonym_flags, style_scores = score_candidates(
+        index, selected_rows, cand_rows, np.array(part_of_success_flags, dtype=bool)
+    )
+    
+    for pos, item in enumerate(items):
+        is_valid = bool(valid_flags[pos])
+        color_score = int(color_scores[pos])
+        is_synonym = bool(synonym_flags[pos])
+        _, weather_penalty = calculate_smart_score(item, color_score, weather_data)
+        
+        # Den oprindelige viste score (baseret rent på stil)
+        projected_style_score = round(float(style_scores[pos]), 1)
+        
+        candidate_set = candidate_sets[pos]
+        is_part_of_success = part_of_success_flags[pos]
+        
+        cand_id_list = sorted(list(candidate_set))
+        cand_id_str = "_".join(cand_id_list)
+        is_rejected_exact = cand_id_str in rejected_cache
+
+        is_dead_end = False
+        if current_outfit:
+            is_dead_end = check_dead_end(item, current_outfit, index)
+        
+        # Hvis genstanden er en af de gemte vindere for dette outfit, overskriv dens score!
+        if item['id'] in cat_overrides:
+            projected_style_score = float(cat_overrides[item['id']])
+        
+        # Tjek om vi er the reigning champion
+        is_champion = False
+        if champion_id and item['id'] == champion_id:
+            is_champion = True
+            
+        # NYT: Tjek om den er en taber til mesteren
+        is_loser = item['id'] in loser_ids
+        
+        # Sortering er nu defineret som: Synlig Pointscore + Vejrpoint
+        smart_score = projected_style_score + weather_penalty
+        
+        # Tilføj andre bonus/straf til den endelige sorteringsscore
+        is_strict_incompatible = False
+        if not is_valid:
+            if is_part_of_success:
+                smart_score += 3 
+            else:
+                smart_score += 1000
+                is_strict_incompatible = True
+                
+        if is_part_of_success:
+            smart_score -= SUCCESS_BONUS
+        
+        if is_rejected_exact:
+            smart_score += REJECTION_PENALTY
+            
+        valid_items_with_score.append((smart_score, item, color_score, weather_penalty, is_synonym, is_part_of_success, is_rejected_exact, is_dead_end, projected_style_score, is_strict_incompatible, is_champion, is_loser))
+    
+    valid_items_with_score.sort(key=lambda x: x[0])
+    return valid_items_with_score
+
+# --- HELE OUTFITS (Top-K) ---
+# Branch-and-bound over Top × Bund × Strømper × Sko × Overtøj. Scoren er den samme som
+# i fanerne: stilscore (eller AI-override) + vejrstraf - SUCCESS_BONUS + REJECTION_PENALTY.
+
+def suggest_complete_outfits(index, wardrobe, weather_data, approved_sets, rejected_cache, ai_overrides, k=5):
+    """Finder de k bedste komplette outfits (lavest score). Returnerer en sorteret liste af dicts."""
+    levels = [index['categories'].index(c) for c in CATEGORIES]
+    levels = [c for c in levels if len(index['category_rows'][c])]
+    if not levels:
+        return []
+    # Små kategorier øverst i træet giver færre grene
+    levels.sort(key=lambda c: len(index['category_rows'][c]))
+    level_rows = [index['category_rows'][c] for c in levels]
+    n_levels = len(levels)
+    pair_count = n_levels * (n_levels - 1) / 2
+    ids = index['ids']
+
+    weather = np.zeros(len(wardrobe))
+    if weather_data:
+        for row, item in enumerate(wardrobe):
+            _, weather[row] = calculate_smart_score(item, 0, weather_data)
+
+    # Parvise scores mellem alle kategorier (kun kompatible par tæller i grænsen)
+    blocks = {}
+    min_pair = {}
+    for a in range(n_levels):
+        for b in range(a + 1, n_levels):
+            score, valid, _ = get_pair_scores(index, level_rows[a], level_rows[b])
+            blocks[(a, b)] = (score, valid)
+            blocks[(b, a)] = (score.T, valid.T)
+            min_pair[(a, b)] = score[valid].min() if valid.any() else np.inf
+
+    approved_candidates = [a for a in approved_sets if len(a) >= n_levels]
+    shade_names = {index['categories'].index(name): name for name in ("Top", "Bund", "Overtøj")}
+
+    def shade_bonus_upper(chosen):
+        # Største skygge-bonus der stadig kan nås, givet det der er valgt indtil videre
+        known = {}
+        for row in chosen:
+            name = shade_names.get(int(index['item_category'][row]))
+            if name:
+                known[name] = int(index['item_shade'][row])
+        present = {shade_names[c] for c in levels if c in shade_names}
+        bonus = 0
+        for other in ("Bund", "Overtøj"):
+            if "Top" not in present or other not in present:
+                continue
+            top, value = known.get("Top"), known.get(other)
+            if top is not None and value is not None:
+                bonus += abs(top - value)
+            elif top is not None or value is not None:
+                v = top if top is not None else value
+                bonus += max(v - 1, 3 - v)
+            else:
+                bonus += 2
+        return bonus
+
+    def score_outfit(rows):
+        outfit_ids = [ids[row] for row in rows]
+        id_set = set(outfit_ids)
+        is_approved = any(id_set.issubset(a) for a in approved_candidates)
+
+        if pair_count:
+            score, valid, _ = get_pair_scores(index, rows, rows)
+            upper = np.triu_indices(n_levels, 1)
+            invalid_pairs = int((~valid[upper]).sum())
+            if invalid_pairs and not is_approved:
+                return None
+            total = score[upper].sum() + invalid_pairs * (3 if is_approved else 10)
+            style_score = round(float(total / pair_count) - calculate_shade_bonus([wardrobe[row] for row in rows]), 1)
+        else:
+            invalid_pairs = 0
+            style_score = 0.0
+
+        # AI-overrides gælder, når outfittet er en gemt base + vinder. Som i rank_category erstatter overriden
+        # stilscoren; passer outfittet på flere base + vinder-par, bruges den laveste override
+        overrides = []
+        for row, item_id in zip(rows, outfit_ids):
+            cat = index['categories'][index['item_category'][row]]
+            base_id = "_".join(sorted(i for i in outfit_ids if i != item_id)) or "empty"
+            override = ai_overrides.get(f"{base_id}_{cat}", {}).get(item_id)
+            if override is not None:
+                overrides.append(float(override))
+        if overrides:
+            style_score = min(overrides)
+
+        is_rejected = "_".join(sorted(outfit_ids)) in rejected_cache
+        weather_penalty = float(weather[list(rows)].sum())
+        total_score = style_score + weather_penalty
+        if invalid_pairs:
+            total_score += 3
+        if is_approved:
+            total_score -= SUCCESS_BONUS
+        if is_rejected:
+            total_score += REJECTION_PENALTY
+
+        ordered = sorted(rows, key=lambda r: CATEGORIES.index(index['categories'][index['item_category'][r]]))
+        return {
+            "items": [wardrobe[row] for row in ordered],
+            "score": round(total_score, 1),
+            "style_score": style_score,
+            "weather_penalty": weather_penalty,
+            "is_approved": is_approved,
+            "is_rejected": is_rejected,
+        }
+
+    found = {}
+    heap = []
+
+    def worst():
+        return -heap[0][0] if len(heap) >= k else np.inf
+
+    def offer(rows):
+        outfit_id = "_".join(sorted(ids[row] for row in rows))
+        if outfit_id in found:
+            return
+        entry = score_outfit(rows)
+        found[outfit_id] = entry
+        if entry is None:
+            return
+        if len(heap) < k:
+            heapq.heappush(heap, (-entry["score"], outfit_id))
+        elif entry["score"] < worst():
+            heapq.heapreplace(heap, (-entry["score"], outfit_id))
+
+    def rows_for_ids(outfit_ids):
+        rows = [index['rows'].get(i) for i in outfit_ids]
+        if None in rows or len(rows) != n_levels:
+            return None
+        if sorted(int(index['item_category'][r]) for r in rows) != sorted(levels):
+            return None
+        return rows
+
+    # 1. Outfits der kan have en særlig score (godkendte og AI-vindere) vurderes direkte,
+    #    så grænsen nedenfor kan regne med den "rene" score
+    for a_set in approved_candidates:
+        rows = rows_for_ids(list(a_set))
+        if rows:
+            offer(rows)
+    for key, winners in ai_overrides.items():
+        base_id, _ = key.rsplit("_", 1)
+        base_ids = [] if base_id == "empty" else base_id.split("_")
+        for winner_id in winners:
+            rows = rows_for_ids(base_ids + [winner_id])
+            if rows:
+                offer(rows)
+
+    # 2. Branch-and-bound over resten
+    def search(level, chosen, pair_sum, weather_sum, acc, ok):
+        if level == n_levels:
+            offer(chosen)
+            return
+
+        bound = pair_sum / max(pair_count, 1) + weather_sum - shade_bonus_upper(chosen)
+        costs = {}
+        for j in range(level, n_levels):
+            cost = np.where(ok[j], acc[j] / max(pair_count, 1) + weather[level_rows[j]], np.inf)
+            best = cost.min()
+            if best == np.inf:
+                return
+            bound += best
+            costs[j] = (cost, best)
+        for a in range(level, n_levels):
+            for b in range(a + 1, n_levels):
+                bound += min_pair[(a, b)] / pair_count
+        # Lidt luft til afrundingen af stilscoren
+        if bound > worst() + 0.05:
+            return
+
+        cost, best = costs[level]
+        for pos in np.argsort(cost, kind="stable"):
+            if cost[pos] == np.inf or bound - best + cost[pos] > worst() + 0.05:
+                break
+            row = level_rows[level][pos]
+            new_acc = dict(acc)
+            new_ok = dict(ok)
+            for j in range(level + 1, n_levels):
+                score, valid = blocks[(level, j)]
+                new_acc[j] = acc[j] + score[pos]
+                new_ok[j] = ok[j] & valid[pos]
+            search(level + 1, chosen + [row], pair_sum + acc[level][pos], weather_sum + weather[row], new_acc, new_ok)
+
+    acc = {j: np.zeros(len(level_rows[j])) for j in range(n_levels)}
+    ok = {j: np.ones(len(level_rows[j]), dtype=bool) for j in range(n_levels)}
+    search(0, [], 0.0, 0.0, acc, ok)
+
+    results = [found[outfit_id] for _, outfit_id in heap]
+    results.sort(key=lambda entry: entry["score"])
+    return results
@@ -0,0 +1,103 @@
+# Upload af mange filer som ét commit.
+# GitHub: én blob pr. fil, ét tree og ét commit via Git Data API'et (i stedet for ét commit pr. fil med
+# repo.create_file). Lokalt: samme resultat i et bare-repo via git, så upload kan testes uden GitHub.
+import base64
+import os
+import subprocess
+import tempfile
+import time
+from github import GithubException, InputGitTreeElement
+
+# --- KONFIGURATION ---
+MAX_RETRIES = 5
+RETRY_BASE_SECONDS = 2
+# Midlertidige fejl og rate limits, som er værd at prøve igen
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+# --- FÆLLES ---
+
+def commit_files(target, files, message, branch="main"):
+    """Gemmer {sti: bytes} som ét commit. target er {"kind": "github", "repo": repo} eller {"kind": "local", "path": sti}."""
+    if not files:
+        return None
+    if target["kind"] == "local":
+        return commit_files_local(target["path"], files, message, branch)
+    return commit_files_github(target["repo"], files, message, branch)
+
+# --- GITHUB ---
+
+def is_retryable(e):
+    if e.status in RETRY_STATUS:
+        return True
+    # GitHub svarer 403 ved "secondary rate limit"
+    return e.status == 403 and "rate limit" in str(e.data).lower()
+
+def with_retries(func, *args, **kwargs):
+    """Kører func og prøver igen med eksponentiel backoff (eller Retry-After) ved rate limits og midlertidige fejl."""
+    for attempt in range(MAX_RETRIES):
+        try:
+            return func(*args, **kwargs)
+        except GithubException as e:
+            if not is_retryable(e) or attempt == MAX_RETRIES - 1:
+                raise
+            retry_after = (e.headers or {}).get("retry-after")
+            time.sleep(float(retry_after) if retry_after else RETRY_BASE_SECONDS * 2 ** attempt)
+
+def commit_files_github(repo, files, message, branch="main"):
+    """Alle filer som blobs, ét tree og ét commit oven på branch. Returnerer commit-SHA."""
+    blob_shas = {}
+    for path, data in files.items():
+        blob = with_retries(repo.create_git_blob, base64.b64encode(data).decode("ascii"), "base64")
+        blob_shas[path] = blob.sha
+    elements = [InputGitTreeElement(path, "100644", "blob", sha=sha) for path, sha in blob_shas.items()]
+
+    for attempt in range(MAX_RETRIES):
+        ref = with_retries(repo.get_git_ref, f"heads/{branch}")
+        parent = with_retries(repo.get_git_commit, ref.object.sha)
+        tree = with_retries(repo.create_git_tree, elements, parent.tree)
+        commit = with_retries(repo.create_git_commit, message, tree, [parent])
+        try:
+            with_retries(ref.edit, commit.sha)
+            return commit.sha
+        except GithubException as e:
+            # 422: branchen er flyttet imens (fx et andet upload) - byg tree og commit igen oven på den nye spids
+            if e.status != 422 or attempt == MAX_RETRIES - 1:
+                raise
+
+# --- LOKALT BARE-REPO (test) ---
+
+def _git(repo_path, args, data=None, env=None):
+    result = subprocess.run(["git", "--git-dir", repo_path, *args], input=data, capture_output=True, env=env, check=True)
+    return result.stdout.decode("utf-8").strip()
+
+def init_local_repo(repo_path, branch="main"):
+    """Opretter bare-repo'et, hvis det ikke findes."""
+    if not os.path.exists(repo_path):
+        subprocess.run(["git", "init", "--bare", "-q", f"--initial-branch={branch}", repo_path], check=True)
+
+def commit_files_local(repo_path, files, message, branch="main"):
+    """Samme som commit_files_github, men i et lokalt bare-repo. Returnerer commit-SHA."""
+    init_local_repo(repo_path, branch)
+    ref = f"refs/heads/{branch}"
+    try:
+        parent = _git(repo_path, ["rev-parse", "--verify", "-q", ref])
+    except subprocess.CalledProcessError:
+        parent = None
+
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, GIT_INDEX_FILE=os.path.join(tmp, "index"))
+        env.setdefault("GIT_AUTHOR_NAME", "Garderobe Admin")
+        env.setdefault("GIT_AUTHOR_EMAIL", "admin@localhost")
+        env.setdefault("GIT_COMMITTER_NAME", env["GIT_AUTHOR_NAME"])
+        env.setdefault("GIT_COMMITTER_EMAIL", env["GIT_AUTHOR_EMAIL"])
+        if parent:
+            _git(repo_path, ["read-tree", parent], env=env)
+        for path, data in files.items():
+            sha = _git(repo_path, ["hash-object", "-w", "--stdin"], data=data)
+            _git(repo_path, ["update-index", "--add", "--cacheinfo", f"100644,{sha},{path}"], env=env)
+        tree = _git(repo_path, ["write-tree"], env=env)
+        commit = _git(repo_path, ["commit-tree", tree, *(["-p", parent] if parent else []), "-m", message], env=env)
+
+    # Med den gamle spids som betingelse, så to samtidige uploads ikke overskriver hinanden
+    _git(repo_path, ["update-ref", ref, commit, *([parent] if parent else ["0" * 40])])
+    return commit
@@ -0,0 +1,298 @@
+# Billedbehandling til garderoben: standardisering, varianter og perceptuel hash (dHash) med et BK-træ,
+# så næsten ens billeder kan findes før der bruges AI-kald på dem. Bruges af admin.py og backfill-scriptet.
+# Farve-analysen foreslår primær-/sekundærfarve og nuance lokalt (k-means i Lab), så AI'ens farver kan tjekkes.
+import io
+import numpy as np
+from PIL import Image
+
+# --- KONFIGURATION ---
+STANDARD_SIZE = (800, 800)
+STANDARD_BACKGROUND = (255, 255, 255)
+
+# Lille variant der sendes til Gemini (færre billed-tokens og mindre upload pr. kald)
+AI_IMAGE_SIZE = 384
+AI_IMAGE_QUALITY = 80
+
+# Thumbnails til app'ens grids (bredde i px -> mappe på GitHub)
+THUMBNAIL_SIZES = {160: "small", 320: "medium"}
+
+# dHash: 8×8 sammenligninger = 64 bit
+DHASH_SIZE = 8
+
+# Farve-analyse: billedet skaleres ned til COLOR_ANALYSIS_SIZE² pixels før k-means
+COLOR_ANALYSIS_SIZE = 128
+COLOR_CLUSTERS = 4
+COLOR_ITERATIONS = 12
+# Baggrunden findes ved at vokse fra kanten: start i kantpixels tæt på padding/fotobaggrund (ΔE i Lab),
+# og gå kun videre til naboer, der ligner (så en baggrund med lysfald også fjernes, men tøjets kant stopper den)
+BACKGROUND_MAX_DELTA_E = 8
+BACKGROUND_STEP_DELTA_E = 2.5
+# En sekundærfarve skal dække mindst denne andel af tøjet
+SECONDARY_MIN_SHARE = 0.15
+# Nuance ud fra lysheden (L*) af primærfarven
+SHADE_LIGHT_MIN_L = 65
+SHADE_DARK_MAX_L = 40
+
+# Referencefarver (sRGB) for hver farve i ALLOWED_COLORS - flere pr. farve, så både lyse og mørke udgaver rammer rigtigt
+COLOR_REFERENCES = {
+    "Sort": [(20, 20, 22), (45, 45, 48)],
+    "Hvid": [(246, 246, 246), (228, 230, 234)],
+    "Creme": [(240, 230, 205), (224, 212, 182)],
+    "Grå": [(80, 80, 82), (128, 128, 130), (180, 180, 182)],
+    "Navy": [(28, 36, 64), (40, 52, 92)],
+    "Blå": [(70, 110, 170), (100, 140, 195), (150, 180, 215)],
+    "Beige": [(210, 190, 155), (188, 168, 130), (206, 192, 176)],
+    "Brun": [(70, 48, 34), (110, 74, 48), (155, 110, 72), (118, 100, 86)],
+    "Grøn": [(36, 74, 50), (60, 120, 72), (120, 170, 120)],
+    "Oliven": [(82, 86, 48), (108, 108, 60), (140, 138, 90)],
+    "Rød": [(150, 30, 36), (195, 40, 45)],
+    "Bordeaux": [(72, 20, 32), (104, 28, 44)],
+    "Accent": [(230, 200, 50), (230, 120, 40), (230, 150, 170), (110, 60, 130), (40, 140, 140)],
+}
+
+# --- VARIANTER ---
+def create_ai_variant(image, size=AI_IMAGE_SIZE):
+    """Skalerer billedet ned til max size×size og returnerer WebP bytes klar til Gemini."""
+    img = image.convert("RGB") if image.mode != "RGB" else image.copy()
+    img.thumbnail((size, size), Image.Resampling.LANCZOS)
+
+    img_byte_arr = io.BytesIO()
+    img.save(img_byte_arr, format='WEBP', quality=AI_IMAGE_QUALITY)
+    return img_byte_arr.getvalue()
+
+def create_thumbnail(image, size):
+    """Nedskaleret WebP af et allerede standardiseret (kvadratisk) billede."""
+    thumb = image.resize((size, size), Image.Resampling.LANCZOS)
+    img_byte_arr = io.BytesIO()
+    thumb.save(img_byte_arr, format='WEBP', quality=80)
+    return img_byte_arr.getvalue()
+
+def pad_to_square(image, target_size=STANDARD_SIZE, bg_color=STANDARD_BACKGROUND):
+    """Skalerer og padder billedet til et standard kvadrat (PIL-billede)."""
+    # Konverter til RGB for at fjerne evt. gennemsigtighed
+    if image.mode in ("RGBA", "P"):
+        img = image.convert("RGB")
+    else:
+        img = image.copy()
+
+    # Bevar proportioner og skaler ned
+    img.thumbnail(target_size, Image.Resampling.LANCZOS)
+
+    # Opret det nye firkantede lærred med baggrundsfarven
+    new_img = Image.new("RGB", target_size, bg_color)
+
+    # Udregn positionen, så billedet centreres
+    paste_pos = (
+        (target_size[0] - img.width) // 2,
+        (target_size[1] - img.height) // 2
+    )
+    new_img.paste(img, paste_pos)
+    return new_img
+
+def standardize_image(image, target_size=STANDARD_SIZE, bg_color=STANDARD_BACKGROUND):
+    """Skalerer og padder billedet til et standard kvadrat.
+    Returnerer {"main": WebP bytes, "ai": lille WebP til analyse, "thumbnails": {bredde: WebP bytes}, "dhash": hex}."""
+    new_img = pad_to_square(image, target_size, bg_color)
+
+    # Gem som WebP bytes
+    img_byte_arr = io.BytesIO()
+    new_img.save(img_byte_arr, format='WEBP', quality=85)
+    return {
+        "main": img_byte_arr.getvalue(),
+        "ai": create_ai_variant(new_img),
+        "thumbnails": {size: create_thumbnail(new_img, size) for size in THUMBNAIL_SIZES},
+        "dhash": compute_dhash(new_img)
+    }
+
+# --- PERCEPTUEL HASH (dHash) ---
+def compute_dhash(image, hash_size=DHASH_SIZE):
+    """Gradient-hash: er hver pixel lysere end naboen til højre? Returneres som 16 hex-tegn.
+    Bør beregnes på det standardiserede billede, så padding og størrelse er ens for alle."""
+    gray = image.convert("L").resize((hash_size + 1, hash_size), Image.Resampling.LANCZOS)
+    pixels = list(gray.getdata())
+    value = 0
+    for row in range(hash_size):
+        for col in range(hash_size):
+            left = pixels[row * (hash_size + 1) + col]
+            right = pixels[row * (hash_size + 1) + col + 1]
+            value = (value << 1) | (left > right)
+    # Hex i stedet for tal: Firestore kan ikke gemme 64-bit uden fortegn
+    return f"{value:0{hash_size * hash_size // 4}x}"
+
+def hamming_distance(hash_a, hash_b):
+    return (int(hash_a, 16) ^ int(hash_b, 16)).bit_count()
+
+# --- BK-TRÆ ---
+# Hver node er [hash, værdier, {afstand: barn}]. Trekantsuligheden gør, at søgningen kun skal ned i de børn,
+# hvis afstand til noden ligger inden for ±max_distance af søgehashens afstand.
+
+def add_to_hash_index(index, dhash, value):
+    """Indsætter (dhash, value) i BK-træet. Ens hashes deler node."""
+    if index["root"] is None:
+        index["root"] = [dhash, [value], {}]
+        return
+    node = index["root"]
+    while True:
+        distance = hamming_distance(dhash, node[0])
+        if distance == 0:
+            node[1].append(value)
+            return
+        child = node[2].get(distance)
+        if child is None:
+            node[2][distance] = [dhash, [value], {}]
+            return
+        node = child
+
+def build_hash_index(entries):
+    """BK-træ over [(dhash, værdi)]."""
+    index = {"root": None}
+    for dhash, value in entries:
+        if dhash:
+            add_to_hash_index(index, dhash, value)
+    return index
+
+def find_similar(index, dhash, max_distance):
+    """Alle værdier hvis hash ligger inden for max_distance bit. Returnerer [(afstand, værdi)] sorteret."""
+    matches = []
+    stack = [index["root"]] if index["root"] is not None else []
+    while stack:
+        node = stack.pop()
+        distance = hamming_distance(dhash, node[0])
+        if distance <= max_distance:
+            matches.extend((distance, value) for value in node[1])
+        for child_distance, child in node[2].items():
+            if distance - max_distance <= child_distance <= distance + max_distance:
+                stack.append(child)
+    matches.sort(key=lambda m: m[0])
+    return matches
+
+# --- FARVE-ANALYSE (Lab + k-means) ---
+
+def rgb_to_lab(rgb):
+    """sRGB (0-255, form (..., 3)) til CIE Lab (D65)."""
+    rgb = np.asarray(rgb, dtype=np.float64) / 255.0
+    linear = np.where(rgb > 0.04045, ((rgb + 0.055) / 1.055) ** 2.4, rgb / 12.92)
+    xyz = linear @ np.array([
+        [0.4124, 0.3576, 0.1805],
+        [0.2126, 0.7152, 0.0722],
+        [0.0193, 0.1192, 0.9505]
+    ]).T
+    xyz /= np.array([0.95047, 1.0, 1.08883])
+    f = np.where(xyz > 216 / 24389, np.cbrt(xyz), (24389 / 27 * xyz + 16) / 116)
+    return np.stack([116 * f[..., 1] - 16, 500 * (f[..., 0] - f[..., 1]), 200 * (f[..., 1] - f[..., 2])], axis=-1)
+
+_REFERENCE_NAMES = [name for name, refs in COLOR_REFERENCES.items() for _ in refs]
+_REFERENCE_LAB = rgb_to_lab([ref for refs in COLOR_REFERENCES.values() for ref in refs])
+
+def foreground_mask(lab, bg_color=STANDARD_BACKGROUND):
+    """Sand for tøjet: alt undtagen baggrunden, der hænger sammen med kanten (padding og fotobaggrund).
+    Hvidt tøj midt i billedet bevares, fordi der er en kant mellem det og baggrunden."""
+    padding = rgb_to_lab(bg_color)
+    near_bg = np.linalg.norm(lab - padding, axis=-1) < BACKGROUND_MAX_DELTA_E
+    # Produktfotos har sjældent helt hvid baggrund: fotobaggrunden er medianen af de kantpixels, der ikke er padding
+    border = np.concatenate([lab[0], lab[-1], lab[:, 0], lab[:, -1]])
+    photo_border = border[np.linalg.norm(border - padding, axis=-1) > 2]
+    if len(photo_border) > 0.05 * len(border):
+        near_bg |= np.linalg.norm(lab - np.median(photo_border, axis=0), axis=-1) < BACKGROUND_MAX_DELTA_E
+
+    # Ligner pixlen naboen under/til højre? (bruges begge veje)
+    similar_down = np.linalg.norm(lab[1:] - lab[:-1], axis=-1) < BACKGROUND_STEP_DELTA_E
+    similar_right = np.linalg.norm(lab[:, 1:] - lab[:, :-1], axis=-1) < BACKGROUND_STEP_DELTA_E
+
+    background = np.zeros(lab.shape[:2], dtype=bool)
+    background[[0, -1], :] = near_bg[[0, -1], :]
+    background[:, [0, -1]] = near_bg[:, [0, -1]]
+    # Flood fill fra kanten: ét skridt i alle 4 retninger ad gangen, kun mellem pixels der ligner hinanden
+    while True:
+        grown = background.copy()
+        grown[1:] |= background[:-1] & similar_down
+        grown[:-1] |= background[1:] & similar_down
+        grown[:, 1:] |= background[:, :-1] & similar_right
+        grown[:, :-1] |= background[:, 1:] & similar_right
+        if (grown == background).all():
+            return ~background
+        background = grown
+
+def kmeans(pixels, k=COLOR_CLUSTERS, iterations=COLOR_ITERATIONS):
+    """Simpel k-means (k-means++ start med fast seed, så samme billede altid giver samme forslag).
+    Returnerer (centre, andel pr. center) sorteret efter andel."""
+    rng = np.random.default_rng(0)
+    k = min(k, len(pixels))
+    centers = [pixels[rng.integers(len(pixels))]]
+    for _ in range(1, k):
+        distances = np.min(np.linalg.norm(pixels[:, None] - np.array(centers)[None], axis=-1), axis=1) ** 2
+        if distances.sum() == 0:
+            break
+        centers.append(pixels[rng.choice(len(pixels), p=distances / distances.sum())])
+    centers = np.array(centers)
+    for _ in range(iterations):
+        labels = np.argmin(np.linalg.norm(pixels[:, None] - centers[None], axis=-1), axis=1)
+        new_centers = np.array([pixels[labels == i].mean(axis=0) if (labels == i).any() else centers[i] for i in range(len(centers))])
+        if np.allclose(new_centers, centers):
+            break
+        centers = new_centers
+    labels = np.argmin(np.linalg.norm(pixels[:, None] - centers[None], axis=-1), axis=1)
+    shares = np.bincount(labels, minlength=len(centers)) / len(pixels)
+    order = np.argsort(-shares)
+    return centers[order], shares[order]
+
+def nearest_color(lab_color):
+    """Nærmeste farve fra COLOR_REFERENCES. Returnerer (navn, ΔE)."""
+    distances = np.linalg.norm(_REFERENCE_LAB - lab_color, axis=1)
+    best = int(np.argmin(distances))
+    return _REFERENCE_NAMES[best], float(distances[best])
+
+def get_shade(lightness):
+    if lightness >= SHADE_LIGHT_MIN_L:
+        return "Lys"
+    if lightness <= SHADE_DARK_MAX_L:
+        return "Mørk"
+    return "Mellem"
+
+def extract_colors(image):
+    """Foreslår primary_color, secondary_color og shade ud fra et standardiseret (paddet) billede.
+    Returnerer {"primary_color", "secondary_color", "shade", "palette": [{"color", "share", "delta_e", "lightness"}]}."""
+    small = image.convert("RGB").resize((COLOR_ANALYSIS_SIZE, COLOR_ANALYSIS_SIZE), Image.Resampling.BILINEAR)
+    lab = rgb_to_lab(np.asarray(small))
+    mask = foreground_mask(lab)
+    # Næsten intet tilbage (fx hvidt tøj helt ud til kanten): brug hele billedet
+    pixels = lab[mask] if mask.mean() > 0.02 else lab.reshape(-1, 3)
+
+    centers, shares = kmeans(pixels)
+    # Klynger med samme farvenavn lægges sammen (fx lys og mørk side af den samme brune jakke)
+    palette = {}
+    for center, share in zip(centers, shares):
+        name, delta_e = nearest_color(center)
+        entry = palette.setdefault(name, {"color": name, "share": 0.0, "delta_e": 0.0, "lightness": 0.0})
+        # Vægtet gennemsnit af ΔE og L* over de sammenlagte klynger
+        total = entry["share"] + share
+        entry["delta_e"] = (entry["delta_e"] * entry["share"] + delta_e * share) / total
+        entry["lightness"] = (entry["lightness"] * entry["share"] + center[0] * share) / total
+        entry["share"] = total
+    palette = sorted(palette.values(), key=lambda e: -e["share"])
+    for entry in palette:
+        entry["share"] = round(float(entry["share"]), 2)
+        entry["delta_e"] = round(float(entry["delta_e"]), 1)
+        entry["lightness"] = round(float(entry["lightness"]), 1)
+
+    primary = palette[0]
+    secondary = palette[1] if len(palette) > 1 and palette[1]["share"] >= SECONDARY_MIN_SHARE else None
+    return {
+        "primary_color": primary["color"],
+        "secondary_color": secondary["color"] if secondary else "Ingen",
+        "shade": get_shade(primary["lightness"]),
+        "palette": palette
+    }
+
+def compare_colors(analysis, suggestion):
+    """Felter hvor AI'ens analyse og farve-analysen er uenige: {felt: (AI, lokal)}.
+    Sekundærfarven tæller kun, hvis AI'ens bud slet ikke er blandt de fundne farver."""
+    mismatches = {}
+    for field in ("primary_color", "shade"):
+        if analysis.get(field) != suggestion[field]:
+            mismatches[field] = (analysis.get(field), suggestion[field])
+    secondary = analysis.get("secondary_color")
+    found = {entry["color"] for entry in suggestion["palette"]}
+    if secondary != suggestion["secondary_color"] and secondary not in found | {"Ingen"}:
+        mismatches["secondary_color"] = (secondary, suggestion["secondary_color"])
+    return mismatches
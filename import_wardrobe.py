@@ -0,0 +1,218 @@
+# Engangs-import af det gamle wardrobe.json (heltals-id'er, Windows-stier som img\img_...jpg) til Firestore og GitHub.
+# Billederne standardiseres parallelt i en procespulje, uploades som få store commits, og dokumenterne skrives med
+# Firestores BulkWriter. Fremskridtet gemmes i et checkpoint, så en afbrudt import fortsætter, hvor den slap.
+#
+#   python import_wardrobe.py --dry-run
+#   python import_wardrobe.py
+#   python import_wardrobe.py --local-repo /tmp/billeder.git   (test uden GitHub)
+import argparse
+import json
+import os
+import tomllib
+from concurrent.futures import ProcessPoolExecutor
+import firebase_admin
+from firebase_admin import credentials, firestore
+from github import Github
+from PIL import Image
+from github_upload import commit_files
+from image_tools import THUMBNAIL_SIZES, standardize_image, build_hash_index, add_to_hash_index, find_similar
+
+# --- KONFIGURATION ---
+KEY_FILE = "firestore_key.json"
+SECRETS_FILE = os.path.join(".streamlit", "secrets.toml")
+SNAPSHOT_FILE = "wardrobe.json"
+IMAGE_DIR = "img"
+CHECKPOINT_FILE = ".import_checkpoint.json"
+# Dokument-id'er i Firestore: faste, så en gentaget import overskriver i stedet for at lave dubletter.
+# Ingen "_": outfit-, kamp- og override-ID'er i app.py samles med "_" og splittes igen på "_"
+LEGACY_ID_PREFIX = "legacy-"
+# Stykker tøj pr. commit (hvert stykke er 4 filer: billede, AI-variant og 2 thumbnails)
+COMMIT_SIZE = 25
+MAX_WRITE_ATTEMPTS = 5
+DUPLICATE_MAX_DISTANCE = 4
+
+# --- CHECKPOINT ---
+
+def load_checkpoint(path):
+    """{"uploaded": {legacy_id: item_entry}, "written": [legacy_id, ...], "skipped": {legacy_id: årsag}}"""
+    checkpoint = {"uploaded": {}, "written": [], "skipped": {}}
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            checkpoint.update(json.load(f))
+    return checkpoint
+
+def save_checkpoint(path, checkpoint):
+    # Skriv til en midlertidig fil først, så et afbrudt script aldrig efterlader et halvt checkpoint
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(checkpoint, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, path)
+
+# --- BILLEDER ---
+
+def normalize_image_path(image_path, image_dir):
+    """img\\img_...jpg (Windows) eller img/img_...jpg -> lokal sti i image_dir."""
+    return os.path.join(image_dir, os.path.basename(image_path.replace("\\", "/")))
+
+def standardize_file(path):
+    """Kører i procespuljen: læser og standardiserer ét billede (resultatet er bytes og kan sendes tilbage)."""
+    with Image.open(path) as image:
+        return standardize_image(image)
+
+def build_garment(item, variants, repo_name):
+    """Samme filer og samme dokument som admin.py's prepare_garment. Returnerer (filer, item_entry).
+    Filnavnet bygges af det gamle id, så de originale billeder i img/ aldrig overskrives, og en gentaget import
+    af samme stykke tøj rammer de samme filer."""
+    def get_raw_url(path_in_repo):
+        return f"https://raw.githubusercontent.com/{repo_name}/main/{path_in_repo}"
+
+    filename = f"img_{LEGACY_ID_PREFIX}{item['id']}.webp"
+    path_in_repo = f"img/{filename}"
+    ai_path_in_repo = f"img/ai/{filename}"
+    files = {path_in_repo: variants["main"], ai_path_in_repo: variants["ai"]}
+
+    thumbnail_urls = {}
+    for size, folder in THUMBNAIL_SIZES.items():
+        thumb_path_in_repo = f"img/{folder}/{filename}"
+        files[thumb_path_in_repo] = variants["thumbnails"][size]
+        thumbnail_urls[str(size)] = get_raw_url(thumb_path_in_repo)
+
+    item_entry = {
+        "filename": filename,
+        "image_path": get_raw_url(path_in_repo),
+        "ai_image_path": get_raw_url(ai_path_in_repo),
+        "image_variants": thumbnail_urls,
+        "dhash": variants["dhash"],
+        "analysis": item["analysis"],
+        "legacy_id": item["id"]
+    }
+    return files, item_entry
+
+# --- FIRESTORE ---
+
+def load_existing_hashes(db):
+    """BK-træ over dHash for tøj, der allerede er i Firestore (uden tidligere importerede dokumenter)."""
+    entries = []
+    for doc in db.collection("wardrobe").select(["dhash", "analysis.display_name"]).stream():
+        if doc.id.startswith(LEGACY_ID_PREFIX):
+            continue
+        item = doc.to_dict()
+        entries.append((item.get("dhash"), item.get("analysis", {}).get("display_name", doc.id)))
+    return build_hash_index(entries)
+
+def write_documents(db, entries):
+    """Skriver {legacy_id: item_entry} med BulkWriter. Returnerer de legacy_id'er, der blev skrevet."""
+    written = []
+    ids_by_path = {}
+    bulk_writer = db.bulk_writer()
+    # Callbacks kommer fra BulkWriters egne tråde; list.append er trådsikker
+    bulk_writer.on_write_result(lambda reference, result, writer: written.append(ids_by_path[reference.path]))
+    bulk_writer.on_write_error(lambda failure, writer: failure.attempts < MAX_WRITE_ATTEMPTS)
+    for legacy_id, item_entry in entries.items():
+        ref = db.collection("wardrobe").document(f"{LEGACY_ID_PREFIX}{legacy_id}")
+        ids_by_path[ref.path] = legacy_id
+        bulk_writer.set(ref, dict(item_entry, created_at=firestore.SERVER_TIMESTAMP, updated_at=firestore.SERVER_TIMESTAMP))
+    bulk_writer.close()
+
+    if written:
+        # Tæl garderobens generation op, så app.py henter det importerede tøj
+        db.collection("stats").document("sync_versions").set({"wardrobe": firestore.Increment(1)}, merge=True)
+    return written
+
+# --- IMPORT ---
+
+def get_upload_target(local_repo):
+    if local_repo:
+        return {"kind": "local", "path": local_repo}, "local"
+    with open(SECRETS_FILE, "rb") as f:
+        secrets = tomllib.load(f)
+    return {"kind": "github", "repo": Github(secrets["github_token"]).get_repo(secrets["github_repo"])}, secrets["github_repo"]
+
+def main():
+    parser = argparse.ArgumentParser(description="Importer det gamle wardrobe.json og billederne i img/ til Firestore og GitHub.")
+    parser.add_argument("--snapshot", default=SNAPSHOT_FILE)
+    parser.add_argument("--image-dir", default=IMAGE_DIR)
+    parser.add_argument("--checkpoint", default=CHECKPOINT_FILE)
+    parser.add_argument("--workers", type=int, default=os.cpu_count())
+    parser.add_argument("--local-repo", help="upload til et lokalt bare-repo i stedet for GitHub (test)")
+    parser.add_argument("--include-duplicates", action="store_true", help="importer også billeder, der ligner noget i Firestore")
+    parser.add_argument("--dry-run", action="store_true", help="vis kun hvad der ville blive importeret")
+    args = parser.parse_args()
+
+    with open(args.snapshot, "r", encoding="utf-8") as f:
+        items = [item for item in json.load(f) if item.get("analysis")]
+    checkpoint = load_checkpoint(args.checkpoint)
+    done = set(checkpoint["uploaded"]) | set(checkpoint["written"])
+    if not args.include_duplicates:
+        done |= set(checkpoint["skipped"])
+
+    # JSON-nøgler er tekst, så id'erne sammenlignes som tekst
+    pending = []
+    missing = []
+    for item in items:
+        if str(item["id"]) in done:
+            continue
+        path = normalize_image_path(item["image_path"], args.image_dir)
+        if os.path.exists(path):
+            pending.append((item, path))
+        else:
+            missing.append(path)
+
+    print(f"{len(items)} stykker tøj i {args.snapshot}: {len(checkpoint['written'])} importeret, "
+          f"{len(checkpoint['uploaded']) - len(checkpoint['written'])} uploadet men ikke skrevet, "
+          f"{len(checkpoint['skipped'])} sprunget over som dubletter, {len(pending)} venter, {len(missing)} uden billede")
+    for path in missing:
+        print(f"  - mangler billede: {path}")
+    if args.dry_run:
+        return
+
+    if not firebase_admin._apps:
+        firebase_admin.initialize_app(credentials.Certificate(KEY_FILE))
+    db = firestore.client()
+
+    if pending:
+        target, repo_name = get_upload_target(args.local_repo)
+        hash_index = None if args.include_duplicates else load_existing_hashes(db)
+
+        with ProcessPoolExecutor(max_workers=args.workers) as pool:
+            for start in range(0, len(pending), COMMIT_SIZE):
+                chunk = pending[start:start + COMMIT_SIZE]
+                files = {}
+                uploaded = {}
+                skipped = {}
+                for (item, path), variants in zip(chunk, pool.map(standardize_file, [path for _, path in chunk])):
+                    name = item["analysis"].get("display_name", path)
+                    if hash_index is not None:
+                        duplicates = find_similar(hash_index, variants["dhash"], DUPLICATE_MAX_DISTANCE)
+                        if duplicates:
+                            distance, match = min(duplicates, key=lambda m: m[0])
+                            skipped[str(item["id"])] = f"ligner {match} ({distance} bit fra)"
+                            print(f"Springer over {path}: {skipped[str(item['id'])]}")
+                            continue
+                        # Også dubletter inden for samme snapshot fanges
+                        add_to_hash_index(hash_index, variants["dhash"], name)
+                    garment_files, item_entry = build_garment(item, variants, repo_name)
+                    files.update(garment_files)
+                    uploaded[str(item["id"])] = item_entry
+
+                if uploaded:
+                    commit_files(target, files, f"Importeret {len(uploaded)} stykker tøj fra {os.path.basename(args.snapshot)}")
+                    checkpoint["uploaded"].update(uploaded)
+                    for legacy_id in uploaded:
+                        checkpoint["skipped"].pop(legacy_id, None)
+                if uploaded or skipped:
+                    # Dubletterne gemmes også, så en genoptaget import ikke standardiserer dem igen
+                    checkpoint["skipped"].update(skipped)
+                    save_checkpoint(args.checkpoint, checkpoint)
+                print(f"Uploadet {min(start + COMMIT_SIZE, len(pending))}/{len(pending)}")
+
+    to_write = {legacy_id: entry for legacy_id, entry in checkpoint["uploaded"].items() if legacy_id not in checkpoint["written"]}
+    if to_write:
+        written = write_documents(db, to_write)
+        checkpoint["written"].extend(written)
+        save_checkpoint(args.checkpoint, checkpoint)
+        print(f"Skrev {len(written)}/{len(to_write)} dokumenter til Firestore")
+    print("Færdig.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# Rangering fra kommandolinjen med engine.py - uden Streamlit og Firebase.
+# Læser et lokalt snapshot: wardrobe.json, en backup fra admin.py eller app.py's SQLite-kopi (.replica.sqlite3,
+# som også har godkendte/afviste outfits, AI-overrides og kamphistorik), og rangerer kandidaterne til et outfit.
+#
+#   python rank.py --outfit 1 3 --temp 12
+#   python rank.py --snapshot .replica.sqlite3 --outfit 1 --category Sko --top 5 --json
+#   python rank.py --suggest 5 --temp 8
+import argparse
+import json
+import sqlite3
+import sys
+import time
+from contextlib import closing
+from engine import (
+    CATEGORIES, build_outfit_feedback, build_ai_overrides, build_match_index,
+    build_compatibility_index, build_compatibility_bitsets, rank_category, suggest_complete_outfits
+)
+
+# --- KONFIGURATION ---
+SNAPSHOT_FILE = "wardrobe.json"
+DEFAULT_TOP = 10
+# Samlingerne fra app.py's SQLite-kopi, som rangeringen bruger
+SNAPSHOT_COLLECTIONS = ["wardrobe", "approved_outfits", "rejected_outfits", "ai_score_overrides", "ai_match_cache"]
+
+# --- SNAPSHOT ---
+
+def _decode_replica_value(obj):
+    """Tidsstempler i SQLite-kopien er gemt som {"__datetime__": ...}; rangeringen bruger dem ikke, så de forbliver tekst."""
+    if len(obj) == 1 and "__datetime__" in obj:
+        return obj["__datetime__"]
+    return obj
+
+def load_replica_snapshot(path):
+    """{samling: {doc_id: data}} fra app.py's SQLite-kopi."""
+    collections = {name: {} for name in SNAPSHOT_COLLECTIONS}
+    with closing(sqlite3.connect(f"file:{path}?mode=ro", uri=True)) as conn:
+        for collection, doc_id, data in conn.execute("SELECT collection, doc_id, data FROM docs"):
+            if collection in collections:
+                collections[collection][doc_id] = json.loads(data, object_hook=_decode_replica_value)
+    return collections
+
+def load_json_snapshot(path):
+    """wardrobe.json (heltals-id'er) eller en backup fra admin.py (firestore_id). Kun garderoben, ingen historik."""
+    with open(path, "r", encoding="utf-8") as f:
+        items = json.load(f)
+    collections = {name: {} for name in SNAPSHOT_COLLECTIONS}
+    for number, item in enumerate(items):
+        item = dict(item)
+        doc_id = str(item.pop("firestore_id", None) or item.pop("id", number))
+        item.pop("id", None)
+        collections["wardrobe"][doc_id] = item
+    return collections
+
+def load_snapshot(path):
+    if path.endswith((".sqlite3", ".sqlite", ".db")):
+        return load_replica_snapshot(path)
+    return load_json_snapshot(path)
+
+def build_engine_state(collections):
+    """Garderoben som liste med 'id' (kun analyserede stykker tøj) + indekset og historikken, som app.py bygger dem."""
+    wardrobe = []
+    for doc_id, data in collections["wardrobe"].items():
+        if data.get("analysis", {}).get("category") in CATEGORIES:
+            wardrobe.append(dict(data, id=doc_id))
+    approved, rejected, approved_index = build_outfit_feedback(collections["approved_outfits"], collections["rejected_outfits"])
+    matches = {doc_id: data.get("raw_feedback") for doc_id, data in collections["ai_match_cache"].items()}
+    return {
+        "wardrobe": wardrobe,
+        "by_id": {item["id"]: item for item in wardrobe},
+        "index": build_compatibility_bitsets(build_compatibility_index(wardrobe)),
+        "approved": approved,
+        "rejected": rejected,
+        "approved_index": approved_index,
+        "ai_overrides": build_ai_overrides(collections["ai_score_overrides"].values()),
+        "match_index": build_match_index(matches),
+    }
+
+# --- RANGERING ---
+
+def rank_outfit(state, outfit, categories, weather_data, top):
+    """{kategori: de top bedste rækker fra rank_category} for de kategorier, outfittet mangler."""
+    results = {}
+    for category in categories:
+        items = [item for item in state["wardrobe"] if item["analysis"]["category"] == category]
+        ranked = rank_category(
+            state["index"], items, outfit, category, weather_data,
+            state["approved_index"], state["rejected"], state["ai_overrides"], state["match_index"]
+        )
+        results[category] = ranked[:top]
+    return results
+
+def row_to_dict(category, position, row):
+    (smart_score, item, color_score, weather_penalty, is_synonym, is_part_of_success, is_rejected_exact,
+     is_dead_end, projected_style_score, is_strict_incompatible, is_champion, is_loser) = row
+    return {
+        "category": category,
+        "rank": position,
+        "id": item["id"],
+        "name": item["analysis"].get("display_name", ""),
+        "smart_score": round(float(smart_score), 2),
+        "style_score": projected_style_score,
+        "color_score": color_score,
+        "weather_penalty": round(float(weather_penalty), 2),
+        "flags": [flag for flag, on in (
+            ("synonym", is_synonym), ("approved", is_part_of_success), ("rejected", is_rejected_exact),
+            ("dead_end", is_dead_end), ("incompatible", is_strict_incompatible), ("champion", is_champion), ("loser", is_loser)
+        ) if on]
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Ranger kandidater til et outfit ud fra et lokalt snapshot (uden Streamlit og Firebase).")
+    parser.add_argument("--snapshot", default=SNAPSHOT_FILE, help="wardrobe.json, en backup fra admin.py eller .replica.sqlite3")
+    parser.add_argument("--outfit", nargs="*", default=[], help="ID'er på det valgte tøj")
+    parser.add_argument("--temp", type=float, help="gennemsnitlig følt temperatur de næste 10 timer (°C)")
+    parser.add_argument("--category", choices=CATEGORIES, action="append", help="kun disse kategorier (standard: alle manglende)")
+    parser.add_argument("--top", type=int, default=DEFAULT_TOP)
+    parser.add_argument("--suggest", type=int, metavar="K", help="find i stedet de K bedste komplette outfits")
+    parser.add_argument("--json", action="store_true", help="én JSON-linje pr. resultat")
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    state = build_engine_state(load_snapshot(args.snapshot))
+    loaded = time.perf_counter()
+
+    outfit = []
+    for item_id in args.outfit:
+        if item_id not in state["by_id"]:
+            parser.error(f"ukendt ID i --outfit: {item_id}")
+        outfit.append(state["by_id"][item_id])
+    filled = [item["analysis"]["category"] for item in outfit]
+    if len(set(filled)) < len(filled):
+        parser.error("--outfit må højst have ét stykke tøj pr. kategori")
+    weather_data = {"avg_feels_like_10h": args.temp} if args.temp is not None else {}
+
+    if args.suggest:
+        suggestions = suggest_complete_outfits(
+            state["index"], state["wardrobe"], weather_data, state["approved_index"]["sets"], state["rejected"], state["ai_overrides"], k=args.suggest
+        )
+        ranked = time.perf_counter()
+        for n, suggestion in enumerate(suggestions, 1):
+            entry = {
+                "rank": n, "score": round(float(suggestion["score"]), 2), "style_score": suggestion["style_score"],
+                "ids": [item["id"] for item in suggestion["items"]],
+                "names": [item["analysis"].get("display_name", "") for item in suggestion["items"]]
+            }
+            if args.json:
+                print(json.dumps(entry, ensure_ascii=False))
+            else:
+                print(f"#{n}  {entry['score']:6.1f}  " + " + ".join(entry["names"]))
+    else:
+        categories = [c for c in (args.category or CATEGORIES) if c not in filled]
+        results = rank_outfit(state, outfit, categories, weather_data, args.top)
+        ranked = time.perf_counter()
+        for category, rows in results.items():
+            if not args.json:
+                print(f"\n{category}:")
+            for position, row in enumerate(rows, 1):
+                entry = row_to_dict(category, position, row)
+                if args.json:
+                    print(json.dumps(entry, ensure_ascii=False))
+                else:
+                    flags = f"  [{', '.join(entry['flags'])}]" if entry["flags"] else ""
+                    print(f"{position:3d}. {entry['smart_score']:7.1f}  {entry['id']:<24} {entry['name']}{flags}")
+
+    # Tiderne på stderr, så stdout kan sendes videre til andre værktøjer
+    print(f"{len(state['wardrobe'])} stykker tøj · indlæsning og indeks {(loaded - start) * 1000:.1f} ms · "
+          f"rangering {(ranked - loaded) * 1000:.1f} ms", file=sys.stderr)
+
+if __name__ == "__main__":
+    main()
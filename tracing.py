@@ -0,0 +1,157 @@
+# Let tidsmåling pr. rerun: spans omkring Firestore, Gemini, HTTP og rangeringen + tælling af Firestore-læsninger/skrivninger.
+# Ingen afhængighed af Streamlit. Den aktive trace ligger i en ContextVar, så spans i asyncio-opgaver og i tråde startet
+# med contextvars.copy_context() havner i samme trace. Uden aktiv trace gør span() og count_*() ingenting.
+# Hver afsluttet trace skrives som én linje i TRACE_FILE (JSONL) til analyse bagefter.
+import contextvars
+import json
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+# --- KONFIGURATION ---
+# None slår trace-filen fra (tidsmålingen i debug-panelet virker stadig)
+TRACE_FILE = ".traces.jsonl"
+# Når filen bliver større end dette, omdøbes den til .1 (én gammel fil gemmes)
+TRACE_FILE_MAX_BYTES = 20 * 1024 * 1024
+# Seneste afsluttede traces (også baggrundstråde) til debug-panelet
+RECENT_TRACES = 20
+
+_current_trace = contextvars.ContextVar("current_trace", default=None)
+_current_span = contextvars.ContextVar("current_span", default=None)
+_file_lock = threading.Lock()
+_recent = deque(maxlen=RECENT_TRACES)
+
+# --- TRACES ---
+
+def start_trace(name):
+    """Starter en ny trace og gør den aktiv i den nuværende kontekst. Returnerer trace-dict'et."""
+    trace = {
+        "name": name,
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "start": time.perf_counter(),
+        # Tidspunkt for seneste span eller tælling - slutpunktet for en trace, der blev afbrudt
+        "last": None,
+        "total_ms": None,
+        "spans": [],
+        "reads": {},
+        "writes": {},
+        "finished": False,
+        "interrupted": False,
+    }
+    _current_trace.set(trace)
+    return trace
+
+def finish_trace(trace, path=TRACE_FILE, interrupted=False):
+    """Afslutter tracen og skriver den til trace-filen. Tåler None og en allerede afsluttet trace.
+    interrupted=True bruges, når tracen afsluttes først ved næste rerun (efter st.stop(), st.rerun() eller en fejl):
+    så slutter den ved seneste span eller tælling, så ventetiden mellem de to reruns ikke tælles med."""
+    if trace is None or trace["finished"]:
+        return
+    trace["finished"] = True
+    trace["interrupted"] = interrupted
+    end = (trace["last"] or trace["start"]) if interrupted else time.perf_counter()
+    trace["total_ms"] = round((end - trace["start"]) * 1000, 3)
+    _recent.append(trace)
+    if path:
+        append_trace(trace, path)
+
+def append_trace(trace, path=TRACE_FILE):
+    """Én JSON-linje pr. trace. Fejl må aldrig vælte appen, så de skrives kun i loggen."""
+    line = json.dumps({key: value for key, value in trace.items() if key not in ("start", "last", "finished")}, ensure_ascii=False, default=str)
+    try:
+        with _file_lock:
+            if os.path.exists(path) and os.path.getsize(path) > TRACE_FILE_MAX_BYTES:
+                os.replace(path, path + ".1")
+            with open(path, "a", encoding="utf-8") as f:
+                f.write(line + "\n")
+    except Exception as e:
+        print(f"Kunne ikke skrive trace: {e}")
+
+def get_current_trace():
+    return _current_trace.get()
+
+def recent_traces():
+    """De seneste afsluttede traces, nyeste først."""
+    return list(reversed(_recent))
+
+@contextmanager
+def trace_run(name):
+    """Til baggrundstråde og knap-callbacks: egen trace, medmindre der allerede er en aktiv (så tælles der med i den).
+    Kan også bruges som decorator på almindelige funktioner."""
+    if _current_trace.get() is not None:
+        yield _current_trace.get()
+        return
+    trace = start_trace(name)
+    try:
+        yield trace
+    finally:
+        finish_trace(trace)
+        _current_trace.set(None)
+
+# --- SPANS & TÆLLERE ---
+
+@contextmanager
+def span(name):
+    """Måler tiden for en blok. Kan også bruges som decorator på almindelige (ikke async) funktioner."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+    parent = _current_span.get()
+    token = _current_span.set(name)
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        # list.append er trådsikker, så spans fra tråd-puljer kan skrives direkte
+        trace["last"] = time.perf_counter()
+        trace["spans"].append({"name": name, "parent": parent, "ms": round((trace["last"] - start) * 1000, 3)})
+        _current_span.reset(token)
+
+def _count(key, collection, n, trace):
+    trace = trace or _current_trace.get()
+    if trace is not None and n:
+        counts = trace[key]
+        counts[collection] = counts.get(collection, 0) + n
+        trace["last"] = time.perf_counter()
+
+def count_reads(collection, n=1, trace=None):
+    """Tæller Firestore-dokumentlæsninger i samlingen (en tom forespørgsel koster også 1 læsning)."""
+    _count("reads", collection, n, trace)
+
+def count_writes(collection, n=1, trace=None):
+    """Tæller Firestore-skrivninger (og sletninger) i samlingen."""
+    _count("writes", collection, n, trace)
+
+# --- VISNING ---
+
+def summarize_spans(trace):
+    """[(navn, antal kald, samlet ms, største ms)] sorteret efter samlet tid."""
+    totals = {}
+    for entry in trace["spans"]:
+        calls, total, largest = totals.get(entry["name"], (0, 0.0, 0.0))
+        totals[entry["name"]] = (calls + 1, total + entry["ms"], max(largest, entry["ms"]))
+    return sorted(((name,) + values for name, values in totals.items()), key=lambda row: -row[2])
+
+def format_trace(trace):
+    """Markdown til debug-panelet: samlet tid, Firestore-tællere og en tabel over spans."""
+    reads = sum(trace["reads"].values())
+    writes = sum(trace["writes"].values())
+    total = f"{trace['total_ms']:.0f} ms" if trace["total_ms"] is not None else "i gang"
+    if trace["interrupted"]:
+        total += " (afbrudt - til seneste span)"
+    lines = [f"**{trace['name']}**: {total} · Firestore: {reads} læsninger, {writes} skrivninger"]
+    if reads or writes:
+        per_collection = sorted(set(trace["reads"]) | set(trace["writes"]))
+        lines.append(" · ".join(f"`{c}` {trace['reads'].get(c, 0)}/{trace['writes'].get(c, 0)}" for c in per_collection))
+    rows = summarize_spans(trace)
+    if rows:
+        lines.append("")
+        lines.append("| Trin | Kald | ms i alt | største ms |")
+        lines.append("|---|---:|---:|---:|")
+        for name, calls, total_ms, largest_ms in rows:
+            lines.append(f"| {name} | {calls} | {total_ms:.1f} | {largest_ms:.1f} |")
+    return "\n".join(lines)